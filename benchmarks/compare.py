@@ -0,0 +1,44 @@
+import argparse, json, sys
+
+# Comparaison de deux résultats de benchmarks (JSON produits par benchmarks/run.py).
+# Une mesure est une régression quand sa médiane dépasse celle de la référence de plus de threshold (0.2 = +20 %).
+# Les mesures très courtes (médiane de référence sous MIN_MS) sont trop bruitées pour être signalées.
+# Usage autonome: `python -m benchmarks.compare baseline.json resultats.json [--threshold 0.2]`
+# (code de sortie 1 en cas de régression, pour la CI).
+
+MIN_MS = 0.05
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2) -> list:
+    """Retourne une ligne par mesure commune: (nom, médiane de référence, médiane actuelle, ratio, régression?)."""
+    rows = []
+    for name, result in sorted(current["results"].items()):
+        reference = baseline["results"].get(name)
+        if reference is None or not reference.get("median_ms") or result.get("median_ms") is None:
+            continue
+        ratio = result["median_ms"] / reference["median_ms"]
+        regression = ratio > 1 + threshold and reference["median_ms"] >= MIN_MS
+        rows.append((name, reference["median_ms"], result["median_ms"], ratio, regression))
+    return rows
+
+def report(rows: list, out=sys.stdout) -> int:
+    """Affiche le tableau de comparaison et renvoie le nombre de régressions."""
+    width = max([len(row[0]) for row in rows] + [10])
+    out.write(f"{'mesure':<{width}}  {'référence':>12}  {'actuel':>12}  {'ratio':>7}\n")
+    for name, before, after, ratio, regression in rows:
+        flag = "  RÉGRESSION" if regression else ""
+        out.write(f"{name:<{width}}  {before:>10.3f}ms  {after:>10.3f}ms  {ratio:>6.2f}x{flag}\n")
+    regressions = sum(1 for row in rows if row[4])
+    out.write(f"{len(rows)} mesures comparées, {regressions} régression(s)\n")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare deux résultats de benchmarks.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="marge tolérée (0.2 = +20 %%)")
+    args = parser.parse_args()
+    sys.exit(1 if report(compare(load(args.baseline), load(args.current), args.threshold)) else 0)
@@ -0,0 +1,85 @@
+import argparse, io, os
+import numpy as np
+from PIL import Image
+import fitz  # PyMuPDF
+
+# Corpus synthétique pour les benchmarks: PDF (par nombre de pages), PNG (par résolution), TXT (par taille).
+# Contenu déterministe (graine fixe): deux exécutions mesurent exactement les mêmes fichiers.
+# Usage autonome: `python -m benchmarks.corpus DOSSIER` écrit le corpus par défaut dans DOSSIER.
+
+PDF_PAGES = [1, 10, 100]
+PNG_SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+TXT_SIZES = [1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024]
+
+QUICK_PDF_PAGES = [1, 10]
+QUICK_PNG_SIZES = [(640, 480), (1920, 1080)]
+QUICK_TXT_SIZES = [1024 * 1024, 10 * 1024 * 1024]
+
+_LINE = "Ligne {n:08d}: rapport trimestriel, chiffres provisoires, diffusion restreinte.\n"
+
+def make_pdf(pages: int) -> bytes:
+    """PDF de pages A4 remplies de texte."""
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        text = "".join(_LINE.format(n=page_number * 60 + i) for i in range(60))
+        page.insert_textbox(fitz.Rect(40, 40, 555, 800), text, fontsize=8)
+    data = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return data
+
+def make_png(width: int, height: int) -> bytes:
+    """PNG RGB: dégradé + bruit (compressible comme une photo, pas comme un aplat)."""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 200, width, dtype=np.float32)[None, :, None]
+    noise = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+    pixels = (gradient + noise).astype(np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(output, format="PNG")
+    return output.getvalue()
+
+def write_txt(path: str, size: int) -> None:
+    """Fichier texte (export CSV/log) d'environ size octets, écrit par morceaux."""
+    with open(path, "w", encoding="utf-8") as f:
+        written, n = 0, 0
+        while written < size:
+            block = "".join(_LINE.format(n=n + i) for i in range(1000))
+            f.write(block)
+            written += len(block)
+            n += 1000
+
+def build(directory: str, quick: bool = False) -> dict:
+    """Écrit le corpus dans directory (fichiers déjà présents réutilisés). Retourne {type: [(libellé, chemin), ...]}."""
+    os.makedirs(directory, exist_ok=True)
+    corpus = {"PDF": [], "PNG": [], "TXT": []}
+
+    def _ensure(name: str, producer) -> str:
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            producer(path)
+        return path
+
+    def _write(data_fn):
+        def producer(path):
+            with open(path, "wb") as f:
+                f.write(data_fn())
+        return producer
+
+    for pages in (QUICK_PDF_PAGES if quick else PDF_PAGES):
+        corpus["PDF"].append((f"{pages}p", _ensure(f"doc_{pages}p.pdf", _write(lambda: make_pdf(pages)))))
+    for width, height in (QUICK_PNG_SIZES if quick else PNG_SIZES):
+        corpus["PNG"].append((f"{width}x{height}",
+                              _ensure(f"img_{width}x{height}.png", _write(lambda: make_png(width, height)))))
+    for size in (QUICK_TXT_SIZES if quick else TXT_SIZES):
+        label = f"{size // (1024 * 1024)}MB"
+        corpus["TXT"].append((label, _ensure(f"log_{label}.txt", lambda path: write_txt(path, size))))
+    return corpus
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génère le corpus synthétique des benchmarks.")
+    parser.add_argument("directory")
+    parser.add_argument("--quick", action="store_true", help="corpus réduit")
+    args = parser.parse_args()
+    for file_type, items in build(args.directory, args.quick).items():
+        for label, path in items:
+            print(f"{file_type:4} {label:>10}  {path}  ({os.path.getsize(path)} octets)")
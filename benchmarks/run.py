@@ -0,0 +1,250 @@
+import argparse, asyncio, json, os, platform, statistics, subprocess, sys, tempfile, time
+
+# Benchmarks des chemins critiques du fingerprinting.
+# Usage: `python -m benchmarks.run [--quick] [--output resultats.json] [--baseline reference.json]`
+# - corpus synthétique (benchmarks/corpus.py), généré une fois dans --corpus et réutilisé;
+# - mesures: injection et extraction par format et par taille, jetons (crypto), et flux complets
+#   distribute_file -> matérialisation des copies -> scan_file pour plusieurs nombres de destinataires;
+# - base de données: --db stub (défaut) utilise une base SQLite temporaire (allers-retours réels mais locaux),
+#   --db postgres utilise DATABASE_URL (à pointer vers un Postgres local dédié: des distributions y sont créées);
+# - résultats en JSON (médiane, minimum, moyenne par mesure, en ms); avec --baseline, comparaison
+#   (benchmarks/compare.py) et code de sortie 1 en cas de régression.
+# Les variables d'environnement (DATABASE_URL, OUTPUT_DIR...) doivent être fixées avant d'importer l'application:
+# les modules du service sont donc importés dans main(), après la lecture des arguments.
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins critiques du fingerprinting.")
+    parser.add_argument("--output", default="bench_results.json", help="fichier JSON des résultats")
+    parser.add_argument("--baseline", help="résultats de référence à comparer")
+    parser.add_argument("--threshold", type=float, default=0.2, help="marge tolérée avant régression (0.2 = +20 %%)")
+    parser.add_argument("--quick", action="store_true", help="corpus et répétitions réduits")
+    parser.add_argument("--repeat", type=int, default=None, help="répétitions par mesure (défaut: 5, 3 en --quick)")
+    parser.add_argument("--recipients", default=None, help="nombres de destinataires des flux complets (ex: 1,10,100)")
+    parser.add_argument("--corpus", default=os.path.join(tempfile.gettempdir(), "leakdetector-bench-corpus"),
+                        help="dossier du corpus synthétique (réutilisé d'une exécution à l'autre)")
+    parser.add_argument("--db", choices=["stub", "postgres"], default="stub",
+                        help="stub: SQLite temporaire; postgres: DATABASE_URL")
+    parser.add_argument("--only", default="crypto,embed,extract,e2e", help="groupes de mesures à exécuter")
+    return parser.parse_args(argv)
+
+def _summary(durations: list) -> dict:
+    return {
+        "median_ms": round(statistics.median(durations) * 1000, 4),
+        "min_ms": round(min(durations) * 1000, 4),
+        "mean_ms": round(statistics.mean(durations) * 1000, 4),
+        "runs": len(durations),
+    }
+
+class Bench:
+    """Collecte des mesures: chaque mesure est une liste de durées (secondes) résumée à la fin."""
+
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results = {}
+
+    def measure(self, name: str, fn, repeat: int = None, inner: int = 1) -> None:
+        """Exécute fn repeat fois (inner appels par répétition, pour les opérations très courtes)."""
+        durations = []
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            for _ in range(inner):
+                fn()
+            durations.append((time.perf_counter() - start) / inner)
+        self.record(name, durations)
+
+    def record(self, name: str, durations: list) -> None:
+        self.results[name] = _summary(durations)
+        print(f"{name:<48} {self.results[name]['median_ms']:>12.3f} ms", flush=True)
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+def bench_crypto(bench: Bench) -> None:
+    import crypto
+    inner = 200
+    v1 = crypto.encrypt_data(b"123:456")
+    v2 = crypto.encode_token(123, 456)
+    bench.measure("crypto.encrypt_data", lambda: crypto.encrypt_data(b"123:456"), inner=inner)
+    bench.measure("crypto.decrypt_data", lambda: crypto.decrypt_data(v1), inner=inner)
+    bench.measure("crypto.encode_token", lambda: crypto.encode_token(123, 456), inner=inner)
+    bench.measure("crypto.decode_token.v2", lambda: crypto.decode_token(v2), inner=inner)
+    bench.measure("crypto.decode_token.v1", lambda: crypto.decode_token(v1), inner=inner)
+    bench.measure("crypto.token_hash", lambda: crypto.token_hash(v2), inner=inner)
+
+def bench_embed_extract(bench: Bench, corpus: dict, workdir: str, groups: set) -> None:
+    import crypto
+    from services import pdf, png, txt
+    token = crypto.encode_token(123, 456)
+    copy_dir = os.path.join(workdir, "copies")
+    os.makedirs(copy_dir, exist_ok=True)
+
+    def _write(path, parts):
+        with open(path, "wb") as f:
+            f.writelines(parts)
+
+    for label, path in corpus["PDF"]:
+        with open(path, "rb") as f:
+            data = f.read()
+        out = os.path.join(copy_dir, f"{label}.pdf")
+        if "embed" in groups:
+            bench.measure(f"embed.pdf.full.{label}", lambda: pdf.embed_fingerprint_pdf(data, token))
+            bench.measure(f"embed.pdf.template_init.{label}", lambda: pdf.PdfFingerprintTemplate(data))
+            template = pdf.PdfFingerprintTemplate(data)
+            bench.measure(f"embed.pdf.template_render.{label}", lambda: template.render(token))
+        if "extract" in groups:
+            _write(out, [pdf.PdfFingerprintTemplate(data).render(token)])
+            bench.measure(f"extract.pdf.{label}", lambda: pdf.extract_fingerprint_from_pdf(out))
+
+    for label, path in corpus["PNG"]:
+        out = os.path.join(copy_dir, f"{label}.png")
+        if "embed" in groups:
+            bench.measure(f"embed.png.full.{label}", lambda: png.embed_fingerprint_png(path, token))
+            bench.measure(f"embed.png.template_init.{label}", lambda: png.PngFingerprintTemplate(path))
+        template = png.PngFingerprintTemplate(path)
+        if "embed" in groups:
+            bench.measure(f"embed.png.template_render.{label}", lambda: template.render_parts(token))
+        if "extract" in groups:
+            _write(out, template.render_parts(token))
+            bench.measure(f"extract.png.{label}", lambda: png.extract_fingerprint_from_png(out))
+
+    for label, path in corpus["TXT"]:
+        out = os.path.join(copy_dir, f"{label}.txt")
+        template = txt.TxtFingerprintTemplate(path)
+        if "embed" in groups:
+            if os.path.getsize(path) <= 16 * 1024 * 1024:
+                with open(path, "rb") as f:
+                    data = f.read()
+                bench.measure(f"embed.txt.bytes.{label}", lambda: txt.embed_fingerprint_txt(data, token))
+            bench.measure(f"embed.txt.stream.{label}", lambda: _write(out, template.render_parts(token)))
+        if "extract" in groups:
+            _write(out, template.render_parts(token))
+            bench.measure(f"extract.txt.{label}", lambda: txt.extract_fingerprint_from_txt(out))
+
+def _upload(path: str, filename: str):
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    content_type = {"pdf": "application/pdf", "png": "image/png", "txt": "text/plain"}[filename.rsplit(".", 1)[1]]
+    return UploadFile(file=open(path, "rb"), filename=filename, headers=Headers({"content-type": content_type}))
+
+def bench_e2e(bench: Bench, corpus: dict, recipient_counts: list) -> None:
+    """
+    Flux complets, en appelant directement les fonctions des routes (sans HTTP ni dépendances FastAPI):
+    distribute_file, puis production de toutes les copies (téléchargement en mode lazy), puis scan_file de chaque copie.
+    Un scan par copie distincte: le cache des verdicts n'est touché qu'une fois par copie ("scan.cached" le mesure).
+    """
+    # Endpoints asynchrones: une seule boucle pour tous les appels (le pool du moteur asynchrone y est lié)
+    loop = asyncio.new_event_loop()
+    try:
+        _bench_e2e(bench, corpus, recipient_counts, loop)
+    finally:
+        loop.close()
+
+def _bench_e2e(bench: Bench, corpus: dict, recipient_counts: list, loop) -> None:
+    import config, models
+    from routes import distribute, scan
+    from services import copies
+    for file_type, items in corpus.items():
+        # Taille intermédiaire du corpus: représentative sans dominer la durée totale
+        label, path = items[min(1, len(items) - 1)]
+        if os.path.getsize(path) > config.MAX_FILE_SIZE:
+            continue
+        ext = file_type.lower()
+        for count in recipient_counts:
+            prefix = f"e2e.{ext}.{label}.r{count}"
+            recipients = ",".join(f"destinataire{i}@example.com" for i in range(count))
+            distribute_times, materialize_times, scan_times, cached_times = [], [], [], []
+            for _ in range(bench.repeat):
+                db = models.SessionLocal()
+                try:
+                    upload = _upload(path, f"bench.{ext}")
+                    start = time.perf_counter()
+                    response = loop.run_until_complete(distribute.distribute_file(file=upload, recipients=recipients, db=db, token=None))
+                    distribute_times.append(time.perf_counter() - start)
+                    upload.file.close()
+                    distribution_id = json.loads(response.body)["distribution_id"]
+                    distribution = db.get(models.Distribution, distribution_id)
+                    dist_files = sorted(distribution.files, key=lambda f: f.id)
+                    start = time.perf_counter()
+                    paths = copies.materialize_many(distribution, dist_files)
+                    materialize_times.append(time.perf_counter() - start)
+                    # Au plus 10 scans par répétition: le coût d'un scan ne dépend pas du nombre de destinataires
+                    for copy_path in paths[:10]:
+                        for times in (scan_times, cached_times):
+                            upload = _upload(copy_path, f"copie.{ext}")
+                            start = time.perf_counter()
+                            verdict = loop.run_until_complete(scan.scan_file(file=upload, full_scan=False, token=None))
+                            times.append(time.perf_counter() - start)
+                            upload.file.close()
+                            if verdict["status"] != "found":
+                                raise RuntimeError(f"Copie non identifiée par le scan: {copy_path}")
+                finally:
+                    db.close()
+            bench.record(f"{prefix}.distribute", distribute_times)
+            bench.record(f"{prefix}.materialize", materialize_times)
+            bench.record(f"{prefix}.materialize_per_copy", [t / count for t in materialize_times])
+            bench.record(f"{prefix}.scan", scan_times)
+            bench.record(f"{prefix}.scan.cached", cached_times)
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    groups = set(args.only.split(","))
+    repeat = args.repeat or (3 if args.quick else 5)
+    recipient_counts = [int(n) for n in (args.recipients or ("1,10" if args.quick else "1,10,100")).split(",")]
+    workdir = tempfile.mkdtemp(prefix="leakdetector-bench-")
+    # Environnement isolé: copies, originaux et caches dans un dossier temporaire
+    os.environ["OUTPUT_DIR"] = os.path.join(workdir, "output")
+    os.environ.setdefault("COPY_MATERIALIZATION", "lazy")
+    if args.db == "stub":
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import models
+    from benchmarks import compare, corpus as corpus_module
+    models.create_schema()
+
+    if args.db == "stub":
+        # SQLite n'a pas de séquences: réservation des IDs en mémoire (un seul processus écrit dans la base)
+        def reserve_ids(session, model, count):
+            last = session.execute(models.text(f"SELECT coalesce(max(id), 0) FROM {model.__tablename__}")).scalar()
+            base = max(last, reserve_ids.last.get(model, 0))
+            reserve_ids.last[model] = base + count
+            return list(range(base + 1, base + count + 1))
+        reserve_ids.last = {}
+        models.reserve_ids = reserve_ids
+
+    print(f"Corpus: {args.corpus}", flush=True)
+    corpus = corpus_module.build(args.corpus, quick=args.quick)
+    bench = Bench(repeat)
+    if "crypto" in groups:
+        bench_crypto(bench)
+    if groups & {"embed", "extract"}:
+        bench_embed_extract(bench, corpus, workdir, groups)
+    if "e2e" in groups:
+        bench_e2e(bench, corpus, recipient_counts)
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "db": args.db,
+            "quick": args.quick,
+            "repeat": repeat,
+            "recipients": recipient_counts,
+        },
+        "results": bench.results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print(f"Résultats écrits dans {args.output}")
+    if args.baseline:
+        return 1 if compare.report(compare.compare(compare.load(args.baseline), output, args.threshold)) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
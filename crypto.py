@@ -1,4 +1,4 @@
-import os, base64, hashlib, hmac
+import os, re, base64, hashlib, hmac, struct
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 # On importe les paramètres de config, notamment MASTER_SECRET
@@ -14,6 +14,29 @@ KEY_HMAC = _key_material[32:]  # Clé de 256 bits pour HMAC-SHA256
 # Initialisation de l'objet AES-GCM (de la librairie cryptography) avec la clé de chiffrement.
 aesgcm = AESGCM(KEY_ENC)
 
+# Clé dédiée à l'index des jetons émis (table fingerprint_index): hachage à clé, sans rapport avec le chiffrement
+KEY_INDEX = hmac.new(KEY_HMAC, b"fingerprint-index", digestmod="sha256").digest()
+
+# Jetons d'empreinte, deux formats:
+# - v1 (encrypt_data): base64( IV (12o) + AES-GCM("distID:fileID" ASCII + HMAC-SHA256) ), ~100 caractères;
+#   embarqué tel quel (caractères ASCII) dans les fichiers. Toujours décodé, plus produit.
+# - v2 (encode_token): octet de version 0x02 + nonce (12o) + AES-GCM(distID, fileID en 2 x 32 bits) + tag (16o),
+#   soit 37 octets. Le GCM authentifie déjà les données (et l'octet de version, passé en données associées):
+#   pas de HMAC. Embarqué en binaire brut dans les PNG/TXT (296 bits), en base64 (52 caractères) dans les PDF.
+# Dans la base et entre services, un jeton est toujours manipulé sous sa forme base64.
+TOKEN_V2 = 0x02
+TOKEN_V2_SIZE = 1 + 12 + 8 + 16
+_V2_IDS = struct.Struct(">II")
+
+# Tailles possibles d'un jeton en base64: v1 (IV + plaintext de 3 à 41o + HMAC + tag) et v2.
+# Sert à écarter à moindre coût les chaînes base64 qui ne peuvent pas être une empreinte, avant tout déchiffrement.
+TOKEN_LENGTHS = frozenset([4 * -(-(12 + n + 32 + 16) // 3) for n in range(3, 42)] + [4 * -(-TOKEN_V2_SIZE // 3)])
+_TOKEN_ALPHABET = re.compile(r'[A-Za-z0-9+/]+={0,2}')
+
+def is_token_candidate(candidate: str) -> bool:
+    """Vérifie (sans cryptographie) qu'une chaîne a la longueur et l'alphabet d'une empreinte."""
+    return len(candidate) in TOKEN_LENGTHS and _TOKEN_ALPHABET.fullmatch(candidate) is not None
+
 def encrypt_data(plaintext: bytes) -> str:
     """
     Chiffre des données brutes avec AES-GCM + HMAC.
@@ -58,3 +81,66 @@ def decrypt_data(encoded: str) -> bytes:
         # Si le HMAC ne correspond pas, on considère l'empreinte invalide/tampered.
         raise ValueError("HMAC invalide ou données altérées.")
     return plaintext
+
+def encode_token(dist_id: int, file_id: int) -> str:
+    """Produit un jeton v2 (forme base64) pour une copie distribuée."""
+    if not (0 <= dist_id <= 0xFFFFFFFF and 0 <= file_id <= 0xFFFFFFFF):
+        raise ValueError("Identifiants hors de la plage d'un jeton v2 (32 bits).")
+    version = bytes([TOKEN_V2])
+    nonce = os.urandom(12)
+    blob = version + nonce + aesgcm.encrypt(nonce, _V2_IDS.pack(dist_id, file_id), version)
+    return base64.b64encode(blob).decode('ascii')
+
+def _v2_blob(token: str):
+    """Octets bruts d'un jeton v2, ou None si la chaîne n'est pas un jeton v2."""
+    if len(token) != 4 * -(-TOKEN_V2_SIZE // 3):
+        return None
+    try:
+        blob = base64.b64decode(token, validate=True)
+    except ValueError:
+        return None
+    return blob if len(blob) == TOKEN_V2_SIZE and blob[0] == TOKEN_V2 else None
+
+def decode_token(token: str) -> tuple:
+    """
+    Déchiffre un jeton (v2 ou v1) et renvoie (dist_id, file_id); dist_id peut être None pour un ancien jeton v1
+    ne contenant que l'identifiant de la copie. Lève une exception si le jeton est invalide ou altéré.
+    """
+    blob = _v2_blob(token)
+    if blob is not None:
+        return _V2_IDS.unpack(aesgcm.decrypt(blob[1:13], blob[13:], blob[:1]))
+    plaintext = decrypt_data(token)
+    # v1: "dist_id:file_id" ou juste l'identifiant de la copie
+    data_str = plaintext.decode('utf-8', errors='ignore')
+    if ":" in data_str:
+        dist_id, file_id = data_str.split(":")
+        return int(dist_id), int(file_id)
+    if not data_str.isdigit():
+        raise ValueError("Contenu de jeton v1 inattendu.")
+    return None, int(data_str)
+
+def is_authentic(token: str) -> bool:
+    """Vrai si le jeton se déchiffre avec notre clé (tag GCM / HMAC valides)."""
+    try:
+        decode_token(token)
+        return True
+    except Exception:
+        return False
+
+def token_hash(token: str) -> str:
+    """Hachage à clé (HMAC-SHA256, hexadécimal) d'un jeton sous forme base64, clé de la table fingerprint_index."""
+    return hmac.new(KEY_INDEX, token.encode('ascii'), digestmod="sha256").hexdigest()
+
+def token_bytes(token: str) -> bytes:
+    """Octets à cacher dans un fichier, bit à bit: binaire brut pour un jeton v2, caractères ASCII pour un v1."""
+    blob = _v2_blob(token)
+    return blob if blob is not None else token.encode('ascii')
+
+def token_from_bytes(data: bytes):
+    """Inverse de token_bytes: reconstruit la forme base64 du jeton (None si les octets ne sont pas un jeton)."""
+    if len(data) == TOKEN_V2_SIZE and data[0] == TOKEN_V2:
+        return base64.b64encode(data).decode('ascii')
+    try:
+        return data.decode('ascii')
+    except UnicodeDecodeError:
+        return None
@@ -2,8 +2,10 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
-import config
-from routes import distribute, scan, admin
+import config, models
+from routes import distribute, scan, admin, jobs, uploads, metrics as metrics_routes
+from services import fingerprint_index, metrics, profiler
+from services.uploads import UploadSizeLimitMiddleware
 
 # Initialisation de l'application FastAPI
 app = FastAPI(title="Leak Detector", description="Service de fingerprinting de documents (PDF, PNG, TXT) pour traquer les fuites.")
@@ -17,10 +19,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Rejet précoce (413) des uploads dépassant MAX_FILE_SIZE_MB (MAX_BATCH_SIZE_MB pour le scan groupé)
+app.add_middleware(UploadSizeLimitMiddleware, path_limits={"/api/scan/batch": config.MAX_BATCH_SIZE})
+
+# Instrumentation: durée des requêtes par route (/metrics), et profil à la demande (PROFILING_ENABLED + "X-Profile: 1")
+app.add_middleware(profiler.ProfilerMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Inclusion des routeurs d'API
 app.include_router(distribute.router)
 app.include_router(scan.router)
 app.include_router(admin.router)
+app.include_router(jobs.router)
+app.include_router(uploads.router)
+app.include_router(metrics_routes.router)
+
+@app.on_event("startup")
+def create_schema():
+    """
+    Crée les tables manquantes et indexe les jetons antérieurs à l'index, sauf si le schéma est géré par une étape
+    de migration (DB_CREATE_SCHEMA=false).
+    """
+    if config.DB_CREATE_SCHEMA:
+        models.create_schema()
+
+@app.on_event("startup")
+def load_fingerprint_index():
+    """Construit le filtre de Bloom du processus (l'index lui-même est complété par create_schema)."""
+    db = models.SessionLocal()
+    try:
+        fingerprint_index.rebuild(db)
+    finally:
+        db.close()
 
 # Servir les fichiers statiques (interface web) - on suppose un dossier "static" avec index.html, script.js, style.css
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
@@ -0,0 +1,75 @@
+import argparse, logging, os, shutil
+from sqlalchemy import bindparam, or_
+
+import models
+from models import DistributionFile, DistributionJobItem
+from services import storage
+
+# Migration des copies vers l'arborescence répartie de services/storage.py (COPIES_DIR/ab/cd/<nom>).
+# Usage: `python migrate_storage.py [--batch 1000] [--dry-run]`, workers de distribution (worker.py) arrêtés; l'API
+# peut rester en service (une copie absente est régénérée ou servie depuis le cache). Chaque copie est déplacée
+# (renommage) avant la mise à jour de sa ligne, par lots commités un à un. Relancer l'outil après une
+# interruption reprend où il s'était arrêté: une copie déjà déplacée dont la ligne n'a pas suivi est reconnue.
+# Les lignes des copies jamais écrites (mode "lazy") sont aussi mises à jour: le chemin ne sert qu'au nom de
+# téléchargement et aux workers; les items de tâches encore en attente suivent leur copie.
+
+logger = logging.getLogger("migrate_storage")
+
+def _move(old_path: str, new_path: str) -> bool:
+    """Déplace une copie vers son nouveau chemin. Retourne False si elle n'existe ni à l'ancien ni au nouveau."""
+    if os.path.isfile(old_path):
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        # Renommage atomique sur le même système de fichiers, copie puis suppression sinon
+        shutil.move(old_path, new_path)
+        return True
+    return os.path.isfile(new_path)
+
+def migrate(batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """Déplace les copies vers l'arborescence répartie et met à jour file_path (et output_path des items en attente)."""
+    counts = {"moved": 0, "missing": 0, "unchanged": 0}
+    db = models.SessionLocal()
+    last_id = 0
+    try:
+        while True:
+            rows = (db.query(DistributionFile.id, DistributionFile.file_path)
+                    .filter(DistributionFile.id > last_id)
+                    .order_by(DistributionFile.id)
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            last_id = rows[-1].id
+            updates = []
+            for file_id, old_path in rows:
+                new_path = storage.copy_path(file_id, os.path.basename(old_path))
+                if old_path == new_path:
+                    counts["unchanged"] += 1
+                    continue
+                if dry_run:
+                    counts["moved" if os.path.isfile(old_path) else "missing"] += 1
+                    continue
+                counts["moved" if _move(old_path, new_path) else "missing"] += 1
+                updates.append({"id": file_id, "file_path": new_path})
+            if updates:
+                db.execute(DistributionFile.__table__.update()
+                           .where(DistributionFile.id == bindparam("b_id"))
+                           .values(file_path=bindparam("b_path")),
+                           [{"b_id": u["id"], "b_path": u["file_path"]} for u in updates])
+                db.execute(DistributionJobItem.__table__.update()
+                           .where(DistributionJobItem.distribution_file_id == bindparam("b_id"),
+                                  or_(DistributionJobItem.status == "pending", DistributionJobItem.status == "running"))
+                           .values(output_path=bindparam("b_path")),
+                           [{"b_id": u["id"], "b_path": u["file_path"]} for u in updates])
+                db.commit()
+            logger.info("Copies jusqu'à l'ID %d: %s", last_id, counts)
+    finally:
+        db.close()
+    return counts
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Migre les copies vers l'arborescence répartie (COPIES_DIR).")
+    parser.add_argument("--batch", type=int, default=1000, help="Copies traitées par transaction.")
+    parser.add_argument("--dry-run", action="store_true", help="Compter sans rien déplacer ni modifier.")
+    args = parser.parse_args()
+    logger.info("Terminé: %s", migrate(args.batch, args.dry_run))
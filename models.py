@@ -1,15 +1,60 @@
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import create_engine, text, Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 
 import config
+from services import lanes
+
+def _pool_options(url: str) -> dict:
+    """Réglages du pool de connexions (config.DB_POOL_*); SQLite (développement) garde le pool par défaut."""
+    if url.startswith("sqlite"):
+        return {}
+    return {"pool_size": config.DB_POOL_SIZE, "max_overflow": config.DB_MAX_OVERFLOW, "pool_timeout": config.DB_POOL_TIMEOUT,
+            "pool_recycle": config.DB_POOL_RECYCLE, "pool_pre_ping": config.DB_POOL_PRE_PING}
 
 # Initialisation de l'ORM SQLAlchemy
-engine = create_engine(config.DATABASE_URL, echo=False)
+engine = create_engine(config.DATABASE_URL, echo=False, **_pool_options(config.DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine)
 Base = declarative_base()
 
+# Moteur asynchrone pour les lectures des endpoints très sollicités (voir read()); None si non configuré
+async_engine = None
+AsyncSessionLocal = None
+if config.DATABASE_ASYNC_URL:
+    # Import local: sqlalchemy[asyncio] (greenlet) n'est requis que si le moteur asynchrone est configuré
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    async_engine = create_async_engine(config.DATABASE_ASYNC_URL, echo=False, **_pool_options(config.DATABASE_ASYNC_URL))
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+def get_db():
+    """Dépendance FastAPI: une session par requête, toujours fermée (connexion rendue au pool), même en cas d'erreur."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _read_sync(statement, scalars: bool) -> list:
+    db = SessionLocal()
+    try:
+        result = db.execute(statement)
+        return result.scalars().all() if scalars else result.all()
+    finally:
+        db.close()
+
+async def read(statement, scalars: bool = False) -> list:
+    """
+    Exécute une requête de lecture (select) depuis un endpoint asynchrone et renvoie toutes ses lignes
+    (ou ses entités si scalars). Avec le moteur asynchrone, l'attente de la base n'occupe aucun thread;
+    sinon la requête s'exécute dans la voie "light" (services/lanes.py). Les objets renvoyés sont détachés de leur session.
+    """
+    if AsyncSessionLocal is None:
+        return await lanes.run("light", _read_sync, statement, scalars)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(statement)
+        return result.scalars().all() if scalars else result.all()
+
 class Distribution(Base):
     """Modèle représentant un événement de distribution d'un fichier à des destinataires."""
     __tablename__ = "distributions"
@@ -17,18 +62,88 @@ class Distribution(Base):
     file_name = Column(String(255), nullable=False)    # Nom du fichier original distribué
     file_type = Column(String(10), nullable=False)     # Type de fichier ("PDF", "PNG", "TXT")
     date = Column(DateTime, default=datetime.utcnow)   # Date/heure de la distribution
+    original_sha256 = Column(String(64), nullable=True, index=True)  # Original dans ORIGINALS_DIR (NULL: distribution antérieure)
     # Relation vers les copies distribuées (fichiers fingerprintés pour chaque destinataire)
     files = relationship("DistributionFile", back_populates="distribution", cascade="all, delete-orphan")
+    # Index de la pagination par curseur de l'administration (tri date desc, id desc)
+    __table_args__ = (Index("ix_distributions_date_id", "date", "id"),)
 
 class DistributionFile(Base):
     """Modèle représentant un fichier distribué à un destinataire (une copie fingerprintée)."""
     __tablename__ = "distribution_files"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    distribution_id = Column(Integer, ForeignKey("distributions.id", ondelete="CASCADE"))
+    distribution_id = Column(Integer, ForeignKey("distributions.id", ondelete="CASCADE"), index=True)
     recipient = Column(String(255), nullable=False)    # Identifiant du destinataire (nom ou email)
-    file_path = Column(Text, nullable=False)           # Chemin du fichier généré sur le disque (empreinte)
+    file_path = Column(Text, nullable=False)           # Chemin de la copie en mode "eager" (son nom sert aussi au téléchargement)
+    token = Column(Text, nullable=True)                # Empreinte chiffrée injectée dans la copie (régénération à l'identique)
     # Relation vers la distribution parent
     distribution = relationship("Distribution", back_populates="files")
 
-# Création des tables dans la base de données si elles n'existent pas déjà
-Base.metadata.create_all(bind=engine)
+class DistributionJob(Base):
+    """Modèle représentant une tâche de distribution asynchrone (traitée par les workers, voir worker.py)."""
+    __tablename__ = "distribution_jobs"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    distribution_id = Column(Integer, ForeignKey("distributions.id", ondelete="SET NULL"), nullable=True)
+    file_type = Column(String(10), nullable=False)     # Type de fichier ("PDF", "PNG", "TXT")
+    source_path = Column(Text, nullable=False)         # Fichier original déposé sur le disque, lu par les workers
+    status = Column(String(16), nullable=False, default="pending", index=True)  # pending, running, done, failed
+    total = Column(Integer, nullable=False)            # Nombre de copies à produire
+    done = Column(Integer, nullable=False, default=0)  # Nombre de copies déjà produites
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    items = relationship("DistributionJobItem", back_populates="job", cascade="all, delete-orphan")
+
+class DistributionJobItem(Base):
+    """Unité de travail d'une tâche: une copie fingerprintée pour un destinataire."""
+    __tablename__ = "distribution_job_items"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    job_id = Column(Integer, ForeignKey("distribution_jobs.id", ondelete="CASCADE"), index=True)
+    distribution_file_id = Column(Integer, nullable=False)  # ID (réservé) de la copie DistributionFile
+    output_path = Column(Text, nullable=False)
+    status = Column(String(16), nullable=False, default="pending", index=True)  # pending, running, done, cancelled
+    claimed_at = Column(DateTime, nullable=True)       # Début du bail du worker qui traite l'item
+    job = relationship("DistributionJob", back_populates="items")
+
+class ScanCacheEntry(Base):
+    """Verdict de scan mis en cache, indexé par l'empreinte SHA-256 du fichier analysé (et son type)."""
+    __tablename__ = "scan_cache"
+    sha256 = Column(String(64), primary_key=True)
+    file_type = Column(String(10), primary_key=True)
+    # Verdict positif: lié à la distribution (supprimé en cascade si elle est supprimée). NULL pour un verdict négatif.
+    distribution_id = Column(Integer, ForeignKey("distributions.id", ondelete="CASCADE"), nullable=True, index=True)
+    result = Column(Text, nullable=False)              # Réponse JSON de /api/scan
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class FingerprintIndex(Base):
+    """Index des jetons émis: hachage à clé du jeton -> copie distribuée (résolution d'un scan sans déchiffrement)."""
+    __tablename__ = "fingerprint_index"
+    id = Column(Integer, primary_key=True, autoincrement=True)  # Ordre d'insertion (rafraîchissement incrémental des filtres)
+    token_hash = Column(String(64), nullable=False, unique=True)  # crypto.token_hash(jeton)
+    distribution_file_id = Column(Integer, ForeignKey("distribution_files.id", ondelete="CASCADE"), nullable=False, index=True)
+
+def reserve_ids(session, model, count: int) -> list:
+    """
+    Réserve count identifiants dans la séquence de la clé primaire du modèle, en une seule requête.
+    Les IDs peuvent ensuite être utilisés directement dans un INSERT groupé (pas de refresh par ligne).
+    """
+    rows = session.execute(
+        text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+        {"table": model.__tablename__, "count": count},
+    )
+    return sorted(row[0] for row in rows)
+
+def create_schema() -> None:
+    """
+    Crée les tables qui n'existent pas encore, puis indexe les jetons des distributions antérieures à l'index
+    (fingerprint_index.backfill). Étape explicite (démarrage de l'API si DB_CREATE_SCHEMA, ou migration du
+    déploiement): importer les modèles n'accède jamais à la base.
+    """
+    Base.metadata.create_all(bind=engine)
+    # Import local: services.fingerprint_index importe ce module
+    from services import fingerprint_index
+    db = SessionLocal()
+    try:
+        fingerprint_index.backfill(db)
+    finally:
+        db.close()
@@ -1,66 +1,211 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-import io, zipfile
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import exists, select, tuple_
+from sqlalchemy.orm import Session, aliased
+from datetime import datetime, timezone
+import base64, csv, io, json, os
 
 import models, config
 from models import Distribution, DistributionFile
 from routes.auth import get_api_token
-from fastapi.responses import FileResponse, StreamingResponse
+from services import copies, lanes, metrics, scan_cache, sendfile, zipstream
+from fastapi.responses import StreamingResponse
 
-router = APIRouter()
+router = APIRouter(route_class=lanes.LaneRoute)
+
+def _encode_cursor(date: datetime, dist_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{date.isoformat()}|{dist_id}".encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> tuple:
+    """Curseur opaque -> (date, id) de la dernière distribution de la page précédente."""
+    try:
+        date_str, dist_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(date_str), int(dist_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide.")
+
+def _filter_distributions(query, file_type: str = None, date_from: datetime = None, date_to: datetime = None, recipient: str = None):
+    """Applique les filtres de l'administration: type de fichier, période [date_from, date_to[, destinataire (sous-chaîne)."""
+    if file_type:
+        query = query.filter(Distribution.file_type == file_type.upper())
+    if date_from:
+        query = query.filter(Distribution.date >= date_from)
+    if date_to:
+        query = query.filter(Distribution.date < date_to)
+    if recipient:
+        # Alias: la requête d'export joint déjà distribution_files
+        copy = aliased(DistributionFile)
+        query = query.filter(exists().where(copy.distribution_id == Distribution.id, copy.recipient.icontains(recipient, autoescape=True)))
+    return query
 
 @router.get("/admin/distributions")
-def list_distributions(db: Session = Depends(models.SessionLocal), token: str = Depends(get_api_token)):
+@lanes.admission("light")
+async def list_distributions(cursor: str = None, limit: int = Query(None, ge=1), file_type: str = None,
+                             date_from: datetime = None, date_to: datetime = None, recipient: str = None,
+                             token: str = Depends(get_api_token)):
+    """
+    Renvoie une page de distributions (les plus récentes d'abord), avec leurs destinataires.
+    Pagination par curseur sur (date, id): passer next_cursor de la réponse pour obtenir la page suivante.
+    Deux requêtes par page quel que soit l'historique: la page elle-même, puis tous ses destinataires
+    (lectures par le moteur asynchrone, voir models.read).
+    """
+    limit = min(limit or config.ADMIN_PAGE_SIZE, config.ADMIN_PAGE_SIZE_MAX)
+    statement = _filter_distributions(select(Distribution), file_type, date_from, date_to, recipient)
+    if cursor:
+        statement = statement.filter(tuple_(Distribution.date, Distribution.id) < tuple_(*_decode_cursor(cursor)))
+    # Une ligne de plus que demandé: indique s'il existe une page suivante
+    distributions = await models.read(
+        statement.order_by(Distribution.date.desc(), Distribution.id.desc()).limit(limit + 1), scalars=True)
+    has_more = len(distributions) > limit
+    distributions = distributions[:limit]
+    # Destinataires de toute la page en une seule requête (pas de chargement paresseux ligne par ligne)
+    recipients = {dist.id: [] for dist in distributions}
+    if recipients:
+        rows = await models.read(select(DistributionFile.distribution_id, DistributionFile.recipient)
+                                 .filter(DistributionFile.distribution_id.in_(list(recipients)))
+                                 .order_by(DistributionFile.id))
+        for dist_id, name in rows:
+            recipients[dist_id].append(name)
+    items = [{
+        "id": dist.id,
+        "file_name": dist.file_name,
+        "file_type": dist.file_type,
+        "date": dist.date.strftime("%Y-%m-%d %H:%M:%S"),
+        "recipients": recipients[dist.id]
+    } for dist in distributions]
+    last = distributions[-1] if distributions else None
+    return {"items": items, "next_cursor": _encode_cursor(last.date, last.id) if has_more else None}
+
+EXPORT_COLUMNS = ["distribution_id", "file_name", "file_type", "date", "file_id", "recipient"]
+
+@router.get("/admin/distributions/export")
+@lanes.endpoint("light")
+def export_distributions(format: str = "ndjson", file_type: str = None, date_from: datetime = None,
+                         date_to: datetime = None, recipient: str = None, token: str = Depends(get_api_token)):
     """
-    Renvoie la liste de toutes les distributions passées, avec leurs destinataires.
+    Exporte en flux (NDJSON ou CSV) toutes les copies distribuées correspondant aux filtres, une ligne par destinataire.
+    Les lignes sont lues via un curseur côté serveur, par lots de ADMIN_EXPORT_BATCH: la mémoire reste constante.
     """
-    distributions = db.query(Distribution).order_by(Distribution.date.desc()).all()
-    result = []
-    for dist in distributions:
-        result.append({
-            "id": dist.id,
-            "file_name": dist.file_name,
-            "file_type": dist.file_type,
-            "date": dist.date.strftime("%Y-%m-%d %H:%M:%S"),
-            "recipients": [df.recipient for df in dist.files]
-        })
-    return result
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format d'export non supporté (ndjson ou csv).")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"distributions.{format}"
+    return StreamingResponse(lanes.iterate("light", _export_lines(format, file_type, date_from, date_to, recipient)), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+def _export_lines(format: str, file_type, date_from, date_to, recipient):
+    """Générateur de l'export (session propre au flux, fermée à la fin de la réponse)."""
+    db = models.SessionLocal()
+    try:
+        query = (db.query(Distribution.id, Distribution.file_name, Distribution.file_type, Distribution.date,
+                          DistributionFile.id, DistributionFile.recipient)
+                 .join(DistributionFile, DistributionFile.distribution_id == Distribution.id))
+        query = _filter_distributions(query, file_type, date_from, date_to, recipient)
+        query = query.order_by(Distribution.date.desc(), Distribution.id.desc(), DistributionFile.id)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == "csv":
+            writer.writerow(EXPORT_COLUMNS)
+        # yield_per: curseur côté serveur (stream_results) et lecture par lots
+        for row in query.yield_per(config.ADMIN_EXPORT_BATCH):
+            values = [row[0], row[1], row[2], row[3].strftime("%Y-%m-%d %H:%M:%S") if row[3] else None, row[4], row[5]]
+            if format == "csv":
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values)), ensure_ascii=False) + "\n")
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode("utf-8")
+    finally:
+        db.close()
 
 @router.get("/admin/download/{file_id}")
-def download_distributed_file(file_id: int, token: str = Depends(get_api_token)):
+@lanes.endpoint("cpu")
+def download_distributed_file(file_id: int, request: Request, db: Session = Depends(models.get_db), token: str = Depends(get_api_token)):
     """
     Télécharge un fichier distribué spécifique (copie fingerprintée) par son ID.
+    La copie est régénérée à partir de l'original si elle n'est pas déjà sur le disque (ou dans le cache).
+    Requêtes Range et If-None-Match (ETag) supportées; envoi délégué à Nginx si DOWNLOAD_ACCEL_PREFIX est défini.
     """
     # Rechercher le fichier en base
-    session = models.SessionLocal()
-    dist_file = session.query(DistributionFile).get(file_id)
-    session.close()
+    dist_file = db.query(DistributionFile).get(file_id)
     if not dist_file:
         raise HTTPException(status_code=404, detail="Fichier non trouvé.")
-    # Vérifier que le fichier existe sur le disque
-    file_path = dist_file.file_path
-    if not file_path or not os.path.isfile(file_path):
-        raise HTTPException(status_code=404, detail="Fichier introuvable sur le serveur.")
-    # Envoyer le fichier
-    return FileResponse(file_path, media_type="application/octet-stream", filename=os.path.basename(file_path))
+    distribution = dist_file.distribution
+    # Données chargées: connexion rendue au pool avant la régénération et l'envoi du fichier
+    db.close()
+    etag = copies.etag(distribution, dist_file)
+    last_modified = distribution.date.replace(tzinfo=timezone.utc).timestamp() if distribution.date else None
+    if_none_match = request.headers.get("if-none-match")
+    if etag and if_none_match and sendfile.etag_matches(if_none_match, etag):
+        # Copie déjà chez le client: ni régénération ni envoi
+        return sendfile.not_modified(sendfile.validators(etag, last_modified or 0))
+    download_name = os.path.basename(dist_file.file_path)
+    for attempt in range(2):
+        try:
+            file_path = copies.materialize(distribution, dist_file)
+        except copies.CopyUnavailable:
+            raise HTTPException(status_code=404, detail="Fichier introuvable sur le serveur.")
+        try:
+            # Envoyer le fichier (zéro-copie ou X-Accel-Redirect, voir services/sendfile.py)
+            return sendfile.send_file(file_path, download_name, if_none_match, etag=etag, last_modified=last_modified)
+        except FileNotFoundError:
+            # Copie évincée du cache par une autre requête entre sa régénération et son envoi: régénérée à nouveau
+            if attempt:
+                raise
 
 @router.get("/admin/distributions/{dist_id}/download")
-def download_distribution_zip(dist_id: int, db: Session = Depends(models.SessionLocal), token: str = Depends(get_api_token)):
+@lanes.endpoint("cpu")
+def download_distribution_zip(dist_id: int, db: Session = Depends(models.get_db), token: str = Depends(get_api_token)):
     """
-    Crée et renvoie un ZIP contenant tous les fichiers distribués pour une distribution donnée.
+    Renvoie en streaming un ZIP contenant tous les fichiers distribués pour une distribution donnée.
+    Les copies absentes du disque sont régénérées par lots, au rythme de l'écriture du ZIP.
     """
     dist = db.query(Distribution).get(dist_id)
     if not dist:
         raise HTTPException(status_code=404, detail="Distribution introuvable.")
-    # Préparer un ZIP en mémoire
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, mode="w") as zipf:
-        for dist_file in dist.files:
-            if dist_file.file_path and os.path.isfile(dist_file.file_path):
-                zipf.write(dist_file.file_path, arcname=os.path.basename(dist_file.file_path))
     if len(dist.files) == 0:
         raise HTTPException(status_code=404, detail="Aucun fichier dans cette distribution.")
-    zip_buffer.seek(0)
+    dist_files = list(dist.files)
+    # Données chargées: connexion rendue au pool avant le streaming (qui peut durer longtemps)
+    db.close()
+    # Le ZIP est généré en flux: chaque fichier est lu par morceaux et envoyé au fil de l'eau
+    entries = _zip_entries(dist, dist_files)
     # Nom du zip incluant l'ID ou le nom du fichier original
     zip_name = f"distribution_{dist.id}.zip"
-    return StreamingResponse(zip_buffer, media_type="application/zip", headers={"Content-Disposition": f"attachment; filename={zip_name}"})
+    return StreamingResponse(lanes.iterate("cpu", _timed_zip(entries)), media_type="application/zip", headers={"Content-Disposition": f"attachment; filename={zip_name}"})
+
+def _timed_zip(entries):
+    """Flux ZIP, mesuré de bout en bout (régénération des copies comprise) dans l'étape admin.zip."""
+    size = 0
+    with metrics.timer("admin.zip"):
+        for chunk in zipstream.stream_zip(entries):
+            size += len(chunk)
+            yield chunk
+    metrics.observe("leakdetector_bytes_processed", size, stage="admin.zip")
+
+def _zip_entries(dist, dist_files: list):
+    """(chemin, nom dans l'archive) de chaque copie disponible, matérialisées par lots de la taille du pool."""
+    batch_size = max(1, config.FINGERPRINT_WORKERS) * 4
+    for start in range(0, len(dist_files), batch_size):
+        batch = dist_files[start:start + batch_size]
+        try:
+            paths = copies.materialize_many(dist, batch)
+        except copies.CopyUnavailable:
+            # Distribution antérieure dont certaines copies ont disparu: on sert celles qui restent
+            paths = [dist_file.file_path if os.path.isfile(dist_file.file_path) else None for dist_file in batch]
+        for dist_file, path in zip(batch, paths):
+            if path is None:
+                continue
+            if not os.path.isfile(path):
+                # Copie évincée du cache entre-temps par une autre requête
+                path = copies.materialize(dist, dist_file)
+            yield path, os.path.basename(dist_file.file_path)
+
+@router.get("/admin/scan-cache")
+async def scan_cache_stats(token: str = Depends(get_api_token)):
+    """
+    Renvoie les compteurs du cache des verdicts de scan (succès mémoire/base, échecs) du processus courant.
+    """
+    return scan_cache.stats()
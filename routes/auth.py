@@ -1,10 +1,11 @@
 from fastapi import Header, HTTPException
 import config
 
-def get_api_token(authorization: str = Header(None)):
+async def get_api_token(authorization: str = Header(None)):
     """
     Dépendance FastAPI pour vérifier la présence d'un jeton API valide.
     On attend un header "Authorization: Bearer <TOKEN>".
+    Asynchrone: aucune attente, inutile de passer par le pool de threads.
     """
     if authorization is None:
         raise HTTPException(status_code=401, detail="Authentification requise.")
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+import models
+from models import DistributionJob
+from routes.auth import get_api_token
+from services import jobs, lanes
+
+router = APIRouter(route_class=lanes.LaneRoute)
+
+@router.get("/api/jobs/{job_id}")
+@lanes.endpoint("light")
+def get_job(job_id: int, db: Session = Depends(models.get_db), token: str = Depends(get_api_token)):
+    """
+    Renvoie l'état et l'avancement d'une tâche de distribution.
+    """
+    job = db.query(DistributionJob).get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Tâche introuvable.")
+    return jobs.job_status(job)
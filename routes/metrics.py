@@ -0,0 +1,19 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+import config
+from services import lanes, metrics
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Métriques du processus au format texte Prometheus: durées par étape et par type de fichier, tailles traitées,
+    destinataires par distribution, compteurs de copies et de scans, pic de mémoire résidente, état des voies
+    d'exécution (asynchrone: jamais en attente derrière les voies qu'il observe).
+    Sans authentification (convention Prometheus): à n'exposer qu'au réseau de supervision.
+    """
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métriques désactivées.")
+    return PlainTextResponse(metrics.render() + lanes.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,41 +1,191 @@
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException
-from sqlalchemy.orm import Session
-import models
+from fastapi import APIRouter, File, Form, UploadFile, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from typing import List
+import hashlib, json, os, shutil, tempfile, time, zipfile
+
+import models, config
 from routes.auth import get_api_token
-from services import extractor
+from services import extractor, fingerprint_index, formats, lanes, metrics, pool, scan_cache, uploads
 
-router = APIRouter()
+router = APIRouter(route_class=lanes.LaneRoute)
 
 @router.post("/api/scan")
-def scan_file(file: UploadFile = File(...), db: Session = Depends(models.SessionLocal), token: str = Depends(get_api_token)):
+@lanes.admission("scan")
+async def scan_file(file: UploadFile = File(...), full_scan: bool = Form(False), token: str = Depends(get_api_token)):
     """
     Analyse un fichier uploadé pour détecter une empreinte de fuite.
     Retourne l'identité du destinataire d'origine si une empreinte valide est trouvée.
+    full_scan: pour un PDF sans empreinte en métadonnées ni en page 0, parcourir aussi les pages suivantes (budget borné).
+    La réponse inclut la durée (ms) de chaque étape de l'analyse ("timings").
+    Endpoint asynchrone: lectures (cache, index) par le moteur asynchrone, extraction dans la voie "scan"
+    (jamais derrière une distribution), détection du type et écriture du verdict dans la voie "light" (services/lanes.py).
     """
-    filename = file.filename
-    content_type = file.content_type.lower()
-    # Identifier le type du fichier suspect
-    if filename.lower().endswith(".pdf") or "pdf" in content_type:
-        file_type = "PDF"
-    elif filename.lower().endswith(".png") or "png" in content_type:
-        file_type = "PNG"
-    elif filename.lower().endswith(".txt") or "text" in content_type:
-        file_type = "TXT"
-    else:
+    # Identifier le type du fichier suspect d'après son contenu (signature): lecture de l'upload, hors de la boucle
+    file_type = await lanes.run("light", formats.detect_upload, file)
+    if file_type is None:
         raise HTTPException(status_code=400, detail="Type de fichier non supporté pour scan.")
-    data = file.file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="Fichier vide ou illisible.")
-    # Tenter d'identifier la fuite
-    result = extractor.identify_leak(data, file_type, db)
+    # Copier l'upload sur le disque par morceaux (taille plafonnée) en calculant son SHA-256
+    hasher = hashlib.sha256()
+    with metrics.timer("scan.upload", file_type=file_type):
+        path = await lanes.run("scan", uploads.spool_upload, file, prefix="scan_", hasher=hasher)
+    metrics.observe("leakdetector_bytes_processed", os.path.getsize(path), stage="scan.upload", file_type=file_type)
+    return await scan_spooled(path, hasher.hexdigest(), file_type, full_scan)
+
+async def scan_spooled(path: str, digest: str, file_type: str, full_scan: bool = False) -> dict:
+    """
+    Analyse un fichier suspect déjà écrit sur le disque (upload classique ou reprenable, voir routes/uploads.py),
+    de SHA-256 digest, et renvoie la réponse de /api/scan. Le fichier est supprimé à la fin de l'analyse.
+    """
+    timings = {}
+    try:
+        # Fichier déjà analysé (même contenu): verdict en cache, sans ré-analyse ni déchiffrement.
+        # Un verdict négatif ne vaut pas pour un scan complet (il a pu être obtenu sans parcourir tout le PDF).
+        start = time.perf_counter()
+        cached = await scan_cache.get_async(digest, file_type)
+        timings["cache"] = metrics.elapsed_ms(start)
+        if cached is not None and (cached["status"] == "found" or not full_scan):
+            metrics.observe_timings("scan", timings, file_type=file_type)
+            metrics.inc("leakdetector_scans_total", file_type=file_type, status=cached["status"], cached="true")
+            return {**cached, "timings": timings}
+        # Tenter d'identifier la fuite (index des jetons émis, déchiffrement seulement pour les anciennes copies)
+        result = await extractor.identify_leak_async(path, file_type, full_scan=full_scan, timings=timings)
+    finally:
+        os.remove(path)
+    verdict = await lanes.run("light", _store_verdict, result, digest, file_type)
+    metrics.observe_timings("scan", timings, file_type=file_type)
+    metrics.inc("leakdetector_scans_total", file_type=file_type, status=verdict["status"], cached="false")
+    return {**verdict, "timings": timings}
+
+def _store_verdict(result, digest: str, file_type: str) -> dict:
+    """_verdict avec une session propre, fermée aussitôt (exécuté dans une voie de services/lanes.py)."""
+    db = models.SessionLocal()
+    try:
+        return _verdict(db, result, digest, file_type)
+    finally:
+        db.close()
+
+def _verdict(db, result, digest: str, file_type: str) -> dict:
+    """Construit la réponse de scan à partir de la copie identifiée (ou None) et la met en cache."""
     if not result:
-        return {"status": "not_found", "message": "Aucune empreinte détectée ou empreinte invalide."}
+        response = {"status": "not_found", "message": "Aucune empreinte détectée ou empreinte invalide."}
+        scan_cache.put(db, digest, file_type, response)
+        return response
     # Si trouvé, result est un tuple (Distribution, DistributionFile)
     distribution, dist_file = result
-    return {
+    response = {
         "status": "found",
         "distribution_id": distribution.id,
         "file_name": distribution.file_name,
         "date": str(distribution.date),
         "recipient": dist_file.recipient
     }
+    scan_cache.put(db, digest, file_type, response, distribution_id=distribution.id)
+    return response
+
+@router.post("/api/scan/batch")
+@lanes.endpoint("cpu")
+def scan_batch(files: List[UploadFile] = File(...), token: str = Depends(get_api_token)):
+    """
+    Analyse un lot de fichiers suspects: une archive ZIP (dépliée membre par membre) et/ou plusieurs fichiers.
+    Le type de chaque fichier est détecté d'après son contenu; les extractions sont réparties sur le pool
+    de processus (sans déchiffrement: les jetons candidats sont résolus ici par l'index). Renvoie un flux NDJSON: une ligne JSON par fichier, émise dès que son résultat est prêt.
+    """
+    workdir = tempfile.mkdtemp(prefix="scan_batch_")
+    uploaded = []
+    try:
+        for upload in files:
+            hasher = hashlib.sha256()
+            path = uploads.spool_upload(upload, workdir, hasher=hasher, max_size=config.MAX_BATCH_SIZE)
+            uploaded.append((upload.filename or os.path.basename(path), path, hasher.hexdigest()))
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    return StreamingResponse(lanes.iterate("cpu", _scan_batch_lines(uploaded, workdir)), media_type="application/x-ndjson")
+
+def _ndjson(entry: dict) -> bytes:
+    return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _iter_batch_files(uploaded: list, workdir: str):
+    """
+    Énumère les fichiers à analyser sous forme de (nom, chemin, sha256, erreur).
+    Les archives ZIP sont dépliées membre par membre sur le disque (jamais en mémoire).
+    """
+    for name, path, digest in uploaded:
+        if not zipfile.is_zipfile(path):
+            yield name, path, digest, None
+            continue
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                hasher = hashlib.sha256()
+                try:
+                    with archive.open(info) as member:
+                        member_path = uploads.spool_stream(member, workdir, hasher=hasher)
+                except HTTPException as e:
+                    yield info.filename, None, None, e.detail
+                    continue
+                except Exception as e:
+                    yield info.filename, None, None, f"Membre illisible: {str(e)}"
+                    continue
+                yield info.filename, member_path, hasher.hexdigest(), None
+        os.remove(path)
+
+def _scan_batch_lines(uploaded: list, workdir: str):
+    """Générateur du flux NDJSON de /api/scan/batch (les fichiers temporaires sont supprimés au fil de l'eau)."""
+    db = models.SessionLocal()
+    executor = pool.get_executor()
+    pending = {}  # future -> (nom, chemin, sha256, type)
+    # Nombre borné d'extractions en vol: l'archive est dépliée au rythme du traitement
+    max_in_flight = max(1, config.FINGERPRINT_WORKERS) * 4
+    count = 0
+
+    def finish(future):
+        name, path, digest, file_type = pending.pop(future)
+        os.remove(path)
+        try:
+            candidates, timings = future.result()
+        except Exception as e:
+            return _ndjson({"file": name, "file_type": file_type, "status": "error", "message": str(e)})
+        result = extractor.resolve_leak(db, candidates, timings)
+        verdict = _verdict(db, result, digest, file_type)
+        metrics.observe_timings("scan", timings, file_type=file_type)
+        metrics.inc("leakdetector_scans_total", file_type=file_type, status=verdict["status"], cached="false")
+        return _ndjson({"file": name, "file_type": file_type, **verdict, "timings": timings})
+
+    try:
+        fingerprint_index.refresh(db)
+        for name, path, digest, error in _iter_batch_files(uploaded, workdir):
+            if error:
+                yield _ndjson({"file": name, "status": "error", "message": error})
+                continue
+            count += 1
+            if count > config.BATCH_SCAN_MAX_FILES:
+                os.remove(path)
+                yield _ndjson({"file": name, "status": "error",
+                               "message": f"Limite de {config.BATCH_SCAN_MAX_FILES} fichiers atteinte, fichiers suivants ignorés."})
+                break
+            file_type = formats.detect_file(path, name)
+            if file_type is None:
+                os.remove(path)
+                yield _ndjson({"file": name, "status": "unsupported", "message": "Type de fichier non supporté pour scan."})
+                continue
+            cached = scan_cache.get(db, digest, file_type)
+            if cached is not None:
+                metrics.inc("leakdetector_scans_total", file_type=file_type, status=cached["status"], cached="true")
+                os.remove(path)
+                yield _ndjson({"file": name, "file_type": file_type, **cached})
+                continue
+            pending[executor.submit(extractor.extract_candidates_timed, path, file_type)] = (name, path, digest, file_type)
+            if len(pending) >= max_in_flight:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield finish(future)
+        for future in as_completed(list(pending)):
+            yield finish(future)
+    finally:
+        for future in pending:
+            future.cancel()
+        db.close()
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Depends, Form, Header, HTTPException, Request
+from sqlalchemy.orm import Session
+import os
+
+import models
+from routes import distribute, scan
+from routes.auth import get_api_token
+from services import formats, lanes, metrics, resumable
+from services.uploads import CHUNK_SIZE, UploadTooLarge
+
+router = APIRouter(route_class=lanes.LaneRoute)
+
+# Protocole d'upload reprenable (services/resumable.py), pour les très gros originaux et échantillons de fuite:
+# 1. POST /api/uploads (filename, size, sha256 facultatif): ouvre une session, renvoie upload_id, chunk_size, chunk_count;
+# 2. PUT /api/uploads/{id}/chunks/{n}: corps brut du morceau n (octets n*chunk_size et suivants), en-tête
+#    X-Chunk-Sha256 facultatif mais recommandé; les morceaux peuvent être envoyés dans le désordre et en parallèle,
+#    et renvoyés sans risque après une coupure. Le type du fichier est reconnu dès la réception du morceau 0
+#    (à envoyer en premier): 400 si non supporté, 413 si le fichier dépasse la limite de son format;
+# 3. GET /api/uploads/{id}: morceaux reçus/manquants et position reçue sans trou ("offset"), pour reprendre;
+# 4. POST /api/uploads/{id}/distribute (recipients) ou /api/uploads/{id}/scan (full_scan): le fichier assemblé
+#    est confié au pipeline de /api/distribute ou /api/scan, avec la même réponse.
+# DELETE /api/uploads/{id} abandonne la session.
+
+@router.post("/api/uploads", status_code=201)
+@lanes.endpoint("light")
+def create_upload(filename: str = Form(...), size: int = Form(...), sha256: str = Form(None), token: str = Depends(get_api_token)):
+    """Ouvre une session d'upload reprenable pour un fichier de size octets (RESUMABLE_MAX_SIZE_MB au plus)."""
+    return resumable.status(resumable.create(filename, size, sha256)["upload_id"])
+
+@router.get("/api/uploads/{upload_id}")
+@lanes.endpoint("light")
+def get_upload(upload_id: str, token: str = Depends(get_api_token)):
+    """État de la session: morceaux reçus et manquants, octets reçus sans trou depuis le début ("offset")."""
+    return resumable.status(upload_id)
+
+@router.put("/api/uploads/{upload_id}/chunks/{index}")
+@lanes.admission("light")
+async def put_chunk(upload_id: str, index: int, request: Request, x_chunk_sha256: str = Header(None),
+                    token: str = Depends(get_api_token)):
+    """
+    Reçoit le morceau index d'une session, écrit directement à sa place dans le fichier (par blocs d'au plus 1 Mo,
+    dans la voie "light"). Renvoyer un morceau déjà reçu le remplace: une reprise après coupure est sans risque.
+    """
+    writer = await lanes.run("light", resumable.ChunkWriter, upload_id, index)
+    try:
+        buffer = bytearray()
+        async for data in request.stream():
+            buffer += data
+            if len(buffer) >= CHUNK_SIZE:
+                await lanes.run("light", writer.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await lanes.run("light", writer.write, bytes(buffer))
+        result = await lanes.run("light", writer.commit, x_chunk_sha256)
+    finally:
+        writer.close()
+    metrics.observe("leakdetector_bytes_processed", result["size"], stage="upload.chunk")
+    return result
+
+@router.delete("/api/uploads/{upload_id}")
+@lanes.endpoint("light")
+def delete_upload(upload_id: str, token: str = Depends(get_api_token)):
+    """Abandonne une session d'upload et supprime les morceaux reçus."""
+    resumable.discard(upload_id)
+    return {"detail": "Upload abandonné"}
+
+def _assemble(upload_id: str) -> tuple:
+    """
+    Fichier assemblé d'une session complète et son type: (chemin, nom, SHA-256, type). HTTPException 400/404/409,
+    ou 413 si le fichier dépasse la limite de son format (MAX_PDF_SIZE_MB, MAX_PNG_SIZE_MB, MAX_TXT_SIZE_MB).
+    """
+    with metrics.timer("upload.assemble"):
+        path, filename, digest = resumable.assemble(upload_id)
+    file_type = formats.detect_file(path, filename)
+    if file_type is None:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="Type de fichier non supporté. Veuillez fournir un PDF, PNG ou TXT.")
+    size = os.path.getsize(path)
+    max_size = formats.FORMATS[file_type].max_size
+    if size > max_size:
+        os.remove(path)
+        raise UploadTooLarge(max_size)
+    metrics.observe("leakdetector_bytes_processed", size, stage="upload.assemble", file_type=file_type)
+    return path, filename, digest, file_type
+
+@router.post("/api/uploads/{upload_id}/distribute")
+@lanes.endpoint("cpu")
+def distribute_upload(upload_id: str, recipients: str = Form(...), db: Session = Depends(models.get_db), token: str = Depends(get_api_token)):
+    """Finalise l'upload et distribue le fichier assemblé, comme /api/distribute (201 lazy, 202 eager)."""
+    recip_list = distribute.parse_recipients(recipients)
+    path, filename, digest, file_type = _assemble(upload_id)
+    return distribute.distribute_spooled(db, path, digest, filename, file_type, recip_list)
+
+@router.post("/api/uploads/{upload_id}/scan")
+@lanes.admission("scan")
+async def scan_upload(upload_id: str, full_scan: bool = Form(False), token: str = Depends(get_api_token)):
+    """Finalise l'upload et analyse le fichier assemblé, comme /api/scan (même réponse)."""
+    path, filename, digest, file_type = await lanes.run("scan", _assemble, upload_id)
+    return await scan.scan_spooled(path, digest, file_type, full_scan)
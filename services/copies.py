@@ -0,0 +1,110 @@
+import hashlib, os, time
+
+import config
+from services import formats, metrics, originals, pool
+
+# Copies fingerprintées à la demande (mode "lazy" de COPY_MATERIALIZATION).
+# Une copie est entièrement déterminée par l'original (adressé par son SHA-256) et le jeton enregistré
+# en base: la régénérer produit toujours les mêmes octets. Les copies régénérées sont gardées dans
+# COPY_CACHE_DIR, cache LRU borné à COPY_CACHE_MAX_BYTES (date d'accès = mtime, mise à jour à chaque lecture).
+
+class CopyUnavailable(Exception):
+    """Copie absente du disque et impossible à régénérer (distribution antérieure sans original ni jeton)."""
+
+def _render_tag(file_type: str) -> str:
+    """Empreinte courte de la version et des réglages du rendu (formats.FileFormat.render_identity)."""
+    return hashlib.sha256(formats.FORMATS[file_type].render_identity().encode("utf-8")).hexdigest()[:8]
+
+def _cache_path(dist_file, file_type: str) -> str:
+    # Le nom inclut le rendu: une copie produite avec d'autres réglages (ex: PNG_ZLIB_LEVEL) n'est jamais resservie
+    ext = os.path.splitext(dist_file.file_path)[1] or "." + file_type.lower()
+    return os.path.join(config.COPY_CACHE_DIR, f"{dist_file.id}-{_render_tag(file_type)}{ext}")
+
+def etag(distribution, dist_file) -> str:
+    """
+    ETag d'une copie d'après son identité (original, jeton, version et réglages du rendu), sans lire ni régénérer
+    le fichier: une copie régénérée avec le même rendu est identique octet pour octet. None pour une copie
+    antérieure sans original ni jeton.
+    """
+    if not dist_file.token or not distribution.original_sha256:
+        return None
+    identity = f"{distribution.original_sha256}:{dist_file.token}:{formats.FORMATS[distribution.file_type].render_identity()}"
+    return '"' + hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32] + '"'
+
+def _touch(path: str) -> bool:
+    """Marque une entrée du cache comme récemment utilisée. Retourne False si elle a disparu entre-temps."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def evict(keep=()) -> None:
+    """
+    Supprime les copies les moins récemment utilisées jusqu'à revenir sous COPY_CACHE_MAX_BYTES, sauf celles
+    utilisées depuis moins de COPY_CACHE_GRACE secondes (un téléchargement peut être sur le point de les ouvrir).
+    """
+    entries = []
+    total = 0
+    recent = time.time() - config.COPY_CACHE_GRACE
+    with os.scandir(config.COPY_CACHE_DIR) as it:
+        for entry in it:
+            if not entry.is_file() or ".tmp-" in entry.name:
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+            total += stat.st_size
+    if total <= config.COPY_CACHE_MAX_BYTES:
+        return
+    entries.sort()
+    for mtime, path, size in entries:
+        if total <= config.COPY_CACHE_MAX_BYTES:
+            break
+        if mtime > recent:
+            break  # Copies suivantes (plus récentes encore) peut-être en cours de téléchargement
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def materialize_many(distribution, dist_files: list) -> list:
+    """
+    Renvoie le chemin sur le disque de chaque copie (dans l'ordre de dist_files), en régénérant celles qui manquent.
+    - Copie écrite par un worker (mode "eager" ou distribution antérieure): servie telle quelle.
+    - Sinon: cache disque, puis régénération depuis l'original et le jeton (réparties sur le pool de processus).
+    """
+    paths = [None] * len(dist_files)
+    missing = []
+    for index, dist_file in enumerate(dist_files):
+        if dist_file.file_path and os.path.isfile(dist_file.file_path):
+            paths[index] = dist_file.file_path
+            metrics.inc("leakdetector_copy_cache_total", result="stored")
+            continue
+        cache_path = _cache_path(dist_file, distribution.file_type)
+        if _touch(cache_path):
+            paths[index] = cache_path
+            metrics.inc("leakdetector_copy_cache_total", result="hit")
+            continue
+        metrics.inc("leakdetector_copy_cache_total", result="miss")
+        if not dist_file.token or not distribution.original_sha256:
+            raise CopyUnavailable(f"Copie {dist_file.id} introuvable et non régénérable.")
+        missing.append((index, dist_file.token, cache_path))
+    if missing:
+        source_path = originals.path_for(distribution.original_sha256)
+        if not os.path.isfile(source_path):
+            raise CopyUnavailable(f"Original de la distribution {distribution.id} introuvable.")
+        with metrics.timer("copies.materialize", file_type=distribution.file_type):
+            # Cache régénérable: pas de synchronisation sur le disque
+            pool.fingerprint_all(source_path, distribution.file_type, [(token, path) for _, token, path in missing], durable=False)
+        for index, _, cache_path in missing:
+            paths[index] = cache_path
+        with metrics.timer("copies.evict"):
+            evict(keep=set(paths))
+    return paths
+
+def materialize(distribution, dist_file) -> str:
+    """Renvoie le chemin sur le disque d'une copie, régénérée si nécessaire."""
+    return materialize_many(distribution, [dist_file])[0]
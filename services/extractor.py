@@ -1,189 +1,51 @@
-import io, re
-from PIL import Image
-import fitz  # PyMuPDF for PDF
+import time
 import models, crypto
-from services.injector import ZERO_WIDTH_0, ZERO_WIDTH_1
+from services import fingerprint_index, formats, lanes
+from services.metrics import elapsed_ms
 
-def extract_fingerprint_from_pdf(pdf_bytes: bytes) -> str:
-    """Extrait la chaîne d'empreinte cachée dans un PDF (dans les métadonnées ou le texte)."""
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    fingerprint = None
-    # 1. Vérifier dans les métadonnées du PDF
-    meta = doc.metadata
-    if meta.get("fingerprint"):
-        fingerprint = meta.get("fingerprint")
-    # 2. Si non trouvée en metadata, extraire le texte et chercher une séquence base64
-    if not fingerprint:
-        # Extraire le texte de toutes les pages (le texte invisible inséré devrait apparaître)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        # Chercher une sous-chaîne ressemblant à du base64 (longueur >= 16):contentReference[oaicite:4]{index=4}
-        candidates = re.findall(r'[A-Za-z0-9+/=]{16,}', text)
-        for cand in candidates:
-            try:
-                # On tente de déchiffrer chaque candidat pour voir si c'est un fingerprint valide
-                crypto.decrypt_data(cand)
-                fingerprint = cand
-                break  # on prend le premier candidat valide
-            except Exception:
-                continue
-    doc.close()
-    return fingerprint  # Peut être None si aucune empreinte trouvée ou valide
+# Résolution d'un fichier suspect: jetons candidats extraits par le module de son format (services/formats.py),
+# puis index des jetons émis, déchiffrement en dernier recours.
 
-def extract_fingerprint_from_png(image_bytes: bytes) -> str:
-    """Extrait la chaîne d'empreinte cachée dans une image PNG via LSB steganography."""
-    image = Image.open(io.BytesIO(image_bytes))
-    image = image.convert("RGBA")
-    pixels = image.load()
-    width, height = image.size
-    bits = []
-    # On parcourt les pixels (en assumant qu'on a un bit caché par pixel, canal rouge)
-    # Récupérer d'abord les 16 premiers bits pour la longueur
-    bit_count = 0
-    length = 0
-    # Lecture des 16 bits de longueur
-    for y in range(height):
-        for x in range(width):
-            r, g, b, a = pixels[x, y]
-            bits.append(r & 1)  # récupérer le LSB du rouge
-            bit_count += 1
-            if bit_count == 16:
-                # Calculer la longueur en int à partir des 16 bits récupérés
-                length_bits = bits[:16]
-                length = 0
-                for bit in length_bits:
-                    length = (length << 1) | bit
-                break
-        if bit_count == 16:
-            break
-    if length <= 0:
-        return None  # aucune empreinte trouvée
-    # Récupération des bits de données selon la longueur lue (8 bits par caractère)
-    data_bits = []
-    needed_bits = length * 8
-    bits_collected = 0
-    # Continuer là où on s'est arrêté
-    for y in range(height):
-        for x in range(width):
-            if bits_collected >= needed_bits:
-                break
-            # Ignorer les 16 bits déjà lus (on commence après)
-            if y == 0 and x < 2:  # Note: on a cassé à x after reading 16 bits; cette simplification marche si 16 bits <= first row pixels.
-                # Correction: pour être robuste, calculer un offset précis:
-                pass
-            r, g, b, a = pixels[x, y]
-            if bit_count < 16:
-                # (skip initial length bits reading)
-                bit_count += 1
-                continue
-            data_bits.append(r & 1)
-            bits_collected += 1
-            bit_count += 1
-            if bits_collected >= needed_bits:
-                break
-        if bits_collected >= needed_bits:
-            break
-    # Regrouper les bits en caractères ASCII
-    data_bytes = bytearray()
-    for i in range(0, len(data_bits), 8):
-        byte = 0
-        for b in data_bits[i:i+8]:
-            byte = (byte << 1) | b
-        data_bytes.append(byte)
-    try:
-        fingerprint = data_bytes.decode('ascii')
-    except Exception:
-        fingerprint = None
-    return fingerprint
+def extract_candidates(source, file_type: str, full_scan: bool = False, accept=None, timings: dict = None) -> list:
+    """
+    Jetons candidats d'un fichier, sans accès à la base (utilisable dans un processus worker).
+    PNG et TXT portent au plus un jeton; pour un PDF, voir services/pdf.py, candidates (accept, full_scan).
+    Les durées de chaque étape (ms) sont ajoutées à timings si fourni.
+    """
+    if timings is None:
+        timings = {}
+    if file_type not in formats.FORMATS:
+        return []
+    return formats.get(file_type).candidates(source, full_scan=full_scan, accept=accept, timings=timings)
 
-def extract_fingerprint_from_txt(text_bytes: bytes) -> str:
-    """Extrait la chaîne d'empreinte cachée dans un fichier texte en utilisant les caractères invisibles."""
-    try:
-        text = text_bytes.decode('utf-8')
-    except UnicodeDecodeError:
-        text = text_bytes.decode('latin-1', errors='ignore')
-    # On recherche les caractères invisibles ZERO_WIDTH_0 et ZERO_WIDTH_1
-    if ZERO_WIDTH_0 not in text and ZERO_WIDTH_1 not in text:
-        return None  # Pas d'empreinte
-    # Isoler la séquence cachée (après le dernier caractère visible du texte)
-    # On ignore les sauts de ligne et espaces de fin
-    i = len(text) - 1
-    while i >= 0 and text[i] in [ZERO_WIDTH_0, ZERO_WIDTH_1, '\n', '\r', ' ', '\t']:
-        i -= 1
-    hidden_seq = text[i+1:]
-    # Extraire les bits de la séquence invisible
-    bits = []
-    for ch in hidden_seq:
-        if ch == ZERO_WIDTH_0:
-            bits.append(0)
-        elif ch == ZERO_WIDTH_1:
-            bits.append(1)
-    if len(bits) < 16:
-        return None
-    # Lire la longueur encodée sur les 16 premiers bits
-    length_bits = bits[:16]
-    length = 0
-    for bit in length_bits:
-        length = (length << 1) | bit
-    if length <= 0:
-        return None
-    # Lire les bits de données (8 * longueur caractères)
-    data_bits = bits[16:16 + length * 8]
-    data_bytes = bytearray()
-    for j in range(0, len(data_bits), 8):
-        byte = 0
-        for b in data_bits[j:j+8]:
-            byte = (byte << 1) | b
-        data_bytes.append(byte)
-    try:
-        fingerprint = data_bytes.decode('ascii')
-    except Exception:
-        fingerprint = None
-    return fingerprint
+def extract_candidates_timed(source, file_type: str):
+    """Variante de extract_candidates renvoyant (candidats, timings), pour une exécution dans un processus worker."""
+    timings = {}
+    return extract_candidates(source, file_type, timings=timings), timings
 
-def identify_leak(file_bytes: bytes, file_type: str, db_session):
+def decode_fingerprint(source, file_type: str, full_scan: bool = False, timings: dict = None):
     """
-    Tente d'identifier le destinataire source d'une fuite en analysant un fichier.
-    - Extrait l'empreinte via la méthode appropriée.
-    - Décrypte l'empreinte pour obtenir les données d'identification (ex: IDs).
-    - Vérifie le HMAC (via decrypt_data) pour s'assurer de l'authenticité.
-    - Retourne un tuple (distribution_obj, distribution_file_obj) si une correspondance est trouvée.
+    Extrait et déchiffre l'empreinte d'un fichier, sans accès à la base.
+    - Décrypte l'empreinte (jeton v2, ou v1 des distributions antérieures) pour obtenir les IDs.
+    - Le tag GCM (et le HMAC d'un jeton v1) garantit l'authenticité.
+    - Retourne un tuple (dist_id, file_id) (dist_id pouvant être None), ou None si aucune empreinte valide.
     """
-    fingerprint = None
-    # Extraire l'empreinte selon le type de fichier
-    if file_type == "PDF":
-        fingerprint = extract_fingerprint_from_pdf(file_bytes)
-    elif file_type == "PNG":
-        fingerprint = extract_fingerprint_from_png(file_bytes)
-    elif file_type == "TXT":
-        fingerprint = extract_fingerprint_from_txt(file_bytes)
-    if not fingerprint:
+    if timings is None:
+        timings = {}
+    candidates = extract_candidates(source, file_type, full_scan=full_scan, accept=crypto.is_authentic, timings=timings)
+    if not candidates:
         return None  # aucune empreinte trouvée
-    # Déchiffrer l'empreinte (vérification d'authenticité incluse)
+    # Déchiffrer l'empreinte (vérification d'authenticité incluse, jetons v2 et v1)
+    start = time.perf_counter()
     try:
-        plaintext = crypto.decrypt_data(fingerprint)  # bytes
+        return crypto.decode_token(candidates[0])
     except Exception:
         return None  # empreinte trouvée mais invalide (tag/HMAC faux)
-    # Le plaintext contient l'identifiant du fichier distribué (distribution_file_id) possiblement précédé de distribution_id
-    try:
-        data_str = plaintext.decode('utf-8')
-    except UnicodeDecodeError:
-        data_str = plaintext.decode('latin-1', errors='ignore')
-    # On s'attend à un format "dist_id:file_id" ou juste un identifiant unique
-    dist_id = None
-    file_id = None
-    if ":" in data_str:
-        parts = data_str.split(":")
-        if len(parts) == 2:
-            dist_id = int(parts[0])
-            file_id = int(parts[1])
-    else:
-        # Si pas de ":", on interprète tout comme l'ID du DistributionFile
-        file_id = int(data_str) if data_str.isdigit() else None
-    if file_id is None:
-        return None
-    # Rechercher en base l'enregistrement correspondant
+    finally:
+        timings["decrypt"] = elapsed_ms(start)
+
+def lookup_leak(db_session, dist_id, file_id):
+    """Recherche en base la copie correspondant aux IDs déchiffrés. Retourne (distribution, copie) ou None."""
     file_entry = db_session.query(models.DistributionFile).get(file_id)
     if not file_entry:
         return None
@@ -192,3 +54,99 @@ def identify_leak(file_bytes: bytes, file_type: str, db_session):
     if dist_id is not None and dist_entry.id != dist_id:
         return None  # Incohérence improbable si tout va bien
     return dist_entry, file_entry
+
+def resolve_leak(db_session, candidates: list, timings: dict = None):
+    """
+    Résout des jetons candidats en (distribution, copie), ou None.
+    L'index des jetons émis répond sans déchiffrement; le déchiffrement n'est tenté qu'en dernier recours,
+    tant qu'il reste des copies antérieures à l'index (jetons non enregistrés).
+    """
+    if timings is None:
+        timings = {}
+    start = time.perf_counter()
+    result = fingerprint_index.lookup(db_session, candidates) if candidates else None
+    timings["index"] = elapsed_ms(start)
+    if result is None and candidates and fingerprint_index.has_legacy():
+        result = _decrypt_leak(db_session, candidates, timings)
+    return result
+
+def _decrypt_leak(db_session, candidates: list, timings: dict):
+    """Dernier recours pour les copies non indexées: déchiffre chaque candidat et recherche la copie par ses IDs."""
+    start = time.perf_counter()
+    result = None
+    for cand in candidates:
+        try:
+            ids = crypto.decode_token(cand)
+        except Exception:
+            continue
+        result = lookup_leak(db_session, *ids)
+        if result:
+            break
+    timings["decrypt"] = elapsed_ms(start)
+    return result
+
+def _decrypt_leak_own_session(candidates: list, timings: dict):
+    db_session = models.SessionLocal()
+    try:
+        return _decrypt_leak(db_session, candidates, timings)
+    finally:
+        db_session.close()
+
+def identify_leak(source, file_type: str, db_session, full_scan: bool = False, timings: dict = None):
+    """
+    Tente d'identifier le destinataire source d'une fuite en analysant un fichier (octets ou chemin sur le disque).
+    Les candidats sont filtrés par le filtre de Bloom de l'index (aucune requête pour une chaîne étrangère).
+    Retourne un tuple (distribution_obj, distribution_file_obj) si une correspondance est trouvée.
+    """
+    fingerprint_index.refresh(db_session)
+    legacy = fingerprint_index.has_legacy()
+    hits = {}
+
+    def accept(token: str) -> bool:
+        # Filtre de Bloom d'abord (sans requête; déchiffrement seulement hors du filtre), confirmé par l'index:
+        # un faux positif n'arrête pas la recherche. Le déchiffrement n'est tenté que s'il reste des copies non indexées.
+        if not fingerprint_index.might_contain(token):
+            return False  # ni dans le filtre, ni authentique
+        result = fingerprint_index.lookup(db_session, [token])
+        if result:
+            hits[token] = result
+            return True
+        return legacy and crypto.is_authentic(token)
+
+    candidates = extract_candidates(source, file_type, full_scan=full_scan, accept=accept, timings=timings)
+    if candidates and candidates[0] in hits:
+        return hits[candidates[0]]
+    return resolve_leak(db_session, candidates, timings)
+
+async def identify_leak_async(source, file_type: str, full_scan: bool = False, timings: dict = None):
+    """
+    Variante de identify_leak pour un endpoint asynchrone: l'extraction (calcul) s'exécute dans la voie "scan",
+    les lectures de l'index passent par le moteur asynchrone (models.read), sans thread bloqué sur la base.
+    Le filtre de Bloom seul décide de l'arrêt du parcours d'un PDF; un faux positif, écarté par l'index,
+    relance le parcours en l'ignorant.
+    """
+    if timings is None:
+        timings = {}
+    await fingerprint_index.refresh_async()
+    legacy = fingerprint_index.has_legacy()
+    rejected = set()
+
+    def accept(token: str) -> bool:
+        if token in rejected:
+            return False
+        # Un jeton authentique passe toujours might_contain (copies non indexées comprises)
+        return fingerprint_index.might_contain(token)
+
+    while True:
+        candidates = await lanes.run("scan", extract_candidates, source, file_type, full_scan, accept, timings)
+        if not candidates:
+            return None
+        start = time.perf_counter()
+        result = await fingerprint_index.lookup_async(candidates)
+        timings["index"] = elapsed_ms(start)
+        if result is None and legacy:
+            result = await lanes.run("scan", _decrypt_leak_own_session, candidates, timings)
+        # PNG/TXT: un seul jeton possible; PDF: on ne relance que si le parcours s'est arrêté sur un faux positif
+        if result is not None or legacy or file_type != "PDF":
+            return result
+        rejected.update(candidates)
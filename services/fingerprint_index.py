@@ -0,0 +1,198 @@
+import math, threading, time
+from sqlalchemy import exists, select
+from sqlalchemy.exc import IntegrityError
+
+import config, crypto, models
+from services import lanes
+from models import Distribution, DistributionFile, FingerprintIndex
+
+# Index des jetons émis, pour résoudre un scan sans aucun déchiffrement:
+# - table fingerprint_index: hachage à clé (crypto.token_hash) de chaque jeton -> copie distribuée;
+# - filtre de Bloom en mémoire (par processus) sur ces hachages: une chaîne qui n'est pas un de nos jetons
+#   est écartée sans requête (faux positifs ~FINGERPRINT_BLOOM_FP_RATE).
+# Le filtre est construit au démarrage, complété à chaque distribution faite par ce processus, et reconstruit
+# depuis la table toutes les FINGERPRINT_INDEX_REFRESH secondes (distributions des autres processus). Entre deux
+# reconstructions, il peut manquer des jetons émis ailleurs: un candidat absent du filtre n'est donc écarté que s'il
+# ne se déchiffre pas avec notre clé (AES-GCM, sans requête); un jeton authentique est toujours cherché dans la
+# table (une sonde de l'index unique): jamais de faux négatif, même juste après une distribution d'un autre processus.
+# Les copies supprimées laissent leurs bits dans le filtre: simples faux positifs, tranchés par la requête.
+# Les copies antérieures à l'enregistrement des jetons (token NULL) ne sont pas indexables: tant qu'il en existe,
+# un scan sans correspondance dans l'index retombe sur le déchiffrement (voir extractor.resolve_leak).
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_state = {"bits": None, "size": 0, "hashes": 0, "capacity": 0, "count": 0, "refreshed_at": 0.0, "legacy": True}
+
+def _positions(token_hash: str, size: int, hashes: int):
+    # Le hachage à clé est déjà uniforme: double hachage à partir de deux tranches de 64 bits
+    h1 = int(token_hash[:16], 16)
+    h2 = int(token_hash[16:32], 16) | 1
+    return [(h1 + i * h2) % size for i in range(hashes)]
+
+def _add(token_hash: str) -> None:
+    bits = _state["bits"]
+    for pos in _positions(token_hash, _state["size"], _state["hashes"]):
+        bits[pos >> 3] |= 1 << (pos & 7)
+    _state["count"] += 1
+
+def _contains(token_hash: str) -> bool:
+    bits = _state["bits"]
+    if bits is None:
+        return True  # filtre pas encore construit: on laisse la base trancher
+    return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in _positions(token_hash, _state["size"], _state["hashes"]))
+
+def rebuild(db, capacity: int = None) -> None:
+    """(Re)construit le filtre à partir de toute la table (au démarrage, périodiquement, ou à sa capacité)."""
+    started = time.monotonic()
+    count = db.query(FingerprintIndex.id).count()
+    capacity = max(capacity or 0, 2 * count, 100000)
+    size = max(8, math.ceil(-capacity * math.log(config.FINGERPRINT_BLOOM_FP_RATE) / (math.log(2) ** 2)))
+    hashes = max(1, round(size / capacity * math.log(2)))
+    legacy = db.query(exists().where(DistributionFile.token.is_(None))).scalar()
+    # Nouveau filtre construit à part puis substitué d'un bloc: les scans en cours ne voient jamais un filtre partiel
+    bits = bytearray((size + 7) // 8)
+    added = 0
+    for (token_hash,) in db.query(FingerprintIndex.token_hash).yield_per(10000):
+        for pos in _positions(token_hash, size, hashes):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        added += 1
+    with _lock:
+        _state.update(bits=bits, size=size, hashes=hashes, capacity=capacity, count=added,
+                      legacy=legacy, refreshed_at=started)
+
+def _refresh_due() -> bool:
+    return (_state["bits"] is None or _state["count"] > _state["capacity"]
+            or time.monotonic() - _state["refreshed_at"] >= config.FINGERPRINT_INDEX_REFRESH)
+
+def refresh(db) -> None:
+    """Reconstruit le filtre si la dernière construction date de plus de FINGERPRINT_INDEX_REFRESH secondes."""
+    if not _refresh_due():
+        return
+    # Une seule reconstruction à la fois; les autres requêtes n'attendent pas: le filtre courant reste exact,
+    # les jetons qui lui manquent sont rattrapés par leur authenticité (voir _plausible)
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        if _refresh_due():
+            rebuild(db, 2 * _state["count"])
+    finally:
+        _refresh_lock.release()
+
+async def refresh_async() -> None:
+    """Comme refresh, depuis un endpoint asynchrone: rien à faire la plupart du temps, sinon dans la voie "light"."""
+    if _refresh_due():
+        await lanes.run("light", _refresh_own_session)
+
+def _refresh_own_session() -> None:
+    db = models.SessionLocal()
+    try:
+        refresh(db)
+    finally:
+        db.close()
+
+def index_rows(rows: list) -> list:
+    """Lignes fingerprint_index pour des copies (dicts avec "id" et "token"), à insérer dans la même transaction."""
+    return [{"token_hash": crypto.token_hash(row["token"]), "distribution_file_id": row["id"]} for row in rows]
+
+def remember(rows: list) -> None:
+    """Ajoute tout de suite au filtre local les jetons que ce processus vient d'indexer (après le commit)."""
+    with _lock:
+        if _state["bits"] is not None:
+            for row in rows:
+                _add(row["token_hash"])
+
+def _plausible(token: str, token_hash: str) -> bool:
+    # Présent dans le filtre, ou absent mais authentique (émis depuis la dernière reconstruction, par un autre processus)
+    return _contains(token_hash) or crypto.is_authentic(token)
+
+def might_contain(token: str) -> bool:
+    """Test sans requête: False garantit que ce jeton n'a pas été émis (hors copies antérieures à l'index)."""
+    return _plausible(token, crypto.token_hash(token))
+
+def has_legacy() -> bool:
+    """Indique s'il reste des copies sans jeton enregistré (non résolubles par l'index)."""
+    return _state["legacy"]
+
+def _lookup_statement(candidates: list):
+    """(hachages plausibles d'après le filtre, requête jointe index + copie + distribution), ou (liste vide, None)."""
+    maybe = []
+    for token in candidates:
+        token_hash = crypto.token_hash(token)
+        if _plausible(token, token_hash):
+            maybe.append(token_hash)
+    if not maybe:
+        return maybe, None
+    statement = (select(FingerprintIndex.token_hash, Distribution, DistributionFile)
+                 .join(DistributionFile, DistributionFile.id == FingerprintIndex.distribution_file_id)
+                 .join(Distribution, Distribution.id == DistributionFile.distribution_id)
+                 .filter(FingerprintIndex.token_hash.in_(maybe)))
+    return maybe, statement
+
+def _first_found(maybe: list, rows):
+    found = {token_hash: (distribution, dist_file) for token_hash, distribution, dist_file in rows}
+    for token_hash in maybe:
+        if token_hash in found:
+            return found[token_hash]
+    return None
+
+def lookup(db, candidates: list):
+    """
+    Résout des jetons candidats en une seule requête indexée (index + copie + distribution jointes).
+    Retourne (distribution, copie) du premier candidat émis par nous, ou None.
+    """
+    maybe, statement = _lookup_statement(candidates)
+    if statement is None:
+        return None
+    return _first_found(maybe, db.execute(statement).all())
+
+async def lookup_async(candidates: list):
+    """Comme lookup, depuis un endpoint asynchrone (models.read): objets détachés de leur session."""
+    maybe, statement = _lookup_statement(candidates)
+    if statement is None:
+        return None
+    return _first_found(maybe, await models.read(statement))
+
+def _insert_ignoring_duplicates(db, rows: list) -> int:
+    """Insère des lignes d'index, en ignorant celles déjà insérées par un autre processus. Retourne le nombre inséré."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        try:
+            db.execute(FingerprintIndex.__table__.insert(), rows)
+            db.commit()
+            return len(rows)
+        except IntegrityError:
+            db.rollback()
+            return 0
+    result = db.execute(insert(FingerprintIndex.__table__).on_conflict_do_nothing(), rows)
+    db.commit()
+    return result.rowcount
+
+def backfill(db, batch_size: int = 1000) -> int:
+    """
+    Indexe les copies dont le jeton est enregistré mais absent de l'index (distributions antérieures). Retourne leur nombre.
+    Étape de migration (models.create_schema); plusieurs processus peuvent la lancer en même temps sans conflit.
+    """
+    total = 0
+    while True:
+        rows = (db.query(DistributionFile.id, DistributionFile.token)
+                .outerjoin(FingerprintIndex, FingerprintIndex.distribution_file_id == DistributionFile.id)
+                .filter(DistributionFile.token.isnot(None), FingerprintIndex.id.is_(None))
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return total
+        inserted = _insert_ignoring_duplicates(db, index_rows([{"id": i, "token": t} for i, t in rows]))
+        if inserted <= 0:
+            # Lot entièrement indexé entre-temps par un autre processus, ou jetons en double: ne pas boucler
+            return total
+        total += inserted
+
+def stats() -> dict:
+    """État du filtre du processus courant."""
+    with _lock:
+        return {"entries": _state["count"], "capacity": _state["capacity"], "bits": _state["size"],
+                "hashes": _state["hashes"], "legacy_copies": _state["legacy"]}
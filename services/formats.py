@@ -0,0 +1,112 @@
+import importlib, os
+
+import config
+
+# Registre des formats de fichier supportés. Chaque format déclare ses signatures (octets magiques) et le module
+# qui l'implémente; ce module n'est importé qu'au premier fichier de ce format: démarrer le service (ou un worker)
+# ne charge ni PyMuPDF, ni PIL, ni NumPy, et un traitement purement texte ne les charge jamais.
+# Chaque module de format fournit:
+# - prepare(chemin): gabarit de l'original, dont render_parts(empreinte) produit une copie (services/pool.py);
+# - candidates(source, full_scan, accept, timings): jetons candidats d'un fichier suspect (services/extractor.py).
+# Les sources des extracteurs sont des octets ou le chemin d'un fichier sur le disque (upload déjà écrit par
+# routes/scan): dans ce cas PyMuPDF et PIL lisent le fichier directement, sans copie en mémoire.
+
+# Nombre d'octets lus en tête de fichier pour la détection du type
+SNIFF_SIZE = 8192
+
+class FileFormat:
+    """Format supporté: signatures (octets, fenêtre de recherche en tête de fichier), extensions, module d'implémentation."""
+
+    def __init__(self, name: str, module: str, signatures: tuple = (), extensions: tuple = (), text: bool = False,
+                 render_version: int = 1, render_settings: tuple = (), max_size_setting: str = "MAX_FILE_SIZE"):
+        self.name = name
+        self.module_name = module
+        # (octets, fenêtre): signature en tout début de fichier (fenêtre 0) ou dans les `fenêtre` premiers octets
+        self.signatures = signatures
+        self.extensions = extensions
+        # Format texte: aucune signature, reconnu à un début de fichier en UTF-8 valide (après tous les formats binaires)
+        self.text = text
+        # Rendu des copies: version (à incrémenter quand le module produit d'autres octets pour une même empreinte)
+        # et noms des réglages de config qui changent ces octets
+        self.render_version = render_version
+        self.render_settings = render_settings
+        # Réglage de config donnant la taille maximale d'un fichier de ce format (uploads reprenables)
+        self.max_size_setting = max_size_setting
+        self._module = None
+
+    def matches(self, head: bytes) -> bool:
+        for signature, window in self.signatures:
+            if head.startswith(signature) if window == 0 else signature in head[:window]:
+                return True
+        return False
+
+    def render_identity(self) -> str:
+        """Version et réglages du rendu des copies de ce format (ETag et cache des copies), sans importer le module."""
+        values = [str(getattr(config, name)) for name in self.render_settings]
+        return ":".join([self.name, str(self.render_version)] + values)
+
+    @property
+    def max_size(self) -> int:
+        """Taille maximale (octets) d'un fichier de ce format."""
+        return getattr(config, self.max_size_setting)
+
+    @property
+    def module(self):
+        """Module d'implémentation, importé au premier usage."""
+        if self._module is None:
+            self._module = importlib.import_module(self.module_name)
+        return self._module
+
+FORMATS = {
+    "PNG": FileFormat("PNG", "services.png", signatures=((b"\x89PNG\r\n\x1a\n", 0),), extensions=(".png",),
+                      render_settings=("PNG_ZLIB_LEVEL", "PNG_TEMPLATE_MAX_PAYLOAD"), max_size_setting="MAX_PNG_SIZE"),
+    # Les lecteurs PDF tolèrent des octets parasites avant l'en-tête %PDF-
+    "PDF": FileFormat("PDF", "services.pdf", signatures=((b"%PDF-", 1024),), extensions=(".pdf",),
+                      max_size_setting="MAX_PDF_SIZE"),
+    "TXT": FileFormat("TXT", "services.txt", extensions=(".txt",), text=True, max_size_setting="MAX_TXT_SIZE"),
+}
+
+def get(file_type: str):
+    """Module d'implémentation d'un format ("PDF", "PNG", "TXT"), importé au premier usage."""
+    file_format = FORMATS.get(file_type)
+    if file_format is None:
+        raise ValueError(f"Type de fichier non supporté: {file_type}")
+    return file_format.module
+
+def sniff(head: bytes, filename: str = "") -> str:
+    """
+    Détermine le type d'un fichier d'après ses premiers octets (signature, ou texte UTF-8), l'extension du nom ne
+    servant qu'à reconnaître un fichier texte vide ou dans un autre encodage (.txt).
+    Retourne "PDF", "PNG", "TXT" ou None si le format n'est pas supporté.
+    """
+    for file_format in FORMATS.values():
+        if file_format.matches(head):
+            return file_format.name
+    extension = os.path.splitext(filename or "")[1].lower()
+    for file_format in FORMATS.values():
+        if file_format.text and ((head and _is_utf8_text(head)) or extension in file_format.extensions):
+            return file_format.name
+    return None
+
+def _is_utf8_text(head: bytes) -> bool:
+    """Début de fichier décodable en UTF-8 et sans octet nul (un caractère coupé en fin de tête est toléré)."""
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        # Caractère multi-octets tronqué par la lecture des SNIFF_SIZE premiers octets (au plus 3 octets en fin)
+        return e.reason == "unexpected end of data" and e.start >= len(head) - 3
+
+def detect_file(path: str, filename: str = "") -> str:
+    """Type d'un fichier sur le disque (voir sniff)."""
+    with open(path, "rb") as f:
+        return sniff(f.read(SNIFF_SIZE), filename)
+
+def detect_upload(upload) -> str:
+    """Type d'un fichier uploadé (UploadFile déjà reçu), d'après son contenu; le fichier est rembobiné."""
+    upload.file.seek(0)
+    head = upload.file.read(SNIFF_SIZE)
+    upload.file.seek(0)
+    return sniff(head, upload.filename)
@@ -0,0 +1,198 @@
+import os, re, time, logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_, and_
+
+import config, crypto, models
+from models import Distribution, DistributionFile, DistributionJob, DistributionJobItem, FingerprintIndex
+from services import fingerprint_index, metrics, originals, pool, scan_cache, storage
+
+# File de tâches de distribution stockée uniquement dans Postgres.
+# Utilisée seulement en mode COPY_MATERIALIZATION="eager" (en mode "lazy", les copies sont régénérées
+# au téléchargement, voir services/copies.py).
+# - L'API enregistre la distribution, réserve les IDs des copies et crée un item par destinataire.
+# - Les workers (worker.py, autant de processus/hôtes que nécessaire) réclament des lots d'items avec
+#   SELECT ... FOR UPDATE SKIP LOCKED: deux workers ne prennent jamais le même item, sans verrou global.
+# - Un item réclamé porte un bail (claimed_at): si le worker disparaît, l'item est repris après JOB_LEASE_SECONDS.
+
+logger = logging.getLogger(__name__)
+
+def enqueue_distribution(db, original_sha256: str, filename: str, file_type: str, recipients: list) -> tuple:
+    """
+    Enregistre une distribution (original déjà rangé dans ORIGINALS_DIR) et le jeton de chaque copie, en une transaction.
+    Les lignes DistributionFile sont créées tout de suite (IDs réservés, jetons chiffrés, chemins de sortie connus).
+    En mode "eager", une tâche de fingerprinting est aussi créée: les copies sont produites ensuite par les workers.
+    Retourne (distribution, tâche ou None en mode "lazy").
+    """
+    distribution = Distribution(file_name=filename, file_type=file_type, original_sha256=original_sha256)
+    db.add(distribution)
+    db.flush()
+    # Réserver d'un coup les IDs de toutes les copies (une seule requête sur la séquence)
+    file_ids = models.reserve_ids(db, DistributionFile, len(recipients))
+    file_rows = []
+    name_noext, ext = os.path.splitext(filename)
+    with metrics.timer("distribute.encrypt", file_type=file_type):
+        for recipient, file_id in zip(recipients, file_ids):
+            # Nettoyer le nom du destinataire pour l'utiliser dans le nom de fichier
+            safe_recipient = re.sub(r'[^A-Za-z0-9_-]', '_', recipient)
+            # Arborescence répartie par hachage de l'ID (services/storage.py): le nom sert au téléchargement
+            output_path = storage.copy_path(file_id, f"{name_noext}_{safe_recipient}_{file_id}{ext}")
+            # Jeton chiffré une fois pour toutes: toute régénération de la copie redonne les mêmes octets
+            token = crypto.encode_token(distribution.id, file_id)
+            file_rows.append({"id": file_id, "distribution_id": distribution.id, "recipient": recipient,
+                              "file_path": output_path, "token": token})
+        index_rows = fingerprint_index.index_rows(file_rows)
+    with metrics.timer("distribute.db_commit", file_type=file_type):
+        # Insertions groupées: copies et index des jetons émis
+        db.execute(DistributionFile.__table__.insert(), file_rows)
+        db.execute(FingerprintIndex.__table__.insert(), index_rows)
+        job = None
+        if config.COPY_MATERIALIZATION == "eager":
+            job = DistributionJob(distribution_id=distribution.id, file_type=file_type,
+                                  source_path=originals.path_for(original_sha256),
+                                  status="pending", total=len(file_rows), done=0)
+            db.add(job)
+            db.flush()
+            db.execute(DistributionJobItem.__table__.insert(), [
+                {"job_id": job.id, "distribution_file_id": row["id"], "output_path": row["file_path"], "status": "pending"}
+                for row in file_rows
+            ])
+        db.commit()
+    metrics.observe("leakdetector_recipients_per_distribution", len(file_rows), file_type=file_type)
+    fingerprint_index.remember(index_rows)
+    return distribution, job
+
+def job_status(job: DistributionJob) -> dict:
+    """Représentation JSON de l'avancement d'une tâche."""
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "distribution_id": job.distribution_id,
+        "total": job.total,
+        "done": job.done,
+        "progress": round(job.done / job.total, 4) if job.total else 1.0,
+        "error": job.error,
+        "created_at": job.created_at.strftime("%Y-%m-%d %H:%M:%S") if job.created_at else None,
+    }
+
+def claim_items(db, limit: int) -> tuple:
+    """
+    Réclame jusqu'à limit items en attente (ou dont le bail a expiré) et les passe à l'état "running".
+    Retourne (items, horodatage du bail), chaque item étant un tuple (item_id, job_id, distribution_file_id, output_path).
+    """
+    now = datetime.utcnow()
+    lease_expired = now - timedelta(seconds=config.JOB_LEASE_SECONDS)
+    items = (db.query(DistributionJobItem)
+             .filter(or_(DistributionJobItem.status == "pending",
+                         and_(DistributionJobItem.status == "running", DistributionJobItem.claimed_at < lease_expired)))
+             .order_by(DistributionJobItem.id)
+             .limit(limit)
+             .with_for_update(skip_locked=True)
+             .all())
+    claimed = [(item.id, item.job_id, item.distribution_file_id, item.output_path) for item in items]
+    if claimed:
+        db.execute(update(DistributionJobItem.__table__)
+                   .where(DistributionJobItem.id.in_([c[0] for c in claimed]))
+                   .values(status="running", claimed_at=now))
+        db.execute(update(DistributionJob.__table__)
+                   .where(DistributionJob.id.in_({c[1] for c in claimed}), DistributionJob.status == "pending")
+                   .values(status="running", updated_at=now))
+    db.commit()
+    return claimed, now
+
+def _remove_files(paths) -> None:
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def fail_job(db, job_id: int, error: str) -> None:
+    """
+    Marque une tâche en échec et annule toute la distribution: items restants annulés,
+    lignes Distribution/DistributionFile supprimées (cascade), fichiers produits effacés
+    (et l'original, s'il n'est partagé avec aucune autre distribution).
+    """
+    db.rollback()
+    job = db.query(DistributionJob).get(job_id)
+    if job is None or job.status == "failed":
+        return
+    output_paths = [path for (path,) in db.query(DistributionJobItem.output_path).filter(DistributionJobItem.job_id == job_id)]
+    db.execute(update(DistributionJobItem.__table__)
+               .where(DistributionJobItem.job_id == job_id, DistributionJobItem.status.in_(["pending", "running"]))
+               .values(status="cancelled"))
+    original_sha256 = None
+    if job.distribution_id is not None:
+        original_sha256 = db.query(Distribution.original_sha256).filter(Distribution.id == job.distribution_id).scalar()
+        db.query(Distribution).filter(Distribution.id == job.distribution_id).delete(synchronize_session=False)
+        scan_cache.invalidate_distribution(job.distribution_id)
+    job.status = "failed"
+    job.error = error
+    db.commit()
+    _remove_files(output_paths)
+    originals.release(db, original_sha256)
+
+def complete_items(db, job_id: int, items: list, claimed_at: datetime) -> None:
+    """
+    Marque des items comme terminés et fait avancer le compteur de la tâche (mise à jour atomique).
+    Seuls les items encore détenus par ce worker (même bail) sont comptés.
+    """
+    item_ids = [item[0] for item in items]
+    result = db.execute(update(DistributionJobItem.__table__)
+                        .where(DistributionJobItem.id.in_(item_ids),
+                               DistributionJobItem.status == "running",
+                               DistributionJobItem.claimed_at == claimed_at)
+                        .values(status="done"))
+    completed = result.rowcount
+    row = db.execute(update(DistributionJob.__table__)
+                     .where(DistributionJob.id == job_id)
+                     .values(done=DistributionJob.done + completed, updated_at=datetime.utcnow())
+                     .returning(DistributionJob.done, DistributionJob.total, DistributionJob.status)).first()
+    finished = row is not None and row.status == "running" and row.done >= row.total
+    if finished:
+        db.execute(update(DistributionJob.__table__).where(DistributionJob.id == job_id).values(status="done"))
+    db.commit()
+    if completed < len(items) and (row is None or row.status == "failed"):
+        # Tâche annulée entre-temps: les copies que l'on vient de produire sont orphelines
+        _remove_files(item[3] for item in items)
+
+def process_items(db, items: list, claimed_at: datetime) -> None:
+    """Produit les copies d'un lot d'items réclamés, tâche par tâche."""
+    by_job = {}
+    for item in items:
+        by_job.setdefault(item[1], []).append(item)
+    for job_id, job_items in by_job.items():
+        job = db.query(DistributionJob).get(job_id)
+        if job is None or job.status == "failed":
+            continue
+        # Jeton enregistré à la distribution + chemin de sortie, pour chaque copie
+        tokens = dict(db.query(DistributionFile.id, DistributionFile.token)
+                      .filter(DistributionFile.id.in_([item[2] for item in job_items])))
+        work = [(tokens[file_id], output_path) for _, _, file_id, output_path in job_items if file_id in tokens]
+        try:
+            pool.fingerprint_all(job.source_path, job.file_type, work)
+        except Exception as e:
+            logger.exception("Échec de la tâche de distribution %s", job_id)
+            fail_job(db, job_id, f"Erreur lors de l'injection de l'empreinte: {str(e)}")
+            continue
+        complete_items(db, job_id, job_items, claimed_at)
+
+def run_once(batch_size: int = None) -> int:
+    """Réclame et traite un lot d'items. Retourne le nombre d'items traités (0 si la file est vide)."""
+    db = models.SessionLocal()
+    try:
+        items, claimed_at = claim_items(db, batch_size or config.JOB_BATCH_SIZE)
+        if items:
+            process_items(db, items, claimed_at)
+        return len(items)
+    finally:
+        db.close()
+
+def run_worker() -> None:
+    """Boucle principale d'un worker: traite la file tant qu'il y a du travail, sinon scrute périodiquement."""
+    logger.info("Worker de distribution démarré (lots de %d items)", config.JOB_BATCH_SIZE)
+    while True:
+        try:
+            processed = run_once()
+        except Exception:
+            logger.exception("Erreur dans la boucle du worker")
+            processed = 0
+        if not processed:
+            time.sleep(config.JOB_POLL_INTERVAL)
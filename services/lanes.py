@@ -0,0 +1,162 @@
+import asyncio, contextvars, functools, math, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+
+import config
+from services import metrics
+
+# Voies d'exécution: le travail bloquant des routes ne passe plus par le pool de threads partagé de Starlette,
+# mais par des pools dédiés, bornés, selon sa nature:
+# - "cpu": injection et production des copies (distribution, téléchargements, ZIP, scan groupé);
+# - "scan": extraction des jetons d'un fichier suspect (/api/scan), jamais en attente derrière une distribution;
+# - "light": lectures et écritures en base, métadonnées (liste de l'administration, tâches, cache des verdicts).
+# Chaque voie a un nombre de threads et une file d'attente bornés (config.LANE_*). Une requête arrivant sur une
+# file pleine est refusée tout de suite (429, par LaneRoute: avant la lecture de son corps); une requête restée plus
+# de LANE_QUEUE_TIMEOUT secondes dans la file est abandonnée (503). Les deux réponses portent un Retry-After estimé d'après la file et la durée moyenne des tâches.
+# Attente dans la file, refus, tâches en cours et en attente: voir /metrics.
+
+class LaneBusy(HTTPException):
+    """Voie saturée: 429 (file pleine) ou 503 (attente trop longue), avec Retry-After."""
+
+    def __init__(self, lane: str, status_code: int, retry_after: int):
+        reason = "file d'attente pleine" if status_code == 429 else "attente trop longue"
+        super().__init__(status_code=status_code, detail=f"Service surchargé ({lane}: {reason}), réessayez plus tard.",
+                         headers={"Retry-After": str(retry_after)})
+
+class Lane:
+    """Pool de threads borné, avec une file d'attente bornée et mesurée."""
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.queued = 0
+        self.running = 0
+        self._service_time = 0.1  # moyenne glissante de la durée d'une tâche (s), pour Retry-After
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"lane-{name}")
+
+    def retry_after(self) -> int:
+        with self._lock:
+            backlog = self.queued + self.running
+            service_time = self._service_time
+        return min(60, max(1, math.ceil(backlog * service_time / self.workers)))
+
+    def admit(self) -> None:
+        """Refuse (429) une nouvelle requête si la file de la voie est pleine."""
+        with self._lock:
+            full = self.running >= self.workers and self.queued >= self.queue_size
+        if full:
+            metrics.inc("leakdetector_lane_rejections_total", lane=self.name, status=429)
+            raise LaneBusy(self.name, 429, self.retry_after())
+
+    def _call(self, fn, args, kwargs, enqueued: float, deadline: bool):
+        started = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            wait = started - enqueued
+            metrics.observe("leakdetector_lane_wait_seconds", wait, lane=self.name)
+            if deadline and wait > config.LANE_QUEUE_TIMEOUT:
+                metrics.inc("leakdetector_lane_rejections_total", lane=self.name, status=503)
+                raise LaneBusy(self.name, 503, self.retry_after())
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.running -= 1
+                self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+
+    def _dequeue_cancelled(self, future) -> None:
+        # Requête abandonnée (client parti) avant d'avoir quitté la file: la tâche ne s'exécutera jamais
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def submit(self, fn, args=(), kwargs=None, deadline: bool = True) -> asyncio.Future:
+        with self._lock:
+            self.queued += 1
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._call, fn, args, kwargs or {}, time.perf_counter(), deadline)
+        future.add_done_callback(self._dequeue_cancelled)
+        return asyncio.wrap_future(future)
+
+_lanes = {
+    "cpu": Lane("cpu", config.LANE_CPU_WORKERS, config.LANE_CPU_QUEUE),
+    "scan": Lane("scan", config.LANE_SCAN_WORKERS, config.LANE_SCAN_QUEUE),
+    "light": Lane("light", config.LANE_LIGHT_WORKERS, config.LANE_LIGHT_QUEUE),
+}
+
+def admit(lane: str) -> None:
+    """Contrôle d'admission à l'entrée d'une requête (429 si la file de la voie est pleine)."""
+    _lanes[lane].admit()
+
+def admission(lane: str):
+    """Décorateur d'un endpoint asynchrone qui exécute son travail bloquant dans la voie: admission par LaneRoute."""
+    def decorator(fn):
+        fn.lane = lane
+        return fn
+    return decorator
+
+async def run(lane: str, fn, *args, **kwargs):
+    """Exécute fn(*args, **kwargs) dans un thread de la voie et renvoie son résultat (503 si l'attente a été trop longue)."""
+    return await _lanes[lane].submit(fn, args, kwargs)
+
+_END = object()
+
+async def iterate(lane: str, iterator):
+    """
+    Itère un générateur bloquant (corps d'une StreamingResponse) dans la voie, un morceau à la fois.
+    Réponse déjà commencée: pas d'abandon sur attente trop longue, les morceaux suivants attendent leur tour.
+    """
+    iterator = iter(iterator)
+    while True:
+        chunk = await _lanes[lane].submit(next, (iterator, _END), deadline=False)
+        if chunk is _END:
+            return
+        yield chunk
+
+def endpoint(lane: str):
+    """
+    Décorateur d'un endpoint synchrone: exécution de son corps dans la voie (au lieu du pool de threads partagé de
+    Starlette), après admission par LaneRoute. FastAPI lit la signature de la fonction d'origine (functools.wraps).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await run(lane, fn, *args, **kwargs)
+        wrapper.lane = lane
+        return wrapper
+    return decorator
+
+class LaneRoute(APIRoute):
+    """
+    Route FastAPI (route_class des routeurs) qui fait le contrôle d'admission (429) des endpoints marqués par endpoint()
+    ou admission() avant que FastAPI ne lise le corps de la requête: un upload refusé sous surcharge n'est ni reçu
+    ni écrit sur le disque.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        lane = getattr(self.endpoint, "lane", None)
+        if lane is None:
+            return handler
+
+        async def admitted_handler(request):
+            admit(lane)
+            return await handler(request)
+        return admitted_handler
+
+def render() -> str:
+    """Tâches en cours et en attente par voie, au format texte Prometheus (complète metrics.render)."""
+    lines = []
+    for name, help_text, attribute in (("leakdetector_lane_running", "Tâches en cours d'exécution, par voie.", "running"),
+                                       ("leakdetector_lane_queued", "Tâches en attente, par voie.", "queued"),
+                                       ("leakdetector_lane_workers", "Threads de chaque voie.", "workers")):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for lane in _lanes.values():
+            lines.append(f'{name}{{lane="{lane.name}"}} {getattr(lane, attribute)}')
+    return "\n".join(lines) + "\n"
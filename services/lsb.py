@@ -0,0 +1,62 @@
+import numpy as np
+from PIL import Image
+
+import crypto
+
+# Moteur LSB vectorisé (NumPy) du format PNG (services/png.py), pour l'insertion comme pour l'extraction.
+# Format (inchangé): 16 bits de longueur (big-endian, nombre d'octets) suivis des octets
+# de l'empreinte, bit de poids fort en premier, un bit par pixel dans le LSB du canal rouge,
+# pixels parcourus ligne par ligne.
+
+HEADER_BITS = 16
+# Plus longue empreinte insérée (jeton v1 en base64; le jeton v2 brut est plus court): au-delà, l'en-tête
+# ne décrit pas une empreinte et rien n'est lu de plus (pas de décodage de l'image entière pour du bruit).
+MAX_PAYLOAD = max(crypto.TOKEN_LENGTHS)
+
+def pack_payload(payload: bytes) -> np.ndarray:
+    """Construit le tableau de bits (en-tête de longueur + données) à cacher dans l'image."""
+    if len(payload) > 0xFFFF:
+        raise ValueError("Empreinte trop longue à insérer dans l'image.")
+    framed = len(payload).to_bytes(2, "big") + payload
+    return np.unpackbits(np.frombuffer(framed, dtype=np.uint8))
+
+def _rows_for(bit_count: int, width: int) -> int:
+    """Nombre de lignes de pixels nécessaires pour couvrir bit_count bits."""
+    return -(-bit_count // width)
+
+def embed_bits(image: Image.Image, bits: np.ndarray) -> None:
+    """
+    Écrit les bits dans le LSB du canal rouge d'une image RGBA (modifiée sur place).
+    Seules les premières lignes qui portent la charge utile sont converties en tableau NumPy.
+    """
+    width, height = image.size
+    if len(bits) > width * height:
+        raise ValueError("Image trop petite pour contenir l'empreinte.")
+    rows = _rows_for(len(bits), width)
+    strip = np.array(image.crop((0, 0, width, rows)))
+    # Vue sur le canal rouge des n premiers pixels (aucune copie)
+    red = strip.reshape(-1, 4)[:len(bits), 0]
+    red &= 0xFE
+    red |= bits
+    image.paste(Image.fromarray(strip, "RGBA"), (0, 0))
+
+def read_bits(image: Image.Image, start: int, count: int) -> np.ndarray:
+    """Lit count bits (LSB du canal rouge) à partir du pixel d'indice start, en une seule opération."""
+    width, height = image.size
+    end = min(start + count, width * height)
+    if end <= start:
+        return np.zeros(0, dtype=np.uint8)
+    rows = _rows_for(end, width)
+    strip = np.asarray(image.crop((0, 0, width, rows)).convert("RGBA"))
+    return strip.reshape(-1, 4)[start:end, 0] & 1
+
+def extract_payload(image: Image.Image) -> bytes:
+    """Lit l'en-tête de longueur puis les octets de l'empreinte. Renvoie b"" si aucune empreinte (ou longueur invalide)."""
+    header = read_bits(image, 0, HEADER_BITS)
+    if len(header) < HEADER_BITS:
+        return b""
+    length = int.from_bytes(np.packbits(header).tobytes(), "big")
+    if length <= 0 or length > MAX_PAYLOAD:
+        return b""
+    data_bits = read_bits(image, HEADER_BITS, length * 8)
+    return np.packbits(data_bits).tobytes()
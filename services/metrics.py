@@ -0,0 +1,203 @@
+import bisect, os, resource, sys, threading, time
+from contextlib import contextmanager
+
+import config
+
+# Instrumentation légère (sans dépendance): histogrammes et compteurs en mémoire, exposés au format texte
+# Prometheus sur /metrics (routes/metrics.py).
+# - timer(stage, file_type=...): durée d'une étape (upload, analyse PDF, chiffrement, rendu, écriture, ZIP, commit...)
+#   dans leakdetector_stage_seconds;
+# - observe(nom, valeur, ...) / inc(nom, ...): tailles traitées, destinataires par distribution, compteurs;
+# - les processus du pool (services/pool.py) n'exposent rien eux-mêmes: leurs mesures sont capturées
+#   (capture()) puis renvoyées au processus parent avec les résultats et rejouées ici (replay()).
+# Les valeurs sont par processus: avec plusieurs workers uvicorn/gunicorn, Prometheus agrège les cibles.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 Kio .. 1 Gio
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# Nom -> (type, aide, seuils des histogrammes)
+_DEFINITIONS = {
+    "leakdetector_stage_seconds": ("histogram", "Durée des étapes de traitement, en secondes.", LATENCY_BUCKETS),
+    "leakdetector_http_request_seconds": ("histogram", "Durée des requêtes HTTP, en secondes.", LATENCY_BUCKETS),
+    "leakdetector_bytes_processed": ("histogram", "Taille des fichiers traités par étape, en octets.", SIZE_BUCKETS),
+    "leakdetector_recipients_per_distribution": ("histogram", "Nombre de destinataires par distribution.", COUNT_BUCKETS),
+    "leakdetector_copies_total": ("counter", "Copies fingerprintées produites.", None),
+    "leakdetector_copy_cache_total": ("counter", "Accès au cache disque des copies, par résultat.", None),
+    "leakdetector_downloads_total": ("counter", "Téléchargements de copies, par mode d'envoi (accel, zerocopy, stream, not_modified).", None),
+    "leakdetector_scans_total": ("counter", "Fichiers analysés, par verdict.", None),
+    "leakdetector_lane_wait_seconds": ("histogram", "Attente dans la file d'une voie d'exécution, en secondes.", LATENCY_BUCKETS),
+    "leakdetector_lane_rejections_total": ("counter", "Requêtes refusées par le contrôle d'admission, par voie et statut.", None),
+    # Jauge "max": plus grande valeur reçue (pics de mémoire du processus, de ses enfants et des workers du pool)
+    "leakdetector_peak_rss_bytes": ("gauge", "Pic de mémoire résidente, en octets.", None),
+}
+
+_lock = threading.Lock()
+_series = {}  # (nom, labels triés) -> compteur (float) ou histogramme [comptes par seuil..., somme, total]
+_local = threading.local()
+
+def elapsed_ms(start: float) -> float:
+    """Durée écoulée depuis start (time.perf_counter()), en millisecondes (champ "timings" des réponses de scan)."""
+    return round((time.perf_counter() - start) * 1000, 3)
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+def _record(name: str, value: float, labels: tuple) -> None:
+    kind, _, buckets = _DEFINITIONS[name]
+    key = (name, labels)
+    with _lock:
+        if kind == "counter":
+            _series[key] = _series.get(key, 0.0) + value
+            return
+        if kind == "gauge":
+            _series[key] = max(_series.get(key, 0), value)
+            return
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+def _emit(name: str, value: float, labels: dict) -> None:
+    if not config.METRICS_ENABLED:
+        return
+    key = _labels_key(labels)
+    captured = getattr(_local, "events", None)
+    if captured is not None:
+        captured.append((name, value, key))
+    else:
+        _record(name, value, key)
+
+def observe(name: str, value: float, **labels) -> None:
+    """Ajoute une observation à un histogramme."""
+    _emit(name, value, labels)
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Incrémente un compteur."""
+    _emit(name, value, labels)
+
+@contextmanager
+def timer(stage: str, **labels):
+    """Mesure la durée du bloc dans leakdetector_stage_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("leakdetector_stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+def observe_timings(prefix: str, timings: dict, **labels) -> None:
+    """Reporte un dictionnaire de durées en millisecondes (ex: "timings" des réponses de scan) en étapes prefix.clé."""
+    for key, ms in timings.items():
+        observe("leakdetector_stage_seconds", ms / 1000, stage=f"{prefix}.{key}", **labels)
+
+@contextmanager
+def capture():
+    """Redirige les mesures du thread courant vers une liste (renvoyée par le processus worker), au lieu de les enregistrer."""
+    previous = getattr(_local, "events", None)
+    _local.events = events = []
+    try:
+        yield events
+    finally:
+        _local.events = previous
+
+def replay(events: list) -> None:
+    """Enregistre des mesures capturées (dans un autre processus) par capture()."""
+    for name, value, labels in events:
+        if getattr(_local, "events", None) is not None:
+            _local.events.append((name, value, labels))
+        else:
+            _record(name, value, labels)
+
+def _peak_rss(who) -> int:
+    """Pic de mémoire résidente (octets): ru_maxrss est en Kio sous Linux, en octets sous macOS."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def record_peak_rss(process: str) -> None:
+    """
+    Pic de mémoire résidente du processus courant dans leakdetector_peak_rss_bytes{process=...}. Appelé par les workers
+    du pool (sous capture(): la valeur revient au processus parent avec les résultats, qui garde le maximum).
+    """
+    _emit("leakdetector_peak_rss_bytes", _peak_rss(resource.RUSAGE_SELF), {"process": process})
+
+def _current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render() -> str:
+    """État courant des métriques au format texte Prometheus (version 0.0.4)."""
+    # Pics de mémoire: processus courant, et processus enfants terminés et attendus (pas les workers du pool, toujours
+    # en vie: leur pic est renvoyé avec chaque lot, voir record_peak_rss)
+    _record("leakdetector_peak_rss_bytes", _peak_rss(resource.RUSAGE_SELF), (("process", "self"),))
+    _record("leakdetector_peak_rss_bytes", _peak_rss(resource.RUSAGE_CHILDREN), (("process", "children"),))
+    with _lock:
+        snapshot = {key: (list(value) if isinstance(value, list) else value) for key, value in _series.items()}
+    lines = []
+    for name, (kind, help_text, buckets) in _DEFINITIONS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (series_name, labels), value in sorted(snapshot.items()):
+            if series_name != name:
+                continue
+            if kind in ("counter", "gauge"):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', repr(float(bound))),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {value[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+    # Mémoire résidente actuelle
+    current = _current_rss()
+    if current is not None:
+        lines.append("# HELP process_resident_memory_bytes Mémoire résidente actuelle, en octets.")
+        lines.append("# TYPE process_resident_memory_bytes gauge")
+        lines.append(f"process_resident_memory_bytes {current}")
+    return "\n".join(lines) + "\n"
+
+def reset() -> None:
+    """Vide toutes les séries (tests, benchmarks)."""
+    with _lock:
+        _series.clear()
+
+class MetricsMiddleware:
+    """Middleware ASGI: durée de chaque requête HTTP, par route (modèle de chemin, pas le chemin brut), méthode et statut."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Routes FastAPI: scope["route"] est renseigné pendant le routage; le reste (fichiers statiques) est regroupé
+            route = getattr(scope.get("route"), "path", None) or "static"
+            observe("leakdetector_http_request_seconds", time.perf_counter() - start,
+                    route=route, method=scope["method"], status=status["code"])
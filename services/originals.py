@@ -0,0 +1,63 @@
+import contextlib, fcntl, os, shutil
+
+from sqlalchemy import text
+
+import config
+from models import Distribution
+
+# Stockage des fichiers originaux adressé par contenu: ORIGINALS_DIR/ab/cd/<sha256>.
+# Un même fichier distribué plusieurs fois n'occupe le disque qu'une fois; l'original n'est supprimé
+# que lorsque plus aucune distribution n'y fait référence.
+# store() suivi de l'enregistrement de la distribution, et release(), se font sous le verrou du hash (locked()):
+# sans lui, un release() concurrent pourrait effacer l'original que store() vient de trouver en place.
+
+def path_for(sha256: str) -> str:
+    """Chemin de l'original de contenu sha256 (deux niveaux de sous-répertoires)."""
+    return os.path.join(config.ORIGINALS_DIR, sha256[:2], sha256[2:4], sha256)
+
+@contextlib.contextmanager
+def locked(db, sha256: str):
+    """
+    Sérialise, pour un même contenu, le rangement d'un original (jusqu'au commit de sa distribution) et sa libération.
+    Sous PostgreSQL: verrou consultatif de transaction sur le hash, relâché au commit ou au rollback (valable entre
+    machines). Sinon: verrou de fichier, partagé par les processus de la machine (256 fichiers, un par préfixe du hash).
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:h))"), {"h": sha256})
+        yield
+        return
+    lock_dir = os.path.join(config.ORIGINALS_DIR, ".locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, sha256[:2]), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def store(spooled_path: str, sha256: str) -> str:
+    """
+    Range un fichier uploadé (déjà écrit sur le disque) dans le stockage des originaux.
+    Si ce contenu est déjà stocké, le fichier uploadé est simplement supprimé. Retourne le chemin de l'original.
+    À appeler sous locked(), gardé jusqu'au commit de la distribution qui y fait référence.
+    """
+    path = path_for(sha256)
+    if os.path.exists(path):
+        os.remove(spooled_path)
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Déplacement atomique quand le spool est sur le même système de fichiers (cas par défaut)
+    shutil.move(spooled_path, path)
+    return path
+
+def release(db, sha256: str) -> None:
+    """Supprime l'original s'il n'est plus référencé par aucune distribution (à appeler après le commit)."""
+    if not sha256:
+        return
+    with locked(db, sha256):
+        if db.query(Distribution.id).filter(Distribution.original_sha256 == sha256).first() is None:
+            path = path_for(sha256)
+            if os.path.exists(path):
+                os.remove(path)
+        # Fin de transaction: relâche le verrou consultatif (PostgreSQL)
+        db.commit()
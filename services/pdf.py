@@ -0,0 +1,267 @@
+import io, re, time
+import fitz  # PyMuPDF for PDF manipulation
+
+import config
+import crypto
+from services import metrics
+
+# Format PDF (chargé au premier usage, voir services/formats.py): empreinte en métadonnée (clé /fingerprint
+# du dictionnaire Info) et en texte invisible sur la première page.
+
+def embed_fingerprint_pdf(pdf_bytes: bytes, fingerprint: str) -> bytes:
+    """
+    Insère l'empreinte (chaîne base64) dans un PDF:
+    - Ajoute un champ de métadonnées 'fingerprint' dans le document PDF.
+    - Insère le texte de l'empreinte de manière invisible sur la première page (texte blanc).
+    Retourne les bytes du PDF modifié.
+    """
+    # Ouvrir le PDF en mémoire avec PyMuPDF
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    # 1. Injection dans les métadonnées du PDF (clé personnalisée du dictionnaire Info)
+    _set_info_fingerprint(doc, fingerprint)
+    # 2. Injection d'un texte invisible sur la première page
+    try:
+        page = doc[0]
+    except Exception:
+        # Si le PDF est vide ou invalide
+        raise ValueError("PDF invalide ou sans page pour insertion.")
+    # Choisir une position pour le texte (par ex coin en haut à gauche)
+    insert_position = fitz.Point(10, 10)
+    # Insérer le texte avec une police de petite taille en blanc (couleur (1,1,1) => blanc)
+    page.insert_text(insert_position, fingerprint, fontsize=5, color=(1, 1, 1))
+    # Récupérer le PDF modifié en bytes
+    pdf_output = doc.write()  # PyMuPDF: renvoie le PDF modifié en mémoire:contentReference[oaicite:3]{index=3}
+    doc.close()
+    return pdf_output
+
+def _set_info_fingerprint(doc, fingerprint: str) -> None:
+    """Écrit la clé /fingerprint dans le dictionnaire Info du PDF (créé s'il n'existe pas)."""
+    kind, value = doc.xref_get_key(-1, "Info")
+    if kind == "xref":
+        info_xref = int(value.split()[0])
+    else:
+        info_xref = doc.get_new_xref()
+        doc.update_object(info_xref, "<<>>")
+        doc.xref_set_key(-1, "Info", f"{info_xref} 0 R")
+    doc.xref_set_key(info_xref, "fingerprint", fitz.get_pdf_str(fingerprint))
+
+def _last_startxref(pdf_bytes: bytes):
+    """Renvoie l'offset de la dernière table xref (mot-clé startxref en fin de fichier), ou None."""
+    matches = re.findall(rb"startxref\s+(\d+)", pdf_bytes[-2048:])
+    return int(matches[-1]) if matches else None
+
+def _page_resources(doc, xref: int) -> str:
+    """Renvoie le dictionnaire /Resources effectif d'une page (éventuellement hérité d'un parent)."""
+    while xref:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind == "xref":
+            return doc.xref_object(int(value.split()[0]), compressed=True)
+        if kind == "dict":
+            return value
+        kind, value = doc.xref_get_key(xref, "Parent")
+        xref = int(value.split()[0]) if kind == "xref" else 0
+    return "<<>>"
+
+class PdfFingerprintTemplate:
+    """
+    Gabarit PDF réutilisable pour fingerprinter un même document pour de nombreux destinataires.
+    - Le PDF source est analysé une seule fois (normalisé si sa table xref n'est pas une table classique).
+    - Chaque copie est produite par mise à jour incrémentale: on ajoute à la fin du fichier original
+      un nouvel objet Info (métadonnée 'fingerprint') et un petit flux de contenu sur la première page,
+      suivis d'une section xref et d'un trailer /Prev. Le document d'origine n'est jamais réécrit.
+    Les PDF chiffrés ne se prêtent pas à l'ajout d'objets en clair: on retombe alors sur embed_fingerprint_pdf.
+    """
+    FONT_NAME = "FLkFp"
+    INSERT_POSITION = (10, 10)
+
+    def __init__(self, pdf_bytes: bytes):
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        try:
+            if doc.page_count == 0:
+                raise ValueError("PDF invalide ou sans page pour insertion.")
+            self.encrypted = bool(doc.is_encrypted)
+            if self.encrypted:
+                self.base = pdf_bytes
+                return
+            startxref = _last_startxref(pdf_bytes)
+            if doc.is_repaired or startxref is None or pdf_bytes[startxref:startxref + 4] != b"xref":
+                # Fichier réparé ou à flux xref: normalisation unique vers une table xref classique
+                pdf_bytes = doc.tobytes()
+                doc.close()
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+                startxref = _last_startxref(pdf_bytes)
+            self._prepare(doc, pdf_bytes, startxref)
+        finally:
+            doc.close()
+
+    def _prepare(self, doc, pdf_bytes: bytes, startxref: int) -> None:
+        """Calcule une fois pour toutes les objets communs à toutes les copies (police, page 0, trailer)."""
+        if not pdf_bytes.endswith(b"\n"):
+            pdf_bytes += b"\n"
+        self.base = pdf_bytes
+        self.prev = startxref
+        page = doc[0]
+        # Objet de travail (jamais sérialisé) pour fusionner les ressources de la page
+        scratch = doc.get_new_xref()
+        next_num = doc.xref_length()
+        font_num, wrap_num, self.text_num = next_num, next_num + 1, next_num + 2
+        kind, value = doc.xref_get_key(-1, "Info")
+        if kind == "xref":
+            self.info_num = int(value.split()[0])
+            info_src = doc.xref_object(self.info_num, compressed=True)
+        else:
+            self.info_num = next_num + 3
+            info_src = "<<>>"
+        self.size = max(self.info_num, self.text_num) + 1
+        # Dictionnaire Info avec un marqueur, découpé autour de la valeur de l'empreinte
+        doc.update_object(scratch, info_src)
+        doc.xref_set_key(scratch, "fingerprint", "(@FP@)")
+        self.info_prefix, self.info_suffix = doc.xref_object(scratch, compressed=True).split("(@FP@)", 1)
+        # Ressources de la page 0 + police Helvetica dédiée au texte invisible
+        doc.update_object(scratch, _page_resources(doc, page.xref))
+        kind, value = doc.xref_get_key(scratch, "Font")
+        if kind == "xref":
+            doc.xref_set_key(scratch, "Font", doc.xref_object(int(value.split()[0]), compressed=True))
+        doc.xref_set_key(scratch, f"Font/{self.FONT_NAME}", f"{font_num} 0 R")
+        resources = doc.xref_object(scratch, compressed=True)
+        # Contenu existant encadré par q ... Q, puis notre flux de texte en dernier
+        kind, value = doc.xref_get_key(page.xref, "Contents")
+        contents = value.strip("[]") if kind in ("xref", "array") else ""
+        doc.xref_set_key(page.xref, "Resources", resources)
+        doc.xref_set_key(page.xref, "Contents", f"[{wrap_num} 0 R {contents} {self.text_num} 0 R]")
+        # Objets communs: police, flux "q", page 0 modifiée
+        self.static_objects = [
+            (font_num, "<</Type/Font/Subtype/Type1/BaseFont/Helvetica/Encoding/WinAnsiEncoding>>"),
+            (wrap_num, _pdf_stream(b"q\n")),
+            (page.xref, doc.xref_object(page.xref, compressed=True)),
+        ]
+        # Position d'insertion convertie en coordonnées PDF (origine en bas à gauche)
+        point = fitz.Point(*self.INSERT_POSITION) * ~page.transformation_matrix
+        self.text_position = f"{point.x:g} {point.y:g}"
+        self.root = doc.xref_get_key(-1, "Root")[1]
+        kind, value = doc.xref_get_key(-1, "ID")
+        self.file_id = value if kind == "array" else None
+
+    def render_parts(self, fingerprint: str) -> list:
+        """Produit la copie fingerprintée sous forme de morceaux à écrire à la suite (un seul ici)."""
+        return [self.render(fingerprint)]
+
+    def render(self, fingerprint: str) -> bytes:
+        """Produit la copie fingerprintée pour une empreinte donnée (original + mise à jour incrémentale)."""
+        if self.encrypted:
+            return embed_fingerprint_pdf(self.base, fingerprint)
+        pdf_str = fitz.get_pdf_str(fingerprint)
+        text = (
+            f"Q\nq\nBT\n/{self.FONT_NAME} 5 Tf\n1 1 1 rg\n"
+            f"1 0 0 1 {self.text_position} Tm\n{pdf_str} Tj\nET\nQ\n"
+        ).encode("latin-1")
+        objects = self.static_objects + [
+            (self.text_num, _pdf_stream(text)),
+            (self.info_num, self.info_prefix + pdf_str + self.info_suffix),
+        ]
+        update = io.BytesIO()
+        offsets = {}
+        for num, source in objects:
+            offsets[num] = len(self.base) + update.tell()
+            body = source if isinstance(source, bytes) else source.encode("latin-1")
+            update.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+        xref_offset = len(self.base) + update.tell()
+        update.write(_xref_section(offsets))
+        trailer = f"<</Size {self.size}/Root {self.root}/Info {self.info_num} 0 R/Prev {self.prev}"
+        if self.file_id:
+            trailer += f"/ID{self.file_id}"
+        update.write(f"trailer\n{trailer}>>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1"))
+        return self.base + update.getvalue()
+
+def _pdf_stream(data: bytes) -> bytes:
+    """Sérialise un flux PDF non compressé."""
+    return b"<</Length %d>>\nstream\n" % len(data) + data + b"\nendstream"
+
+def _xref_section(offsets: dict) -> bytes:
+    """Construit une section xref classique (sous-sections d'objets consécutifs)."""
+    nums = sorted(offsets)
+    # Entrée 0 (tête de la liste des objets libres), attendue par les lecteurs stricts
+    out = [b"xref\n0 1\n0000000000 65535 f\r\n"]
+    start = 0
+    for i in range(1, len(nums) + 1):
+        if i == len(nums) or nums[i] != nums[i - 1] + 1:
+            out.append(b"%d %d\n" % (nums[start], i - start))
+            out.extend(b"%010d 00000 n\r\n" % offsets[n] for n in nums[start:i])
+            start = i
+    return b"".join(out)
+
+def prepare(path: str) -> PdfFingerprintTemplate:
+    """Gabarit de l'original pour la production des copies (services/pool.py)."""
+    with open(path, "rb") as f:
+        return PdfFingerprintTemplate(f.read())
+
+_BASE64_RUN = re.compile(r'[A-Za-z0-9+/]{16,}={0,2}')
+
+def _shaped_tokens(text: str) -> list:
+    """Chaînes base64 du texte ayant la longueur et l'alphabet d'un jeton (filtre sans cryptographie)."""
+    return [cand for cand in _BASE64_RUN.findall(text) if crypto.is_token_candidate(cand)]
+
+def candidates(source, full_scan: bool = False, accept=None, timings: dict = None) -> list:
+    """
+    Cherche les jetons candidats d'un PDF, par couches de coût croissant:
+    1. métadonnées (clé /fingerprint du dictionnaire Info);
+    2. texte de la page 0, d'abord autour du point d'insertion puis la page entière;
+    3. seulement si full_scan: texte des pages suivantes, dans la limite de PDF_FULL_SCAN_MAX_PAGES
+       et de PDF_FULL_SCAN_TIME_BUDGET secondes.
+    Avec accept (prédicat sur un candidat), la recherche s'arrête au premier candidat accepté, seul renvoyé.
+    Sans accept, renvoie tous les candidats des couches parcourues (aucun déchiffrement).
+    La durée de chaque couche parcourue est ajoutée à timings (en ms) si fourni.
+    """
+    if timings is None:
+        timings = {}
+    found = []
+
+    def take(candidates) -> bool:
+        if accept is None:
+            found.extend(c for c in candidates if c not in found)
+            return False
+        for cand in candidates:
+            if accept(cand):
+                found.append(cand)
+                return True
+        return False
+
+    if isinstance(source, str):
+        doc = fitz.open(source, filetype="pdf")
+    else:
+        doc = fitz.open(stream=source, filetype="pdf")
+    try:
+        # 1. Métadonnées
+        start = time.perf_counter()
+        kind, value = doc.xref_get_key(-1, "Info/fingerprint")
+        done = kind == "string" and crypto.is_token_candidate(value) and take([value])
+        timings["pdf.metadata"] = metrics.elapsed_ms(start)
+        if done or doc.page_count == 0:
+            return found
+        # 2. Page 0: bande supérieure où l'injecteur écrit le texte invisible, puis page entière
+        start = time.perf_counter()
+        page = doc[0]
+        if accept is not None:
+            insert_y = PdfFingerprintTemplate.INSERT_POSITION[1]
+            done = take(_shaped_tokens(page.get_text(clip=fitz.Rect(0, 0, page.rect.width, insert_y + 10))))
+        done = done or take(_shaped_tokens(page.get_text()))
+        timings["pdf.page0"] = metrics.elapsed_ms(start)
+        if done or not full_scan:
+            return found
+        # 3. Scan complet borné, page par page (pas de concaténation du texte de tout le document)
+        start = time.perf_counter()
+        deadline = start + config.PDF_FULL_SCAN_TIME_BUDGET
+        for index in range(1, min(doc.page_count, config.PDF_FULL_SCAN_MAX_PAGES)):
+            if time.perf_counter() > deadline:
+                break
+            if take(_shaped_tokens(doc[index].get_text())):
+                break
+        timings["pdf.full_scan"] = metrics.elapsed_ms(start)
+        return found
+    finally:
+        doc.close()
+
+def extract_fingerprint_from_pdf(source, full_scan: bool = False, timings: dict = None) -> str:
+    """Extrait la chaîne d'empreinte cachée dans un PDF (premier jeton authentique, voir candidates)."""
+    found = candidates(source, full_scan=full_scan, accept=crypto.is_authentic, timings=timings)
+    return found[0] if found else None  # None si aucune empreinte trouvée ou valide
@@ -0,0 +1,130 @@
+import io, time, zlib
+import numpy as np
+from PIL import Image
+
+import config
+import crypto
+from services import lsb, metrics, pngstream
+
+# Format PNG (chargé au premier usage, voir services/formats.py): empreinte par stéganographie LSB
+# dans les premiers pixels de l'image (services/lsb.py).
+
+def embed_fingerprint_png(source, fingerprint: str) -> bytes:
+    """
+    Insère l'empreinte (jeton, forme base64) dans une image PNG par stéganographie LSB.
+    - Encode la longueur de l'empreinte puis ses bits (binaire brut pour un jeton v2) dans les bits de poids faible des pixels.
+    - Retourne les bytes de l'image PNG modifiée.
+    """
+    # Ouvrir l'image avec PIL (octets en mémoire, ou directement le fichier sur le disque)
+    image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    image = image.convert("RGBA")  # s'assurer d'avoir 4 canaux (RGBA) pour homogénéité
+    # Bits à cacher: longueur sur 16 bits + octets de l'empreinte
+    data_bits = lsb.pack_payload(crypto.token_bytes(fingerprint))
+    # Injection de tous les bits d'un coup dans le LSB du canal rouge
+    lsb.embed_bits(image, data_bits)
+
+    # Sauvegarder l'image modifiée en PNG dans un buffer mémoire
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, format="PNG")
+    return output_buffer.getvalue()
+
+class PngFingerprintTemplate:
+    """
+    Gabarit PNG réutilisable pour fingerprinter une même image pour de nombreux destinataires.
+    L'empreinte n'occupe que les premières lignes de l'image (LSB du canal rouge): l'image est décodée, filtrée
+    et compressée une seule fois, sauf ces premières lignes ("tête"). Pour chaque copie, seule la tête est
+    modifiée, filtrée et compressée (blocs deflate terminés par un Z_SYNC_FLUSH, donc alignés sur un octet),
+    puis placée devant les blocs deflate précompressés du reste de l'image ("queue"):
+    - la première ligne de la queue est filtrée sans référence à la ligne du dessus (filtre 0 ou 1),
+      et la queue est compressée dans un flux deflate indépendant (aucune référence arrière vers la tête);
+    - l'Adler-32 du flux zlib est recombiné à partir de ceux de la tête et de la queue, sans relire la queue;
+    - les chunks IDAT de la queue (et leurs CRC) sont calculés une fois; seuls ceux de la tête et le dernier
+      (Adler-32, 4 octets) sont produits pour chaque copie.
+    La copie a les mêmes pixels qu'avec embed_fingerprint_png (image RGBA 8 bits) et garde les chunks auxiliaires
+    de l'original placés avant ses IDAT (pngstream.ancillary_chunks); une empreinte plus longue
+    que PNG_TEMPLATE_MAX_PAYLOAD octets est insérée par embed_fingerprint_png.
+    """
+    IDAT_SIZE = 1024 * 1024
+    # Nombre d'octets filtrés traités d'un coup pour la queue (mémoire bornée, même pour une très grande image)
+    BLOCK_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, source, level: int = None):
+        self.source = source
+        self.level = config.PNG_ZLIB_LEVEL if level is None else level
+        image = Image.open(source if isinstance(source, str) else io.BytesIO(source)).convert("RGBA")
+        self.width, self.height = image.size
+        pixels = np.asarray(image, dtype=np.uint8).reshape(self.height, self.width * 4)
+        # IHDR RGBA, suivi des chunks auxiliaires de l'original (profil de couleur, densité, textes...)
+        self.header = pngstream.ihdr_rgba(self.width, self.height) + b"".join(pngstream.ancillary_chunks(source))
+        max_bits = lsb.HEADER_BITS + 8 * config.PNG_TEMPLATE_MAX_PAYLOAD
+        self.head_rows = min(self.height, -(-max_bits // self.width))
+        self.head = pixels[:self.head_rows].copy()
+        self.tail_chunks, self.tail_adler, self.tail_length = self._compress_tail(pixels)
+
+    def _compress_tail(self, pixels: np.ndarray) -> tuple:
+        """Filtre et compresse (deflate brut) les lignes de la queue, par blocs. Retourne (chunks IDAT, Adler-32, longueur)."""
+        if self.head_rows == self.height:
+            return [], 1, 0
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        rows_per_block = max(1, self.BLOCK_BYTES // (self.width * 4))
+        adler, length = 1, 0
+        compressed = []
+        for start in range(self.head_rows, self.height, rows_per_block):
+            rows = pixels[start:start + rows_per_block]
+            raw = pngstream.filter_scanlines(rows, pixels[start - 1], 4, independent_first=start == self.head_rows)
+            adler = zlib.adler32(raw, adler)
+            length += len(raw)
+            compressed.append(compressor.compress(raw))
+        compressed.append(compressor.flush())
+        data = b"".join(compressed)
+        chunks = [pngstream.png_chunk(b"IDAT", data[i:i + self.IDAT_SIZE]) for i in range(0, len(data), self.IDAT_SIZE)]
+        return chunks, adler, length
+
+    def render_parts(self, fingerprint: str) -> list:
+        """Produit la copie fingerprintée sous forme de morceaux à écrire à la suite (la queue est partagée, jamais recopiée)."""
+        bits = lsb.pack_payload(crypto.token_bytes(fingerprint))
+        if len(bits) > self.head_rows * self.width:
+            return [embed_fingerprint_png(self.source, fingerprint)]
+        head = self.head.copy()
+        red = head.reshape(-1, 4)[:len(bits), 0]
+        red &= 0xFE
+        red |= bits
+        raw = pngstream.filter_scanlines(head, None, 4)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 15)
+        if not self.tail_chunks:
+            # Image entièrement contenue dans la tête: flux zlib complet, Adler-32 compris
+            return [self.header, pngstream.png_chunk(b"IDAT", compressor.compress(raw) + compressor.flush()),
+                    pngstream.png_chunk(b"IEND", b"")]
+        head_data = compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        adler = pngstream.adler32_combine(zlib.adler32(raw), self.tail_adler, self.tail_length)
+        return ([self.header, pngstream.png_chunk(b"IDAT", head_data)] + self.tail_chunks
+                + [pngstream.png_chunk(b"IDAT", adler.to_bytes(4, "big")), pngstream.png_chunk(b"IEND", b"")])
+
+    def render(self, fingerprint: str) -> bytes:
+        """Produit la copie fingerprintée pour une empreinte donnée."""
+        return b"".join(self.render_parts(fingerprint))
+
+def prepare(path: str) -> PngFingerprintTemplate:
+    """Gabarit de l'original: l'image n'est décodée et compressée qu'une fois, seules ses premières lignes le sont par copie."""
+    return PngFingerprintTemplate(path)
+
+def extract_fingerprint_from_png(source) -> str:
+    """Extrait la chaîne d'empreinte cachée dans une image PNG via LSB steganography."""
+    # Décodage partiel en flux: seuls les premiers pixels (ceux qui portent l'empreinte) sont décompressés
+    data_bytes = pngstream.read_payload(source)
+    if data_bytes is None:
+        # PNG entrelacé ou de profondeur autre que 8 bits: décodage complet par PIL, lecture vectorisée
+        # de l'en-tête (16 bits) puis des octets de l'empreinte, un bit par pixel (canal rouge)
+        image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+        data_bytes = lsb.extract_payload(image)
+    if not data_bytes:
+        return None  # aucune empreinte trouvée
+    return crypto.token_from_bytes(data_bytes)
+
+def candidates(source, full_scan: bool = False, accept=None, timings: dict = None) -> list:
+    """Jeton candidat d'une image (au plus un). full_scan et accept sont sans objet pour ce format."""
+    start = time.perf_counter()
+    fingerprint = extract_fingerprint_from_png(source)
+    if timings is not None:
+        timings["png.lsb"] = metrics.elapsed_ms(start)
+    return [fingerprint] if fingerprint else []
@@ -0,0 +1,265 @@
+import io, struct, zlib
+import numpy as np
+
+from services import lsb
+
+# Lecture et écriture partielles de PNG pour l'empreinte LSB, qui n'occupe que les premiers pixels de l'image
+# (un bit par pixel, LSB du canal rouge, voir services/lsb.py).
+# - Lecture (read_payload): au lieu de décoder toute l'image avec PIL, on lit les chunks en flux, on décompresse
+#   les IDAT au fil de l'eau juste assez pour couvrir ces pixels, et on ne "défiltre" que le début des lignes
+#   concernées (les filtres PNG ne dépendent que des octets à gauche et au-dessus). Le coût ne dépend plus de
+#   la taille de l'image. Cas non couverts (entrelacement Adam7, profondeur autre que 8 bits): read_payload
+#   renvoie None et l'appelant retombe sur le décodage complet par PIL.
+# - Écriture (filter_scanlines, png_chunk, adler32_combine): briques de PngFingerprintTemplate (services/png.py),
+#   qui compresse une seule fois par distribution les lignes que l'empreinte ne touche pas.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+READ_SIZE = 64 * 1024
+
+# Type de couleur -> nombre d'octets par pixel (profondeur 8 bits)
+_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+class Unsupported(Exception):
+    """PNG valide mais hors du cas traité en flux (le décodage complet reste possible)."""
+
+def _paeth(a: int, b: int, c: int) -> int:
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+def _unfilter(filter_type: int, line: bytes, prior: bytearray, bpp: int) -> bytearray:
+    """Défiltre le début d'une ligne (line: octets filtrés, prior: ligne précédente défiltrée, au moins aussi longue)."""
+    out = bytearray(line)
+    n = len(out)
+    if filter_type == 0:
+        return out
+    if filter_type == 1:
+        for i in range(bpp, n):
+            out[i] = (out[i] + out[i - bpp]) & 0xFF
+    elif filter_type == 2:
+        for i in range(n):
+            out[i] = (out[i] + prior[i]) & 0xFF
+    elif filter_type == 3:
+        for i in range(n):
+            left = out[i - bpp] if i >= bpp else 0
+            out[i] = (out[i] + ((left + prior[i]) >> 1)) & 0xFF
+    elif filter_type == 4:
+        for i in range(n):
+            left = out[i - bpp] if i >= bpp else 0
+            upper_left = prior[i - bpp] if i >= bpp else 0
+            out[i] = (out[i] + _paeth(left, prior[i], upper_left)) & 0xFF
+    else:
+        raise ValueError(f"Filtre PNG inconnu: {filter_type}")
+    return out
+
+class _PixelReader:
+    """Accès aux premiers pixels d'un PNG, en ne décompressant que le nécessaire."""
+
+    def __init__(self, f):
+        self.f = f
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError("Signature PNG invalide.")
+        length, chunk_type = struct.unpack(">I4s", f.read(8))
+        if chunk_type != b"IHDR" or length != 13:
+            raise ValueError("En-tête PNG invalide.")
+        (self.width, self.height, depth, self.color_type,
+         _, _, interlace) = struct.unpack(">IIBBBBB", f.read(13))
+        f.read(4)  # CRC
+        if depth != 8 or interlace != 0 or self.color_type not in _CHANNELS:
+            raise Unsupported()
+        self.bpp = _CHANNELS[self.color_type]
+        self.stride = 1 + self.width * self.bpp
+        self.palette = None
+        self.raw = bytearray()            # Octets décompressés (filtrés) depuis le début de l'image
+        self.inflater = zlib.decompressobj()
+        self.pending = b""                # Données compressées pas encore consommées (limite de sortie atteinte)
+        self.idat_left = 0                # Octets restant à lire dans le chunk IDAT courant
+        self.finished = False
+
+    def _next_compressed(self):
+        """Morceau suivant du flux zlib (IDAT lus par morceaux, même s'ils sont énormes), ou None à la fin."""
+        while self.idat_left == 0:
+            header = self.f.read(8)
+            if len(header) < 8:
+                return None
+            length, chunk_type = struct.unpack(">I4s", header)
+            if chunk_type == b"IDAT":
+                self.idat_left = length
+                if length == 0:
+                    self.f.read(4)
+                continue
+            if chunk_type == b"IEND":
+                return None
+            if chunk_type == b"PLTE":
+                self.palette = self.f.read(length)
+            else:
+                self.f.seek(length, io.SEEK_CUR)
+            self.f.read(4)  # CRC
+        data = self.f.read(min(self.idat_left, READ_SIZE))
+        if not data:
+            return None
+        self.idat_left -= len(data)
+        if self.idat_left == 0:
+            self.f.read(4)  # CRC de l'IDAT
+        return data
+
+    def _inflate_to(self, size: int) -> None:
+        while len(self.raw) < size and not self.finished:
+            data = self.pending or self._next_compressed()
+            if data is None:
+                self.finished = True
+                break
+            self.raw += self.inflater.decompress(data, size - len(self.raw))
+            self.pending = self.inflater.unconsumed_tail
+
+    def red_channel(self, count: int) -> list:
+        """Valeurs du canal rouge (après conversion RGBA, comme PIL) des count premiers pixels."""
+        count = min(count, self.width * self.height)
+        if count <= 0:
+            return []
+        rows = -(-count // self.width)
+        last_pixels = count - (rows - 1) * self.width
+        self._inflate_to((rows - 1) * self.stride + 1 + last_pixels * self.bpp)
+        prior = bytearray(self.width * self.bpp)
+        values = []
+        for row in range(rows):
+            pixels = self.width if row < rows - 1 else last_pixels
+            start = row * self.stride
+            line = self.raw[start + 1:start + 1 + pixels * self.bpp]
+            if len(line) < pixels * self.bpp:
+                break  # image tronquée
+            prior = _unfilter(self.raw[start], line, prior, self.bpp)
+            if self.color_type == 3:
+                palette = self.palette or b""
+                values.extend(palette[3 * i] if 3 * i < len(palette) else 0 for i in prior[:pixels])
+            else:
+                values.extend(prior[0:pixels * self.bpp:self.bpp])
+        return values
+
+def _bits_to_bytes(bits: list) -> bytes:
+    out = bytearray()
+    for i in range(0, len(bits) - 7, 8):
+        byte = 0
+        for bit in bits[i:i + 8]:
+            byte = (byte << 1) | bit
+        out.append(byte)
+    return bytes(out)
+
+def read_payload(source):
+    """
+    Lit l'empreinte LSB (en-tête de longueur + octets) d'un PNG donné en octets ou par son chemin.
+    Renvoie les octets de l'empreinte (b"" si aucune), ou None si ce PNG doit être décodé entièrement (cas non couverts).
+    """
+    f = open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+    try:
+        reader = _PixelReader(f)
+        header = [v & 1 for v in reader.red_channel(lsb.HEADER_BITS)]
+        if len(header) < lsb.HEADER_BITS:
+            return b""
+        length = int("".join(map(str, header)), 2)
+        if length <= 0 or length > lsb.MAX_PAYLOAD:
+            return b""
+        bits = [v & 1 for v in reader.red_channel(lsb.HEADER_BITS + length * 8)[lsb.HEADER_BITS:]]
+        return _bits_to_bytes(bits)
+    except Unsupported:
+        return None
+    finally:
+        f.close()
+
+# Chunks de colorimétrie: marqués "non sûrs à copier" par leur nom, mais indépendants du codage des pixels.
+# Chunks liés au type de couleur ou à la profondeur de l'original: faux dans une copie RGBA 8 bits.
+_COLOR_CHUNKS = {b"cHRM", b"gAMA", b"iCCP", b"sRGB", b"cICP", b"mDCv", b"cLLI"}
+_PIXEL_CHUNKS = {b"tRNS", b"bKGD", b"sBIT", b"hIST"}
+
+def ancillary_chunks(source) -> list:
+    """
+    Chunks auxiliaires (complets, CRC compris) placés avant les IDAT d'un PNG donné en octets ou par son chemin,
+    à recopier après l'IHDR d'une copie convertie en RGBA 8 bits: profil de couleur (iCCP, sRGB, gAMA, cHRM...),
+    densité (pHYs) et chunks marqués "sûrs à copier" (bit de la 4e lettre), sauf ceux liés au codage des pixels.
+    """
+    f = open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+    chunks = []
+    try:
+        if f.read(8) != PNG_SIGNATURE:
+            return []
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack(">I4s", header)
+            if chunk_type in (b"IDAT", b"IEND"):
+                break
+            ancillary = chunk_type[0] & 0x20
+            safe_to_copy = chunk_type[3] & 0x20
+            if ancillary and chunk_type not in _PIXEL_CHUNKS and (safe_to_copy or chunk_type in _COLOR_CHUNKS):
+                body = f.read(length + 4)
+                if len(body) < length + 4:
+                    break
+                chunks.append(header + body)
+            else:
+                f.seek(length + 4, io.SEEK_CUR)
+    finally:
+        f.close()
+    return chunks
+
+# --- Écriture ---
+
+_ADLER_BASE = 65521
+
+def adler32_combine(adler1: int, adler2: int, len2: int) -> int:
+    """Adler-32 de A + B à partir de ceux de A et de B (len2 = longueur de B), sans relire les données (cf. zlib)."""
+    rem = len2 % _ADLER_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % _ADLER_BASE
+    sum1 += (adler2 & 0xFFFF) + _ADLER_BASE - 1
+    sum2 += ((adler1 >> 16) & 0xFFFF) + ((adler2 >> 16) & 0xFFFF) + _ADLER_BASE - rem
+    if sum1 >= _ADLER_BASE:
+        sum1 -= _ADLER_BASE
+    if sum1 >= _ADLER_BASE:
+        sum1 -= _ADLER_BASE
+    if sum2 >= (_ADLER_BASE << 1):
+        sum2 -= (_ADLER_BASE << 1)
+    if sum2 >= _ADLER_BASE:
+        sum2 -= _ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """Chunk PNG complet: longueur, type, données, CRC."""
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+def ihdr_rgba(width: int, height: int) -> bytes:
+    """Signature + chunk IHDR d'une image RGBA 8 bits non entrelacée."""
+    return PNG_SIGNATURE + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+def filter_scanlines(rows: np.ndarray, prior, bpp: int, independent_first: bool = False) -> bytes:
+    """
+    Filtre des lignes (tableau n x octets par ligne, uint8) avec l'heuristique adaptative de libpng: pour chaque
+    ligne, le filtre (0 à 4) qui minimise la somme des valeurs absolues (signées) est retenu.
+    - prior: ligne précédente (non filtrée), ou None pour la première ligne de l'image.
+    - independent_first: la première ligne n'utilise que les filtres 0/1 (ne dépend pas de la ligne précédente),
+      pour pouvoir être précédée de lignes qui changent d'une copie à l'autre.
+    Retourne les octets filtrés, chaque ligne précédée de son type de filtre. Vectorisé (l'encodage, contrairement
+    au décodage, n'a pas de dépendance séquentielle).
+    """
+    x = rows.astype(np.int16)
+    up = np.empty_like(x)
+    up[0] = 0 if prior is None else prior
+    up[1:] = x[:-1]
+    left = np.zeros_like(x)
+    left[:, bpp:] = x[:, :-bpp]
+    upper_left = np.zeros_like(x)
+    upper_left[:, bpp:] = up[:, :-bpp]
+    # Prédicteur de Paeth
+    pa = np.abs(up - upper_left)
+    pb = np.abs(left - upper_left)
+    pc = np.abs(left + up - 2 * upper_left)
+    paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upper_left))
+    candidates = np.stack([x, x - left, x - up, x - ((left + up) >> 1), x - paeth]) & 0xFF
+    costs = np.abs(candidates.astype(np.uint8).view(np.int8).astype(np.int32)).sum(axis=2)
+    if independent_first:
+        costs[2:, 0] = np.iinfo(np.int32).max
+    choice = costs.argmin(axis=0)
+    filtered = candidates[choice, np.arange(len(x))].astype(np.uint8)
+    return np.hstack([choice.astype(np.uint8)[:, None], filtered]).tobytes()
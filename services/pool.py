@@ -0,0 +1,119 @@
+import multiprocessing, os, threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import config
+from services import formats, metrics, storage
+
+# Pool de processus pour le fingerprinting parallèle des copies d'une distribution.
+# Le fichier original n'est jamais transmis aux workers: ils reçoivent seulement son chemin sur le disque
+# et le chargent (puis le préparent, ex: gabarit PDF) une seule fois par distribution.
+
+_executor = None
+
+# Sources préparées en cache dans chaque processus (workers du pool, et processus web pour les copies régénérées
+# une à une): clé du fichier -> source préparée, les FINGERPRINT_SOURCE_CACHE plus récemment utilisées
+_source_cache = OrderedDict()
+_source_lock = threading.Lock()
+
+def get_executor() -> ProcessPoolExecutor:
+    """Renvoie le pool de processus partagé (créé au premier usage)."""
+    global _executor
+    if _executor is None:
+        # "spawn": les workers ne héritent ni des threads ni des connexions DB du processus web
+        _executor = ProcessPoolExecutor(max_workers=config.FINGERPRINT_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def _load_source(source_path: str, file_type: str):
+    """Charge et prépare le fichier original, une seule fois par processus tant qu'il reste dans le cache."""
+    # Les originaux sont adressés par leur SHA-256 (services/originals.py); la clé inclut aussi la date de modification
+    # et la taille: un chemin réutilisé ne sert jamais une source périmée
+    stat = os.stat(source_path)
+    key = (source_path, file_type, stat.st_mtime_ns, stat.st_size)
+    with _source_lock:
+        source = _source_cache.get(key)
+        if source is not None:
+            _source_cache.move_to_end(key)
+            return source
+    # Préparation hors du verrou: deux originaux différents se préparent en parallèle (threads du processus web)
+    metrics.observe("leakdetector_bytes_processed", stat.st_size, stage="fingerprint.prepare", file_type=file_type)
+    with metrics.timer("fingerprint.prepare", file_type=file_type):
+        source = _prepare(source_path, file_type)
+    with _source_lock:
+        _source_cache[key] = source
+        _source_cache.move_to_end(key)
+        while len(_source_cache) > max(1, config.FINGERPRINT_SOURCE_CACHE):
+            _source_cache.popitem(last=False)
+    return source
+
+def _prepare(source_path: str, file_type: str):
+    """
+    Prépare le fichier original (gabarit du format: analyse du PDF, compression de l'image PNG...).
+    Le module du format n'est importé qu'ici, au premier original de ce format traité par le processus.
+    """
+    return formats.get(file_type).prepare(source_path)
+
+def fingerprint_chunk(source_path: str, file_type: str, jobs: list, durable: bool = True) -> list:
+    """
+    Traite un lot de copies dans le processus courant.
+    - jobs: liste de (empreinte chiffrée, chemin de sortie); l'empreinte (jeton enregistré en base) est injectée telle quelle.
+    - Chaque copie est écrite directement sur le disque (pas de renvoi des octets au processus web) par le thread
+      d'écriture de services/storage.py pendant le rendu des suivantes; les copies du lot deviennent visibles ensemble,
+      jamais à moitié écrites. durable: synchroniser le lot sur le disque (OUTPUT_FSYNC), inutile pour le cache.
+    Retourne la taille de chaque copie, dans l'ordre des jobs.
+    """
+    source = _load_source(source_path, file_type)
+    with storage.WriteBehind(fsync=None if durable else False) as writer:
+        for fingerprint, output_path in jobs:
+            # Pour un TXT, les morceaux sont produits à l'écriture (copie en flux): "write" inclut la lecture de l'original
+            with metrics.timer("fingerprint.render", file_type=file_type):
+                parts = source.render_parts(fingerprint)
+            writer.submit(output_path, parts)
+        with metrics.timer("fingerprint.sync", file_type=file_type):
+            sizes = writer.close()
+    for _, _, size, seconds in writer.written:
+        metrics.observe("leakdetector_stage_seconds", seconds, stage="fingerprint.write", file_type=file_type)
+        metrics.observe("leakdetector_bytes_processed", size, stage="fingerprint.write", file_type=file_type)
+        metrics.inc("leakdetector_copies_total", file_type=file_type)
+    return sizes
+
+def _fingerprint_chunk_measured(source_path: str, file_type: str, jobs: list, durable: bool) -> tuple:
+    """
+    fingerprint_chunk exécuté dans un processus du pool: renvoie aussi ses mesures (pic de mémoire du worker compris),
+    rejouées par le processus parent.
+    """
+    with metrics.capture() as events:
+        sizes = fingerprint_chunk(source_path, file_type, jobs, durable)
+        metrics.record_peak_rss("pool")
+    return sizes, events
+
+def fingerprint_all(source_path: str, file_type: str, jobs: list, durable: bool = True) -> list:
+    """
+    Répartit les copies d'une distribution sur le pool de processus et renvoie les résultats dans l'ordre.
+    Avec un seul worker (ou une seule copie, ex: copie régénérée au téléchargement), tout est fait dans le processus
+    courant, avec la source préparée gardée en cache pour les copies suivantes du même original.
+    durable: copies synchronisées sur le disque par lot (voir fingerprint_chunk).
+    """
+    workers = config.FINGERPRINT_WORKERS
+    if workers <= 1 or len(jobs) <= 1:
+        return fingerprint_chunk(source_path, file_type, jobs, durable)
+    # Plusieurs lots par worker pour équilibrer la charge, mais assez gros pour amortir l'aller-retour IPC
+    chunk_size = max(1, -(-len(jobs) // (workers * 4)))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    executor = get_executor()
+    futures = [executor.submit(_fingerprint_chunk_measured, source_path, file_type, chunk, durable) for chunk in chunks]
+    sizes = []
+    try:
+        for future in futures:
+            chunk_sizes, events = future.result()
+            metrics.replay(events)
+            sizes.extend(chunk_sizes)
+    except BaseException:
+        # Lot en échec: annuler les lots pas encore commencés et attendre ceux en cours, pour que l'appelant
+        # (ex: jobs.fail_job, qui supprime les copies) ne voie aucune copie apparaître après coup
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        raise
+    return sizes
@@ -0,0 +1,91 @@
+import os, re, sys, threading, time
+from collections import Counter
+
+import config
+
+# Profileur par échantillonnage, à la demande, pour une requête lente précise (désactivé par défaut: PROFILING_ENABLED).
+# Une requête authentifiée portant l'en-tête "X-Profile: 1" est profilée: un thread relève toutes les
+# PROFILE_INTERVAL_MS millisecondes la pile de chaque thread du processus (sys._current_frames) pendant
+# la requête, puis les piles sont écrites au format "folded" (une ligne "f1;f2;f3 N" par pile distincte),
+# lisible par flamegraph.pl, speedscope ou inferno. Le chemin du fichier est renvoyé dans l'en-tête X-Profile-File.
+# Les threads inactifs (en attente d'un verrou, d'une file ou d'une socket) sont ignorés.
+
+_IDLE_FUNCTIONS = {"wait", "select", "poll", "epoll", "_recv", "accept", "get", "sleep", "_worker", "run_forever"}
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+class Sampler:
+    """Échantillonne les piles de tous les threads (sauf le sien) jusqu'à stop()."""
+
+    def __init__(self, interval: float = None):
+        self.interval = interval if interval is not None else config.PROFILE_INTERVAL_MS / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_name in _IDLE_FUNCTIONS:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def _authorized(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return scheme.lower() == "bearer" and token == config.API_TOKEN
+    return False
+
+def _wants_profile(scope) -> bool:
+    return any(name == b"x-profile" and value == b"1" for name, value in scope["headers"]) and _authorized(scope)
+
+class ProfilerMiddleware:
+    """Middleware ASGI: profile les requêtes marquées "X-Profile: 1" quand PROFILING_ENABLED est actif."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not config.PROFILING_ENABLED or not _wants_profile(scope):
+            return await self.app(scope, receive, send)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        path = os.path.join(config.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{slug}-{os.getpid()}.folded")
+        sampler = Sampler().start()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-file", path.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            sampler.dump(path)
@@ -0,0 +1,203 @@
+import hashlib, json, os, re, secrets, shutil, time
+from fastapi import HTTPException
+
+import config
+from services import formats
+from services.uploads import CHUNK_SIZE, UploadTooLarge
+
+# Uploads reprenables, par morceaux numérotés (gros originaux, échantillons de fuite de plusieurs Go).
+# Une session est un répertoire de UPLOAD_SESSION_DIR:
+# - meta.json: nom, taille totale, taille des morceaux, SHA-256 attendu (facultatif), date de création, et type du
+#   fichier, reconnu dès la réception du morceau 0 (un fichier trop gros pour son format est refusé à ce moment-là);
+# - data: le fichier final, alloué à sa taille; chaque morceau est écrit directement à sa position
+#   (os.pwrite), dans n'importe quel ordre et en parallèle;
+# - chunks/<n>: marqueur créé une fois le morceau n entièrement reçu et sa somme de contrôle vérifiée.
+# L'état est entièrement sur le disque (aucun verrou en mémoire): plusieurs workers uvicorn/gunicorn peuvent
+# recevoir les morceaux d'une même session. La finalisation sort le fichier de la session (renommage
+# atomique vers JOB_SPOOL_DIR, une seule finalisation possible) et le confie au pipeline de distribution
+# ou de scan comme un upload classique. Les sessions inactives depuis UPLOAD_SESSION_TTL sont supprimées.
+
+_UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+def _session_dir(upload_id: str) -> str:
+    if not _UPLOAD_ID.fullmatch(upload_id):
+        raise HTTPException(status_code=404, detail="Session d'upload introuvable.")
+    return os.path.join(config.UPLOAD_SESSION_DIR, upload_id)
+
+def load(upload_id: str) -> dict:
+    """Métadonnées d'une session (HTTPException 404 si elle n'existe pas ou a expiré)."""
+    try:
+        with open(os.path.join(_session_dir(upload_id), "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Session d'upload introuvable.")
+
+def purge_expired() -> int:
+    """Supprime les sessions sans activité depuis UPLOAD_SESSION_TTL secondes. Retourne leur nombre."""
+    deadline = time.time() - config.UPLOAD_SESSION_TTL
+    removed = 0
+    for name in os.listdir(config.UPLOAD_SESSION_DIR):
+        path = os.path.join(config.UPLOAD_SESSION_DIR, name)
+        try:
+            last_activity = os.path.getmtime(os.path.join(path, "chunks"))
+        except OSError:
+            last_activity = 0
+        if last_activity < deadline:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def create(filename: str, size: int, sha256: str = None) -> dict:
+    """
+    Ouvre une session pour un fichier de size octets (RESUMABLE_MAX_SIZE_MB au plus; la limite de son format est
+    vérifiée à la finalisation, une fois le type connu). Retourne ses métadonnées (avec upload_id).
+    """
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Fichier vide ou illisible.")
+    if size > config.RESUMABLE_MAX_SIZE:
+        raise UploadTooLarge(config.RESUMABLE_MAX_SIZE)
+    if sha256 is not None and not re.fullmatch(r"[0-9a-fA-F]{64}", sha256):
+        raise HTTPException(status_code=400, detail="Somme de contrôle SHA-256 invalide.")
+    purge_expired()
+    upload_id = secrets.token_hex(16)
+    path = os.path.join(config.UPLOAD_SESSION_DIR, upload_id)
+    os.makedirs(os.path.join(path, "chunks"))
+    chunk_size = min(config.UPLOAD_CHUNK_SIZE, size)
+    meta = {"upload_id": upload_id, "filename": filename, "size": size, "chunk_size": chunk_size,
+            "chunk_count": -(-size // chunk_size), "sha256": sha256.lower() if sha256 else None,
+            "created_at": time.time(), "file_type": None}
+    # Fichier final alloué d'emblée (creux sur la plupart des systèmes de fichiers)
+    with open(os.path.join(path, "data"), "wb") as f:
+        f.truncate(size)
+    _save_meta(path, meta)
+    return meta
+
+def _save_meta(directory: str, meta: dict) -> None:
+    tmp_path = os.path.join(directory, f"meta.json.tmp-{secrets.token_hex(4)}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+def _received(upload_id: str) -> list:
+    return sorted(int(name) for name in os.listdir(os.path.join(_session_dir(upload_id), "chunks")) if name.isdigit())
+
+def status(upload_id: str) -> dict:
+    """État d'une session: morceaux reçus et position jusqu'à laquelle le fichier est reçu sans trou."""
+    meta = load(upload_id)
+    received = _received(upload_id)
+    contiguous = 0
+    while contiguous < len(received) and received[contiguous] == contiguous:
+        contiguous += 1
+    received_set = set(received)
+    return {
+        **meta,
+        "received_chunks": received,
+        "missing_chunks": [i for i in range(meta["chunk_count"]) if i not in received_set],
+        "offset": min(meta["size"], contiguous * meta["chunk_size"]),
+        "expires_at": os.path.getmtime(os.path.join(_session_dir(upload_id), "chunks")) + config.UPLOAD_SESSION_TTL,
+    }
+
+class ChunkWriter:
+    """Écriture d'un morceau à sa position dans le fichier de la session, par petits blocs, SHA-256 calculé au fil de l'eau."""
+
+    def __init__(self, upload_id: str, index: int):
+        meta = load(upload_id)
+        if not 0 <= index < meta["chunk_count"]:
+            raise HTTPException(status_code=416, detail=f"Numéro de morceau hors limites (0 à {meta['chunk_count'] - 1}).")
+        self.meta = meta
+        self.directory = _session_dir(upload_id)
+        self.index = index
+        self.offset = index * meta["chunk_size"]
+        self.expected = min(meta["chunk_size"], meta["size"] - self.offset)
+        self.written = 0
+        self.hasher = hashlib.sha256()
+        self.fd = os.open(os.path.join(self.directory, "data"), os.O_WRONLY)
+
+    def write(self, data: bytes) -> None:
+        if self.written + len(data) > self.expected:
+            raise HTTPException(status_code=413, detail=f"Morceau {self.index} plus long que prévu ({self.expected} octets).")
+        self.hasher.update(data)
+        view = memoryview(data)
+        while view:
+            count = os.pwrite(self.fd, view, self.offset + self.written)
+            self.written += count
+            view = view[count:]
+
+    def commit(self, checksum: str = None) -> dict:
+        """Vérifie la longueur et la somme de contrôle du morceau, puis le marque reçu."""
+        if self.written != self.expected:
+            raise HTTPException(status_code=400, detail=f"Morceau {self.index} incomplet ({self.written}/{self.expected} octets).")
+        digest = self.hasher.hexdigest()
+        if checksum is not None and checksum.lower() != digest:
+            raise HTTPException(status_code=400, detail=f"Somme de contrôle du morceau {self.index} invalide.")
+        os.fsync(self.fd)
+        if self.index == 0:
+            self._check_type()
+        marker = os.path.join(self.directory, "chunks", str(self.index))
+        with open(marker + ".tmp", "w") as f:
+            f.write(digest)
+        os.replace(marker + ".tmp", marker)
+        # Dernière activité de la session (expiration)
+        os.utime(os.path.join(self.directory, "chunks"))
+        return {"index": self.index, "size": self.written, "sha256": digest}
+
+    def _check_type(self) -> None:
+        """
+        Reconnaît le type du fichier d'après le début du morceau 0 et l'enregistre dans meta.json. Un type non supporté
+        (400) ou une taille annoncée au-delà de la limite du format (413) met fin à la session, sans attendre la suite.
+        """
+        with open(os.path.join(self.directory, "data"), "rb") as f:
+            file_type = formats.sniff(f.read(min(formats.SNIFF_SIZE, self.expected)), self.meta["filename"])
+        if file_type is None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            raise HTTPException(status_code=400, detail="Type de fichier non supporté. Veuillez fournir un PDF, PNG ou TXT.")
+        max_size = formats.FORMATS[file_type].max_size
+        if self.meta["size"] > max_size:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            raise UploadTooLarge(max_size)
+        _save_meta(self.directory, {**self.meta, "file_type": file_type})
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+def assemble(upload_id: str, hasher=None) -> tuple:
+    """
+    Finalise une session complète: le fichier est sorti de la session (renommage atomique vers JOB_SPOOL_DIR,
+    une seule finalisation réussit) et son SHA-256 est calculé, puis comparé à celui annoncé s'il y en a un.
+    Retourne (chemin du fichier, nom d'origine, SHA-256); le fichier est à la charge de l'appelant.
+    HTTPException 409 s'il manque des morceaux (leur liste est dans le message), 404 si la session n'existe plus.
+    """
+    meta = load(upload_id)
+    missing = status(upload_id)["missing_chunks"]
+    if missing:
+        shown = ", ".join(str(i) for i in missing[:20]) + (", ..." if len(missing) > 20 else "")
+        raise HTTPException(status_code=409, detail=f"Upload incomplet: {len(missing)} morceau(x) manquant(s) ({shown}).")
+    directory = _session_dir(upload_id)
+    path = os.path.join(config.JOB_SPOOL_DIR, f"upload_{upload_id}")
+    try:
+        os.replace(os.path.join(directory, "data"), path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Session d'upload introuvable (déjà finalisée).")
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        hasher = hasher or hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(CHUNK_SIZE)
+                if not block:
+                    break
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        if meta["sha256"] and meta["sha256"] != digest:
+            raise HTTPException(status_code=400, detail="Somme de contrôle SHA-256 du fichier assemblé invalide.")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, meta["filename"], digest
+
+def discard(upload_id: str) -> None:
+    """Abandonne une session et supprime ce qui a été reçu."""
+    directory = _session_dir(upload_id)
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail="Session d'upload introuvable.")
+    shutil.rmtree(directory, ignore_errors=True)
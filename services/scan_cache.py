@@ -0,0 +1,111 @@
+import json, threading, time
+from datetime import datetime
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import config, models
+from models import ScanCacheEntry
+
+# Cache des verdicts de /api/scan, indexé par (SHA-256 du fichier, type de fichier), à deux niveaux:
+# - un LRU borné en mémoire (par processus), avec une durée de validité SCAN_CACHE_TTL;
+# - la table scan_cache en base, partagée par tous les processus. Les verdicts positifs y sont liés
+#   à leur distribution par une clé étrangère ON DELETE CASCADE: supprimer une distribution les invalide.
+# Les verdicts négatifs sont aussi mis en cache (même fichier re-soumis = même réponse), mais seulement
+# SCAN_CACHE_NEGATIVE_TTL secondes: l'index d'un autre processus peut ignorer encore une copie toute récente,
+# un "not_found" ne doit pas survivre à son rafraîchissement.
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # (sha256, file_type) -> (expiration, distribution_id, résultat)
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+def _ttl(distribution_id) -> int:
+    return config.SCAN_CACHE_TTL if distribution_id is not None else min(config.SCAN_CACHE_TTL, config.SCAN_CACHE_NEGATIVE_TTL)
+
+def _remember(key, distribution_id, result: dict, ttl: float = None) -> None:
+    with _lock:
+        _entries[key] = (time.monotonic() + (_ttl(distribution_id) if ttl is None else ttl), distribution_id, result)
+        _entries.move_to_end(key)
+        while len(_entries) > config.SCAN_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+def _memory_get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                _entries.move_to_end(key)
+                _stats["memory_hits"] += 1
+                return entry[2]
+            del _entries[key]
+    return None
+
+def _from_row(key, row):
+    ttl = None
+    if row is not None and row.distribution_id is None:
+        # Verdict négatif: valable SCAN_CACHE_NEGATIVE_TTL secondes après son enregistrement
+        age = (datetime.utcnow() - row.created_at).total_seconds() if row.created_at else float("inf")
+        remaining = config.SCAN_CACHE_NEGATIVE_TTL - age
+        if remaining <= 0:
+            row = None
+        ttl = min(_ttl(None), remaining)
+    if row is None:
+        _count("misses")
+        return None
+    result = json.loads(row.result)
+    _remember(key, row.distribution_id, result, ttl)
+    _count("db_hits")
+    return result
+
+def get(db, sha256: str, file_type: str):
+    """Renvoie le verdict en cache pour ce fichier, ou None (mémoire d'abord, puis base)."""
+    key = (sha256, file_type)
+    result = _memory_get(key)
+    if result is not None:
+        return result
+    return _from_row(key, db.query(ScanCacheEntry).get(key))
+
+async def get_async(sha256: str, file_type: str):
+    """Comme get, depuis un endpoint asynchrone (lecture en base par models.read)."""
+    key = (sha256, file_type)
+    result = _memory_get(key)
+    if result is not None:
+        return result
+    rows = await models.read(select(ScanCacheEntry).filter(ScanCacheEntry.sha256 == sha256,
+                                                           ScanCacheEntry.file_type == file_type), scalars=True)
+    return _from_row(key, rows[0] if rows else None)
+
+def put(db, sha256: str, file_type: str, result: dict, distribution_id: int = None) -> None:
+    """Enregistre un verdict (positif si distribution_id est fourni, négatif sinon) dans les deux niveaux."""
+    key = (sha256, file_type)
+    _remember(key, distribution_id, result)
+    # merge: remplace un verdict négatif expiré (ou devenu positif) déjà en base
+    db.merge(ScanCacheEntry(sha256=sha256, file_type=file_type, distribution_id=distribution_id,
+                            result=json.dumps(result), created_at=datetime.utcnow()))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Même fichier scanné en parallèle par une autre requête: l'entrée existe déjà
+        db.rollback()
+
+def invalidate_distribution(distribution_id: int) -> None:
+    """Retire du LRU local les verdicts liés à une distribution (la base est nettoyée par la cascade)."""
+    with _lock:
+        for key in [k for k, v in _entries.items() if v[1] == distribution_id]:
+            del _entries[key]
+
+def stats() -> dict:
+    """Compteurs de succès/échecs du cache (processus courant)."""
+    with _lock:
+        hits = _stats["memory_hits"] + _stats["db_hits"]
+        lookups = hits + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(_entries),
+            "memory_capacity": config.SCAN_CACHE_SIZE,
+        }
@@ -0,0 +1,101 @@
+import os
+from urllib.parse import quote
+from email.utils import formatdate
+from fastapi.responses import FileResponse, Response
+from starlette.datastructures import MutableHeaders
+
+import config
+from services import metrics
+
+# Envoi des fichiers téléchargés (copies fingerprintées) sans que leurs octets passent par Python:
+# - DOWNLOAD_ACCEL_PREFIX défini (Nginx devant l'application, voir README): la réponse ne porte qu'un en-tête
+#   X-Accel-Redirect vers une location interne de Nginx, qui envoie le fichier lui-même (sendfile, requêtes Range);
+#   le worker est libéré aussitôt. Seuls les fichiers sous DOWNLOAD_ACCEL_ROOT peuvent être délégués ainsi. La location
+#   interne doit reprendre l'ETag et le Last-Modified de la réponse (voir README): ceux que Nginx tire du fichier
+#   changent à chaque téléchargement (date d'accès du cache des copies, services/copies.py).
+# - sinon SendfileResponse: requêtes Range (206/416, If-Range) gérées par Starlette; envoi zéro-copie quand le serveur
+#   ASGI propose l'extension "http.response.zerocopy" (ou "http.response.pathsend"), sinon lecture par blocs de 1 Mo.
+# Validateurs: ETag (identité stable de la copie fournie par l'appelant, à défaut taille et date du fichier) et
+# Last-Modified; If-None-Match est traité avant tout envoi (304), délégation à Nginx comprise.
+
+def stat_etag(stat_result) -> str:
+    """ETag d'un fichier d'après sa taille et sa date de modification (fichiers sans identité plus stable)."""
+    return f'"{stat_result.st_size:x}-{int(stat_result.st_mtime * 1000):x}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match correspond-il à l'ETag? (comparaison faible: le préfixe W/ est ignoré)"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (value.strip() for value in if_none_match.split(","))
+    return etag.removeprefix("W/") in (value.removeprefix("W/") for value in candidates)
+
+def validators(etag: str, last_modified: float) -> dict:
+    """En-têtes de validation d'un téléchargement (le client revalide à chaque fois: 304 si rien n'a changé)."""
+    return {"ETag": etag, "Last-Modified": formatdate(last_modified, usegmt=True), "Cache-Control": "private, no-cache"}
+
+def not_modified(headers: dict) -> Response:
+    """Réponse 304 (If-None-Match correspond), avec les en-têtes de validators()."""
+    metrics.inc("leakdetector_downloads_total", mode="not_modified")
+    return Response(status_code=304, headers=headers)
+
+def accel_location(path: str) -> str:
+    """URI interne Nginx d'un fichier (X-Accel-Redirect), ou None si le fichier est hors de DOWNLOAD_ACCEL_ROOT."""
+    root = os.path.realpath(config.DOWNLOAD_ACCEL_ROOT)
+    relative = os.path.relpath(os.path.realpath(path), root)
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep) or os.path.isabs(relative):
+        return None
+    return config.DOWNLOAD_ACCEL_PREFIX.rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))
+
+class SendfileResponse(FileResponse):
+    """FileResponse envoyée en zéro-copie quand le serveur ASGI le permet (extension "http.response.zerocopy")."""
+
+    chunk_size = 1024 * 1024
+
+    async def __call__(self, scope, receive, send):
+        extensions = scope.get("extensions") or {}
+        self.zerocopy = "http.response.zerocopy" in extensions
+        zerocopy = self.zerocopy or "http.response.pathsend" in extensions
+        metrics.inc("leakdetector_downloads_total", mode="zerocopy" if zerocopy else "stream")
+        await super().__call__(scope, receive, send)
+
+    async def _send_zerocopy(self, send, offset: int, count: int = None) -> None:
+        message = {"type": "http.response.zerocopy", "offset": offset, "more_body": False}
+        if count is not None:
+            message["count"] = count
+        with open(self.path, "rb") as file:
+            await send({**message, "file": file})
+
+    async def _handle_simple(self, send, send_header_only: bool, send_pathsend: bool) -> None:
+        if not self.zerocopy or send_header_only or send_pathsend:
+            return await super()._handle_simple(send, send_header_only, send_pathsend)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await self._send_zerocopy(send, 0, None)
+
+    async def _handle_single_range(self, send, start: int, end: int, file_size: int, send_header_only: bool) -> None:
+        if not self.zerocopy or send_header_only:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        headers = MutableHeaders(raw=list(self.raw_headers))
+        headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": headers.raw})
+        await self._send_zerocopy(send, start, end - start)
+
+def send_file(path: str, filename: str, if_none_match: str = None, etag: str = None, last_modified: float = None,
+              media_type: str = "application/octet-stream") -> Response:
+    """
+    Réponse de téléchargement d'un fichier: 304 si If-None-Match correspond, X-Accel-Redirect si la délégation à Nginx
+    est active, sinon SendfileResponse. etag: identité stable du contenu (à défaut, taille et date du fichier);
+    last_modified: horodatage (s) à annoncer (à défaut, date du fichier).
+    """
+    stat_result = os.stat(path)
+    etag = etag or stat_etag(stat_result)
+    headers = validators(etag, last_modified if last_modified is not None else stat_result.st_mtime)
+    if if_none_match and etag_matches(if_none_match, etag):
+        return not_modified(headers)
+    location = accel_location(path) if config.DOWNLOAD_ACCEL_PREFIX else None
+    if location is None:
+        return SendfileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat_result)
+    metrics.inc("leakdetector_downloads_total", mode="accel")
+    # Corps vide: Nginx remplace la réponse par le fichier et garde Content-Type, Content-Disposition et Cache-Control
+    headers["Content-Disposition"] = SendfileResponse(path, filename=filename, stat_result=stat_result).headers["content-disposition"]
+    return Response(status_code=200, media_type=media_type, headers={**headers, "X-Accel-Redirect": location})
@@ -0,0 +1,109 @@
+import hashlib, os, queue, threading, time
+
+import config
+
+# Stockage des copies fingerprintées écrites sur le disque (mode "eager", cache des copies régénérées).
+# - Arborescence répartie par hachage: COPIES_DIR/ab/cd/<nom>, où abcd sont les premiers caractères hexadécimaux
+#   du SHA-256 de l'ID de la copie (65536 répertoires): aucun répertoire ne grossit avec l'historique.
+# - Écriture atomique: fichier temporaire dans le répertoire de destination, renommé une fois complet
+#   (une copie n'est jamais visible à moitié écrite).
+# - WriteBehind: les copies d'un lot sont écrites par un thread dédié, via une file bornée, pendant que le
+#   processus produit les suivantes (le rendu et les écritures se chevauchent). À la fin du lot, les données sont
+#   synchronisées (fsync, si OUTPUT_FSYNC) en une passe, puis les copies renommées, puis chaque répertoire touché
+#   synchronisé une seule fois: plus de fsync du répertoire par fichier.
+# Les chemins existants (avant cette arborescence) se migrent avec `python migrate_storage.py`.
+
+def shard(file_id: int) -> str:
+    """Sous-répertoire (deux niveaux) d'une copie, d'après le hachage de son ID."""
+    digest = hashlib.sha256(str(file_id).encode("ascii")).hexdigest()
+    return os.path.join(digest[:2], digest[2:4])
+
+def copy_path(file_id: int, name: str) -> str:
+    """Chemin d'une copie dans l'arborescence répartie (son nom sert aussi au téléchargement)."""
+    return os.path.join(config.COPIES_DIR, shard(file_id), name)
+
+def _fsync_path(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class WriteBehind:
+    """
+    Écritures d'un lot de copies par un thread dédié, derrière une file bornée (STORAGE_WRITE_QUEUE copies en attente).
+    submit() rend la main dès que la copie est en file; close() attend la fin des écritures, synchronise le lot en une
+    passe et rend les copies visibles. Les mesures sont émises par le thread appelant (voir metrics.capture).
+    """
+
+    _END = object()
+
+    def __init__(self, fsync: bool = None, max_pending: int = None):
+        self.fsync = config.OUTPUT_FSYNC if fsync is None else fsync
+        self.written = []  # (fichier temporaire, chemin final, taille, durée de l'écriture)
+        self.error = None
+        self._queue = queue.Queue(maxsize=max(1, max_pending or config.STORAGE_WRITE_QUEUE))
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is self._END:
+                return
+            if self.error is not None:
+                continue  # Lot déjà en échec: vider la file sans écrire
+            path, parts = item
+            tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            started = time.perf_counter()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.writelines(parts)
+                    size = f.tell()
+            except BaseException as e:
+                self.error = e
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                continue
+            self.written.append((tmp_path, path, size, time.perf_counter() - started))
+
+    def submit(self, path: str, parts) -> None:
+        """Met une copie (morceaux d'octets, éventuellement produits au fil de l'écriture) en file d'écriture."""
+        if self.error is not None:
+            raise self.error
+        self._queue.put((path, parts))
+
+    def _abort(self) -> None:
+        for tmp_path, _, _, _ in self.written:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def close(self) -> list:
+        """Attend les écritures, synchronise et rend visibles les copies du lot. Retourne leurs tailles, dans l'ordre."""
+        self._queue.put(self._END)
+        self._thread.join()
+        if self.error is not None:
+            self._abort()
+            raise self.error
+        if self.fsync:
+            for tmp_path, _, _, _ in self.written:
+                _fsync_path(tmp_path)
+        for tmp_path, path, _, _ in self.written:
+            os.replace(tmp_path, path)
+        if self.fsync:
+            # Renommages durables: un fsync par répertoire touché, pas par fichier
+            for directory in {os.path.dirname(path) for _, path, _, _ in self.written}:
+                _fsync_path(directory)
+        return [size for _, _, size, _ in self.written]
+
+    def __enter__(self) -> "WriteBehind":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            # Échec du producteur: arrêter le thread et supprimer ce qu'il a déjà écrit
+            self.error = self.error or exc
+            self._queue.put(self._END)
+            self._thread.join()
+            self._abort()
@@ -0,0 +1,155 @@
+import mmap, os, time
+
+import crypto
+from services import metrics
+
+# Format texte (chargé au premier usage, voir services/formats.py): empreinte en caractères invisibles
+# (zero-width) ajoutés en fin de texte. Aucune dépendance lourde: un traitement purement texte
+# n'importe ni PyMuPDF, ni PIL, ni NumPy.
+
+# Caractères invisibles utilisés pour le tatouage des fichiers texte
+ZERO_WIDTH_0 = '\u200B'  # Zero-width space (représente un bit 0)
+ZERO_WIDTH_1 = '\u200C'  # Zero-width non-joiner (représente un bit 1)
+
+# Espaces de fin de texte retirés avant la séquence invisible (au niveau des octets, comme bytes.rstrip())
+_TRAILING_WHITESPACE = b" \t\r\n\x0b\x0c"
+TXT_CHUNK_SIZE = 1024 * 1024
+
+def _zero_width_trailer(fingerprint: str) -> bytes:
+    """
+    Séquence à ajouter en fin de texte: une nouvelle ligne puis les bits du jeton (binaire brut pour un jeton v2),
+    précédés de leur nombre d'octets sur 16 bits, encodés en U+200B (bit 0) et U+200C (bit 1), en UTF-8.
+    """
+    fingerprint_bytes = crypto.token_bytes(fingerprint)
+    length = len(fingerprint_bytes)
+    if length > 65535:
+        raise ValueError("Empreinte trop longue à insérer dans le texte.")
+    data_bits = [(length >> i) & 1 for i in range(15, -1, -1)]
+    for byte in fingerprint_bytes:
+        for i in range(7, -1, -1):
+            data_bits.append((byte >> i) & 1)
+    hidden_seq = ''.join([ZERO_WIDTH_0 if bit == 0 else ZERO_WIDTH_1 for bit in data_bits])
+    return ("\n" + hidden_seq).encode('utf-8')
+
+def embed_fingerprint_txt(text_bytes: bytes, fingerprint: str) -> bytes:
+    """
+    Insère l'empreinte (jeton, forme base64) dans un fichier texte en utilisant des caractères invisibles (zéro-width).
+    - Les espaces et sauts de ligne de fin sont retirés, puis la séquence invisible est ajoutée après une nouvelle ligne.
+    - Le texte d'origine est conservé octet pour octet (pas de décodage ni de réencodage).
+    Pour les gros fichiers, voir TxtFingerprintTemplate (copie en flux, mémoire constante).
+    """
+    return text_bytes.rstrip(_TRAILING_WHITESPACE) + _zero_width_trailer(fingerprint)
+
+class TxtFingerprintTemplate:
+    """
+    Gabarit texte pour fingerprinter un même fichier (éventuellement de plusieurs Go) pour de nombreux destinataires.
+    La fin du contenu (avant les espaces de fin) est repérée une fois, en lisant le fichier à rebours depuis la fin;
+    chaque copie est ensuite produite en flux: le fichier d'origine recopié par morceaux, puis la séquence invisible.
+    Même résultat qu'embed_fingerprint_txt, en mémoire constante.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.content_end = self._content_end(f)
+
+    @staticmethod
+    def _content_end(f) -> int:
+        """Position de fin du contenu une fois les espaces de fin retirés."""
+        pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            size = min(TXT_CHUNK_SIZE, pos)
+            f.seek(pos - size)
+            kept = len(f.read(size).rstrip(_TRAILING_WHITESPACE))
+            if kept:
+                return pos - size + kept
+            pos -= size
+        return 0
+
+    def render_parts(self, fingerprint: str):
+        """Produit la copie fingerprintée sous forme de morceaux (générateur) à écrire à la suite."""
+        trailer = _zero_width_trailer(fingerprint)
+        with open(self.path, "rb") as f:
+            remaining = self.content_end
+            while remaining > 0:
+                chunk = f.read(min(TXT_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        yield trailer
+
+    def render(self, fingerprint: str) -> bytes:
+        """Produit la copie fingerprintée en mémoire (petits fichiers)."""
+        return b"".join(self.render_parts(fingerprint))
+
+def prepare(path: str) -> TxtFingerprintTemplate:
+    """Gabarit de l'original: le texte n'est jamais chargé en mémoire, chaque copie est recopiée en flux depuis le disque."""
+    return TxtFingerprintTemplate(path)
+
+_ZW_BYTES = {ZERO_WIDTH_0.encode('utf-8'): 0, ZERO_WIDTH_1.encode('utf-8'): 1}
+_TRAILER_SKIP = b" \t\r\n"
+
+def _zero_width_bits(buffer) -> list:
+    """
+    Bits de la séquence invisible en fin de texte (après le dernier caractère visible), lue à rebours sur les octets
+    UTF-8 (bytes ou mmap): seuls les derniers octets du fichier sont parcourus, quel que soit sa taille.
+    """
+    end = len(buffer)
+    i = end
+    while i > 0:
+        if buffer[i - 1] in _TRAILER_SKIP:
+            i -= 1
+        elif i >= 3 and buffer[i - 3:i] in _ZW_BYTES:
+            i -= 3
+        else:
+            break
+    trailer = buffer[i:end]
+    bits = []
+    j = 0
+    while j < len(trailer):
+        bit = _ZW_BYTES.get(trailer[j:j + 3])
+        if bit is None:
+            j += 1  # saut de ligne ou espace
+        else:
+            bits.append(bit)
+            j += 3
+    return bits
+
+def extract_fingerprint_from_txt(source) -> str:
+    """Extrait la chaîne d'empreinte cachée dans un fichier texte en utilisant les caractères invisibles."""
+    if isinstance(source, str):
+        # Fichier projeté en mémoire: seule la séquence finale est lue (mémoire constante, même pour plusieurs Go)
+        with open(source, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                bits = _zero_width_bits(mm)
+    else:
+        bits = _zero_width_bits(source)
+    if len(bits) < 16:
+        return None  # Pas d'empreinte
+    # Lire la longueur encodée sur les 16 premiers bits
+    length_bits = bits[:16]
+    length = 0
+    for bit in length_bits:
+        length = (length << 1) | bit
+    if length <= 0:
+        return None
+    # Lire les bits de données (8 * longueur caractères)
+    data_bits = bits[16:16 + length * 8]
+    data_bytes = bytearray()
+    for j in range(0, len(data_bits), 8):
+        byte = 0
+        for b in data_bits[j:j+8]:
+            byte = (byte << 1) | b
+        data_bytes.append(byte)
+    return crypto.token_from_bytes(bytes(data_bytes))
+
+def candidates(source, full_scan: bool = False, accept=None, timings: dict = None) -> list:
+    """Jeton candidat d'un texte (au plus un). full_scan et accept sont sans objet pour ce format."""
+    start = time.perf_counter()
+    fingerprint = extract_fingerprint_from_txt(source)
+    if timings is not None:
+        timings["txt.zero_width"] = metrics.elapsed_ms(start)
+    return [fingerprint] if fingerprint else []
@@ -0,0 +1,100 @@
+import json, os, tempfile
+from fastapi import HTTPException, UploadFile
+
+import config
+
+# Gestion des fichiers uploadés: jamais chargés entièrement en mémoire.
+# - UploadSizeLimitMiddleware rejette (413) les corps de requête trop gros, dès l'en-tête Content-Length
+#   ou au fil de la réception, avant même que le multipart soit entièrement analysé.
+# - spool_upload copie l'upload par morceaux dans un fichier sur le disque et renvoie son chemin;
+#   les injecteurs/extracteurs ouvrent ensuite ce fichier directement (PyMuPDF, PIL, mmap).
+
+CHUNK_SIZE = 1024 * 1024
+# Marge pour l'enveloppe multipart (en-têtes, champs de formulaire) autour du fichier lui-même
+MULTIPART_OVERHEAD = 1024 * 1024
+
+class UploadTooLarge(HTTPException):
+    """Corps de requête trop gros (HTTPException: l'analyse du formulaire la laisse remonter telle quelle)."""
+
+    def __init__(self, limit: int = None):
+        limit_mb = (config.MAX_FILE_SIZE if limit is None else limit) // (1024 * 1024)
+        super().__init__(status_code=413, detail=f"Fichier trop volumineux (maximum {limit_mb} Mo).")
+
+def spool_upload(file: UploadFile, directory: str = None, prefix: str = "upload_", hasher=None, max_size: int = None) -> str:
+    """
+    Copie un fichier uploadé sur le disque par morceaux, en appliquant la limite MAX_FILE_SIZE_MB (ou max_size).
+    Si hasher est fourni (ex: hashlib.sha256()), il est alimenté au fil de la copie.
+    Retourne le chemin du fichier créé (à supprimer par l'appelant). Lève HTTPException 400/413.
+    """
+    return spool_stream(file.file, directory, prefix, hasher, max_size)
+
+def spool_stream(stream, directory: str = None, prefix: str = "upload_", hasher=None, max_size: int = None) -> str:
+    """Comme spool_upload, pour n'importe quel flux binaire (ex: membre d'une archive ZIP)."""
+    max_size = max_size or config.MAX_FILE_SIZE
+    fd, path = tempfile.mkstemp(dir=directory, prefix=prefix)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(max_size)
+                if hasher is not None:
+                    hasher.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Fichier vide ou illisible.")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+class UploadSizeLimitMiddleware:
+    """Middleware ASGI qui refuse les corps de requête dépassant la taille maximale d'upload."""
+
+    def __init__(self, app, max_body_size: int = None, path_limits: dict = None):
+        self.app = app
+        self.max_body_size = max_body_size or (config.MAX_FILE_SIZE + MULTIPART_OVERHEAD)
+        # Limites spécifiques par chemin (ex: scan groupé d'une archive)
+        self.path_limits = path_limits or {}
+
+    async def _reject(self, send, limit: int):
+        body = json.dumps({"detail": UploadTooLarge(limit).detail}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+        max_body_size = self.path_limits.get(scope["path"], self.max_body_size)
+        # Rejet immédiat si la taille annoncée dépasse la limite
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > max_body_size:
+                return await self._reject(send, max_body_size)
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    raise UploadTooLarge(max_body_size)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            if not response_started:
+                await self._reject(send, max_body_size)
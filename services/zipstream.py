@@ -0,0 +1,119 @@
+import os, struct, time, zlib
+
+import config
+
+# Écriture d'archives ZIP en flux continu (sans BytesIO ni seek):
+# chaque entrée est lue par morceaux depuis le disque et émise immédiatement. Le CRC et les tailles
+# ne sont connus qu'à la fin de l'entrée: ils sont écrits dans un "data descriptor" (bit 3 des flags)
+# puis dans le répertoire central en fin d'archive. ZIP64 est utilisé dès qu'une taille ou un offset
+# dépasse 4 Go. La mémoire utilisée ne dépend que de la taille des morceaux, pas de celle de l'archive.
+
+# Formats déjà compressés: stockés tels quels (les recompresser coûte du CPU pour un gain nul)
+COMPRESSED_EXTENSIONS = {".png", ".pdf", ".zip", ".gz", ".jpg", ".jpeg", ".docx", ".xlsx", ".pptx"}
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_ZIP64_LIMIT = 0xFFFFFFFF
+# Marge pour le cas (rare) où la compression fait grossir les données
+_ZIP64_THRESHOLD = _ZIP64_LIMIT - (1 << 20)
+
+def _dos_datetime(timestamp: float):
+    """Convertit un timestamp en (heure, date) au format MS-DOS."""
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+def _read_chunks(path: str, chunk_size: int):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def stream_zip(entries, store_compressed: bool = None, chunk_size: int = None):
+    """
+    Génère les octets d'une archive ZIP à partir de fichiers sur le disque.
+    - entries: itérable de (chemin sur le disque, nom dans l'archive).
+    - store_compressed: stocker sans deflate les formats déjà compressés (PNG, PDF...).
+    Les valeurs par défaut viennent de config (ZIP_STORE_COMPRESSED, ZIP_CHUNK_SIZE).
+    """
+    if store_compressed is None:
+        store_compressed = config.ZIP_STORE_COMPRESSED
+    if chunk_size is None:
+        chunk_size = config.ZIP_CHUNK_SIZE
+    central = []
+    offset = 0
+    for path, arcname in entries:
+        stat = os.stat(path)
+        name = arcname.encode("utf-8")
+        ext = os.path.splitext(arcname)[1].lower()
+        method = 0 if store_compressed and ext in COMPRESSED_EXTENSIONS else 8
+        zip64 = stat.st_size >= _ZIP64_THRESHOLD
+        version = 45 if zip64 else 20
+        dos_time, dos_date = _dos_datetime(stat.st_mtime)
+        flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8
+        # En-tête local: CRC et tailles à zéro (connus seulement après les données)
+        if zip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+            sizes = (_ZIP64_LIMIT, _ZIP64_LIMIT)
+        else:
+            extra = b""
+            sizes = (0, 0)
+        header = struct.pack("<IHHHHHIIIHH", 0x04034B50, version, flags, method, dos_time, dos_date,
+                             0, sizes[0], sizes[1], len(name), len(extra)) + name + extra
+        yield header
+        # Données, émises au fil de la lecture
+        crc = 0
+        usize = csize = 0
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if method == 8 else None
+        for chunk in _read_chunks(path, chunk_size):
+            crc = zlib.crc32(chunk, crc)
+            usize += len(chunk)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                csize += len(chunk)
+                yield chunk
+        if compressor:
+            tail = compressor.flush()
+            csize += len(tail)
+            yield tail
+        # Data descriptor: CRC et tailles réelles
+        if zip64:
+            yield struct.pack("<IIQQ", 0x08074B50, crc, csize, usize)
+        else:
+            yield struct.pack("<IIII", 0x08074B50, crc, csize, usize)
+        central.append((name, version, flags, method, dos_time, dos_date, crc, csize, usize, offset))
+        offset += len(header) + csize + (24 if zip64 else 16)
+    # Répertoire central
+    cd_start = offset
+    cd_size = 0
+    for name, version, flags, method, dos_time, dos_date, crc, csize, usize, local_offset in central:
+        zip64_fields = []
+        if usize >= _ZIP64_LIMIT or csize >= _ZIP64_LIMIT:
+            zip64_fields += [usize, csize]
+            usize = csize = _ZIP64_LIMIT
+        if local_offset >= _ZIP64_LIMIT:
+            zip64_fields.append(local_offset)
+            local_offset = _ZIP64_LIMIT
+        extra = b""
+        if zip64_fields:
+            version = 45
+            extra = struct.pack("<HH", 0x0001, 8 * len(zip64_fields)) + struct.pack(f"<{len(zip64_fields)}Q", *zip64_fields)
+        record = struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, flags, method,
+                             dos_time, dos_date, crc, csize, usize, len(name), len(extra), 0, 0, 0,
+                             0o100644 << 16, local_offset) + name + extra
+        cd_size += len(record)
+        yield record
+    # Fin de répertoire central (ZIP64 si nécessaire)
+    count = len(central)
+    if count >= 0xFFFF or cd_start >= _ZIP64_LIMIT or cd_size >= _ZIP64_LIMIT:
+        eocd64_offset = cd_start + cd_size
+        yield struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, (3 << 8) | 45, 45, 0, 0, count, count, cd_size, cd_start)
+        yield struct.pack("<IIQI", 0x07064B50, 0, eocd64_offset, 1)
+        yield struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, 0xFFFF, 0xFFFF, _ZIP64_LIMIT, _ZIP64_LIMIT, 0)
+    else:
+        yield struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_start, 0)
@@ -27,10 +27,17 @@ const texts = {
     th_recipients: "Destinataires",
     th_actions: "Actions",
     dist_success: "Distribution effectuée (ID = {id}).",
+    dist_progress: "Distribution #{id} en cours : {done}/{total} copies…",
+    dist_failed: "Échec de la distribution : {error}",
     scan_not_found: "Aucune empreinte détectée.",
     scan_found: "Fuite détectée ! Destinataire : {recipient}, Distribution #{id} du {date}.",
     download_all: "Télécharger tout",
-    download: "Télécharger"
+    download: "Télécharger",
+    filter_button: "Filtrer",
+    export_button: "Exporter (CSV)",
+    more_button: "Afficher plus",
+    filter_recipient: "Destinataire",
+    upload_progress: "Envoi du fichier : {percent} %…"
   },
   "en": {
     title: "Leak Detector – Administration",
@@ -48,10 +55,17 @@ const texts = {
     th_recipients: "Recipients",
     th_actions: "Actions",
     dist_success: "Distribution completed (ID = {id}).",
+    dist_progress: "Distribution #{id} in progress: {done}/{total} copies…",
+    dist_failed: "Distribution failed: {error}",
     scan_not_found: "No fingerprint detected.",
     scan_found: "Leak detected! Recipient: {recipient}, Distribution #{id} on {date}.",
     download_all: "Download All",
-    download: "Download"
+    download: "Download",
+    filter_button: "Filter",
+    export_button: "Export (CSV)",
+    more_button: "Load more",
+    filter_recipient: "Recipient",
+    upload_progress: "Uploading file: {percent}%…"
   }
 };
 
@@ -72,6 +86,10 @@ function setLanguage(lang) {
   document.getElementById("th_date").innerText = t.th_date;
   document.getElementById("th_recipients").innerText = t.th_recipients;
   document.getElementById("th_actions").innerText = t.th_actions;
+  document.getElementById("filter_button").innerText = t.filter_button;
+  document.getElementById("export_button").innerText = t.export_button;
+  document.getElementById("more_button").innerText = t.more_button;
+  document.getElementById("filterRecipient").placeholder = t.filter_recipient;
   // Mémoriser la langue choisie
   localStorage.setItem("lang", lang);
   // Mettre à jour les messages actuels si déjà affichés (optionnel)
@@ -80,6 +98,114 @@ function setLanguage(lang) {
 // Initialiser la langue (par défaut 'fr' ou dernier choix)
 setLanguage(localStorage.getItem("lang") || "fr");
 
+// Uploads reprenables (/api/uploads): au-delà de RESUMABLE_THRESHOLD octets, le fichier est envoyé par morceaux,
+// UPLOAD_PARALLELISM à la fois, chacun avec son SHA-256 et renvoyé en cas d'échec (coupure réseau, serveur surchargé).
+// La session est mémorisée (localStorage): renvoyer le même fichier après une coupure ou un rechargement de la page
+// reprend l'envoi là où il s'était arrêté. Le fichier assemblé est ensuite distribué ou analysé par le serveur.
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+const UPLOAD_PARALLELISM = 4;
+const UPLOAD_MAX_ATTEMPTS = 6;
+
+function authHeaders(extra) {
+  return Object.assign({ "Authorization": "Bearer " + apiToken }, extra || {});
+}
+
+function sleep(ms) {
+  return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+// SHA-256 (hexadécimal) d'un morceau; null si l'API Web Crypto n'est pas disponible (page servie en HTTP simple)
+async function sha256Hex(blob) {
+  if (!window.crypto || !window.crypto.subtle) return null;
+  const digest = await window.crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, "0")).join("");
+}
+
+// Session d'upload du fichier: reprise de la session mémorisée si elle existe encore, sinon création
+async function openUploadSession(file) {
+  const key = "upload:" + [file.name, file.size, file.lastModified].join(":");
+  const saved = localStorage.getItem(key);
+  if (saved) {
+    const response = await fetch(API_BASE + `/api/uploads/${saved}`, { headers: authHeaders() });
+    if (response.ok) return { key: key, session: await response.json() };
+    localStorage.removeItem(key);
+  }
+  const formData = new FormData();
+  formData.append("filename", file.name);
+  formData.append("size", file.size);
+  const response = await fetch(API_BASE + "/api/uploads", { method: "POST", headers: authHeaders(), body: formData });
+  const session = await response.json();
+  if (!response.ok) throw new Error(session.detail || "HTTP " + response.status);
+  localStorage.setItem(key, session.upload_id);
+  return { key: key, session: session };
+}
+
+// Envoi d'un morceau, renvoyé (attente croissante, ou Retry-After du serveur) tant que l'erreur est passagère
+async function putChunk(file, session, index) {
+  const start = index * session.chunk_size;
+  const blob = file.slice(start, Math.min(start + session.chunk_size, session.size));
+  const checksum = await sha256Hex(blob);
+  const headers = authHeaders({ "Content-Type": "application/octet-stream" });
+  if (checksum) headers["X-Chunk-Sha256"] = checksum;
+  for (let attempt = 1; ; attempt++) {
+    let response = null;
+    try {
+      response = await fetch(API_BASE + `/api/uploads/${session.upload_id}/chunks/${index}`,
+                             { method: "PUT", headers: headers, body: blob });
+      if (response.ok) return;
+    } catch (err) {
+      // Coupure réseau: nouvel essai
+    }
+    // Session disparue, morceau hors limites ou trop gros: inutile d'insister
+    const fatal = response && [404, 413, 416].includes(response.status);
+    if (fatal || attempt >= UPLOAD_MAX_ATTEMPTS) {
+      const data = response ? await response.json().catch(() => ({})) : {};
+      throw new Error(data.detail || (response ? "HTTP " + response.status : "réseau indisponible"));
+    }
+    const retryAfter = response && parseInt(response.headers.get("Retry-After"), 10);
+    await sleep(retryAfter ? retryAfter * 1000 : Math.min(30000, 1000 * 2 ** (attempt - 1)));
+  }
+}
+
+// Envoie le fichier par morceaux (en parallèle) puis le finalise: action "distribute" ou "scan", avec ses champs.
+// Renvoie la réponse de la finalisation, identique à celle de /api/distribute ou /api/scan.
+async function resumableUpload(file, action, fields, onProgress) {
+  const { key, session } = await openUploadSession(file);
+  const missing = session.missing_chunks.slice();
+  let done = session.chunk_count - missing.length;
+  onProgress(Math.floor(100 * done / session.chunk_count));
+  async function worker() {
+    while (missing.length) {
+      await putChunk(file, session, missing.shift());
+      done++;
+      onProgress(Math.floor(100 * done / session.chunk_count));
+    }
+  }
+  // Morceau 0 d'abord, seul: le serveur y reconnaît le type du fichier et refuse aussitôt un fichier trop gros
+  if (missing[0] === 0) {
+    await putChunk(file, session, missing.shift());
+    done++;
+    onProgress(Math.floor(100 * done / session.chunk_count));
+  }
+  const workers = [];
+  for (let i = 0; i < Math.min(UPLOAD_PARALLELISM, missing.length); i++) workers.push(worker());
+  await Promise.all(workers);
+  const formData = new FormData();
+  Object.entries(fields).forEach(([name, value]) => formData.append(name, value));
+  const response = await fetch(API_BASE + `/api/uploads/${session.upload_id}/${action}`,
+                               { method: "POST", headers: authHeaders(), body: formData });
+  // Session consommée ou invalide: ne plus tenter de la reprendre (sauf morceau manquant ou serveur surchargé)
+  if (![409, 429].includes(response.status) && response.status < 500) localStorage.removeItem(key);
+  return response.json();
+}
+
+function uploadProgress(elementId) {
+  return percent => {
+    const lang = localStorage.getItem("lang") || "fr";
+    document.getElementById(elementId).innerText = texts[lang].upload_progress.replace("{percent}", percent);
+  };
+}
+
 // Soumission du formulaire de distribution
 document.getElementById("distForm").addEventListener("submit", function(e) {
   e.preventDefault();
@@ -88,23 +214,33 @@ document.getElementById("distForm").addEventListener("submit", function(e) {
   if (!fileInput.files.length) return;
   const file = fileInput.files[0];
   const recipients = recipientsInput.value;
-  const formData = new FormData();
-  formData.append("file", file);
-  formData.append("recipients", recipients);
-  // Appel API distribute
-  fetch(API_BASE + "/api/distribute", {
-    method: "POST",
-    headers: {
-      "Authorization": "Bearer " + apiToken
-    },
-    body: formData
-  })
-    .then(response => response.json())
+  let request;
+  if (file.size > RESUMABLE_THRESHOLD) {
+    // Gros fichier: upload reprenable par morceaux, puis distribution du fichier assemblé
+    request = resumableUpload(file, "distribute", { recipients: recipients }, uploadProgress("dist_status"));
+  } else {
+    const formData = new FormData();
+    formData.append("file", file);
+    formData.append("recipients", recipients);
+    // Appel API distribute
+    request = fetch(API_BASE + "/api/distribute", {
+      method: "POST",
+      headers: {
+        "Authorization": "Bearer " + apiToken
+      },
+      body: formData
+    }).then(response => response.json());
+  }
+  request
     .then(data => {
       const lang = localStorage.getItem("lang") || "fr";
-      if (data.detail && data.distribution_id) {
+      if (data.job_id) {
+        // La distribution est traitée en tâche de fond: suivre son avancement
+        pollJob(data.job_id);
+      } else if (data.distribution_id) {
+        // Copies produites à la demande: la distribution est déjà complète
         document.getElementById("dist_status").innerText = texts[lang].dist_success.replace("{id}", data.distribution_id);
-        loadDistributions();  // rafraîchir la liste
+        loadDistributions();
       } else if (data.detail) {
         document.getElementById("dist_status").innerText = data.detail;
       } else {
@@ -118,22 +254,59 @@ document.getElementById("distForm").addEventListener("submit", function(e) {
     });
 });
 
+// Suivi d'une tâche de distribution asynchrone jusqu'à sa fin
+function pollJob(jobId) {
+  fetch(API_BASE + `/api/jobs/${jobId}`, {
+    headers: {
+      "Authorization": "Bearer " + apiToken
+    }
+  })
+    .then(response => response.json())
+    .then(job => {
+      const lang = localStorage.getItem("lang") || "fr";
+      const status = document.getElementById("dist_status");
+      if (job.status === "done") {
+        status.innerText = texts[lang].dist_success.replace("{id}", job.distribution_id);
+        loadDistributions();  // rafraîchir la liste
+      } else if (job.status === "failed") {
+        status.innerText = texts[lang].dist_failed.replace("{error}", job.error || "");
+      } else if (job.status) {
+        status.innerText = texts[lang].dist_progress
+          .replace("{id}", job.distribution_id)
+          .replace("{done}", job.done)
+          .replace("{total}", job.total);
+        setTimeout(() => pollJob(jobId), 1000);
+      } else {
+        status.innerText = "Error: " + JSON.stringify(job);
+      }
+    })
+    .catch(err => {
+      document.getElementById("dist_status").innerText = "Erreur: " + err;
+    });
+}
+
 // Soumission du formulaire de scan
 document.getElementById("scanForm").addEventListener("submit", function(e) {
   e.preventDefault();
   const scanFileInput = document.getElementById("scanFileInput");
   if (!scanFileInput.files.length) return;
   const file = scanFileInput.files[0];
-  const formData = new FormData();
-  formData.append("file", file);
-  fetch(API_BASE + "/api/scan", {
-    method: "POST",
-    headers: {
-      "Authorization": "Bearer " + apiToken
-    },
-    body: formData
-  })
-    .then(response => response.json())
+  let request;
+  if (file.size > RESUMABLE_THRESHOLD) {
+    // Gros échantillon: upload reprenable par morceaux, puis analyse du fichier assemblé
+    request = resumableUpload(file, "scan", {}, uploadProgress("scan_result"));
+  } else {
+    const formData = new FormData();
+    formData.append("file", file);
+    request = fetch(API_BASE + "/api/scan", {
+      method: "POST",
+      headers: {
+        "Authorization": "Bearer " + apiToken
+      },
+      body: formData
+    }).then(response => response.json());
+  }
+  request
     .then(data => {
       const lang = localStorage.getItem("lang") || "fr";
       if (data.status === "found") {
@@ -153,19 +326,44 @@ document.getElementById("scanForm").addEventListener("submit", function(e) {
     });
 });
 
-// Fonction pour charger la liste des distributions et remplir le tableau
-function loadDistributions() {
-  fetch(API_BASE + "/admin/distributions", {
+// Curseur de la page suivante (null: plus rien à charger)
+let nextCursor = null;
+
+// Paramètres de filtre courants (destinataire, type, période), sous forme de query string
+function filterParams() {
+  const params = new URLSearchParams();
+  const recipient = document.getElementById("filterRecipient").value.trim();
+  const fileType = document.getElementById("filterType").value;
+  const dateFrom = document.getElementById("filterFrom").value;
+  const dateTo = document.getElementById("filterTo").value;
+  if (recipient) params.set("recipient", recipient);
+  if (fileType) params.set("file_type", fileType);
+  if (dateFrom) params.set("date_from", dateFrom + "T00:00:00");
+  if (dateTo) {
+    // Borne de fin exclusive côté API: inclure toute la journée choisie
+    const end = new Date(dateTo + "T00:00:00Z");
+    end.setUTCDate(end.getUTCDate() + 1);
+    params.set("date_to", end.toISOString().slice(0, 19));
+  }
+  return params;
+}
+
+// Fonction pour charger une page de distributions et remplir le tableau
+// (append: ajouter à la suite de la page précédente au lieu de remplacer le contenu)
+function loadDistributions(append) {
+  const params = filterParams();
+  if (append && nextCursor) params.set("cursor", nextCursor);
+  fetch(API_BASE + "/admin/distributions?" + params.toString(), {
     headers: {
       "Authorization": "Bearer " + apiToken
     }
   })
     .then(response => response.json())
-    .then(list => {
+    .then(page => {
       const tbody = document.querySelector("#distTable tbody");
-      tbody.innerHTML = "";
+      if (!append) tbody.innerHTML = "";
       const lang = localStorage.getItem("lang") || "fr";
-      list.forEach(dist => {
+      page.items.forEach(dist => {
         const tr = document.createElement("tr");
         // Colonne ID
         const tdId = document.createElement("td");
@@ -198,12 +396,51 @@ function loadDistributions() {
         tr.appendChild(tdActions);
         tbody.appendChild(tr);
       });
+      nextCursor = page.next_cursor;
+      document.getElementById("more_button").style.display = nextCursor ? "" : "none";
     })
     .catch(err => {
       console.error("Erreur chargement distributions:", err);
     });
 }
 
+// Filtres et pagination de la liste
+document.getElementById("filterForm").addEventListener("submit", function(e) {
+  e.preventDefault();
+  loadDistributions(false);
+});
+document.getElementById("more_button").addEventListener("click", function() {
+  loadDistributions(true);
+});
+
+// Export CSV de toutes les copies correspondant aux filtres
+document.getElementById("export_button").addEventListener("click", function() {
+  const params = filterParams();
+  params.set("format", "csv");
+  fetch(API_BASE + "/admin/distributions/export?" + params.toString(), {
+    headers: {
+      "Authorization": "Bearer " + apiToken
+    }
+  })
+    .then(response => {
+      if (!response.ok) throw new Error("HTTP " + response.status);
+      return response.blob();
+    })
+    .then(blob => {
+      const url = URL.createObjectURL(blob);
+      const a = document.createElement("a");
+      a.href = url;
+      a.download = "distributions.csv";
+      document.body.appendChild(a);
+      a.click();
+      document.body.removeChild(a);
+      URL.revokeObjectURL(url);
+    })
+    .catch(err => {
+      alert("Erreur lors de l'export: " + err);
+    });
+});
+
 // Fonction pour télécharger le ZIP d'une distribution
 function downloadZip(distId) {
   fetch(API_BASE + `/admin/distributions/${distId}/download`, {
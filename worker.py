@@ -0,0 +1,11 @@
+import logging
+
+from services import jobs
+
+# Worker de la file de distribution.
+# Usage: `python worker.py` — lancer autant de processus que souhaité, sur un ou plusieurs hôtes
+# partageant la base Postgres et le stockage des fichiers (OUTPUT_DIR / JOB_SPOOL_DIR).
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    jobs.run_worker()